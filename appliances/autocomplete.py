@@ -0,0 +1,58 @@
+import re
+from bisect import bisect_left
+
+from core.utils.cache import catalog_cache
+from .models import Appliance, Brand
+
+
+def normalize(text):
+    """Case and punctuation insensitive key: "BRW-15 ab" -> "brw15ab"."""
+    return re.sub(r"[\W_]+", "", text).casefold()
+
+
+class PrefixIndex:
+    """Sorted (key, row) pairs answering prefix lookups with a bisect."""
+
+    def __init__(self, entries):
+        entries = sorted(entries, key=lambda entry: entry[0])
+        self.keys = [key for key, row in entries]
+        self.rows = [row for key, row in entries]
+
+    def search(self, prefix, limit):
+        start = bisect_left(self.keys, prefix)
+        end = bisect_left(self.keys, prefix + "\U0010ffff", start)
+        return self.rows[start : min(end, start + limit)]
+
+
+class AutocompleteIndex:
+    """Appliance models, with their brand and category names, and brand
+    names, indexed by normalized prefix. Built once per catalog version."""
+
+    fields = ("id", "model", "brand", "brand_name", "category", "category_name")
+
+    def __init__(self):
+        rows = Appliance.objects.values_list(
+            "pk", "model", "brand_id", "brand__name", "category_id", "category__name"
+        )
+        self.appliances = PrefixIndex(
+            (normalize(row[1]), dict(zip(self.fields, row))) for row in rows
+        )
+        self.brands = PrefixIndex(
+            (normalize(name), {"id": pk, "name": name})
+            for pk, name in Brand.objects.values_list("pk", "name")
+        )
+
+    def search(self, text, limit=10):
+        prefix = normalize(text)
+        if not prefix:
+            return {"appliances": [], "brands": []}
+        return {
+            "appliances": self.appliances.search(prefix, limit),
+            "brands": self.brands.search(prefix, limit),
+        }
+
+
+def autocomplete(text, limit=10):
+    return catalog_cache.get_or_set("autocomplete", AutocompleteIndex).search(
+        text, limit
+    )
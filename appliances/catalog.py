@@ -0,0 +1,117 @@
+import gzip
+from collections import OrderedDict
+from hashlib import sha256
+
+from django.db.models import Prefetch
+from rest_framework.renderers import JSONRenderer
+
+from core.utils.cache import catalog_cache
+from .models import Appliance, Brand, Category, Problem, Solution, Symptom
+from .serializers import (
+    ApplianceSerializer,
+    BrandSerializer,
+    CategorySerializer,
+    ProblemSerializer,
+    SolutionSerializer,
+    SymptomCatalogSerializer,
+)
+
+SECTIONS = {
+    "brands": (Brand, BrandSerializer),
+    "categories": (Category, CategorySerializer),
+    "appliances": (Appliance, ApplianceSerializer),
+    "symptoms": (Symptom, SymptomCatalogSerializer),
+    "problems": (Problem, ProblemSerializer),
+    "solutions": (Solution, SolutionSerializer),
+}
+
+# Snapshots kept per process to answer ?since= with a delta.
+HISTORY_SIZE = 20
+
+
+def render(data):
+    content = JSONRenderer().render(data)
+    return content, gzip.compress(content, mtime=0)
+
+
+def section_rows(model, serializer_class):
+    queryset = model.objects.order_by("pk")
+    for field in model._meta.many_to_many:
+        if field.name in serializer_class.Meta.fields:
+            queryset = queryset.prefetch_related(
+                Prefetch(
+                    field.name,
+                    queryset=field.related_model.objects.only("pk").order_by("pk"),
+                )
+            )
+    return serializer_class(queryset, many=True).data
+
+
+class CatalogSnapshot:
+    """The whole catalog as one document, rendered and gzipped once.
+
+    `hash` is the SHA-256 of the rendered sections, so equal catalogs have
+    equal hashes in every process.
+    """
+
+    def __init__(self, sections):
+        self.rows = {
+            name: {row["id"]: row for row in rows} for name, rows in sections.items()
+        }
+        self.hash = sha256(JSONRenderer().render(sections)).hexdigest()
+        self.content, self.gzipped = render(dict(hash=self.hash, **sections))
+        self.deltas = {}
+
+    @classmethod
+    def build(cls):
+        return cls(
+            {
+                name: section_rows(model, serializer_class)
+                for name, (model, serializer_class) in SECTIONS.items()
+            }
+        )
+
+    def delta(self, since):
+        """Rendered changes from the `since` snapshot: new or modified rows
+        under `changed` and the ids of removed ones under `deleted`."""
+        if since.hash not in self.deltas:
+            changed = {}
+            deleted = {}
+            for name, rows in self.rows.items():
+                previous = since.rows[name]
+                changed[name] = [
+                    row for pk, row in rows.items() if previous.get(pk) != row
+                ]
+                deleted[name] = [pk for pk in previous if pk not in rows]
+            self.deltas[since.hash] = render(
+                {
+                    "hash": self.hash,
+                    "since": since.hash,
+                    "changed": changed,
+                    "deleted": deleted,
+                }
+            )
+        return self.deltas[since.hash]
+
+
+snapshots = OrderedDict()
+
+
+def build_snapshot():
+    snapshot = CatalogSnapshot.build()
+    # An unchanged catalog keeps the snapshot already known, with its deltas.
+    snapshot = snapshots.pop(snapshot.hash, snapshot)
+    snapshots[snapshot.hash] = snapshot
+    while len(snapshots) > HISTORY_SIZE:
+        snapshots.popitem(last=False)
+    return snapshot
+
+
+def current_snapshot():
+    """The snapshot of the current catalog version, built once per version
+    and process."""
+    return catalog_cache.get_or_set("snapshot", build_snapshot)
+
+
+def find_snapshot(hash):
+    return snapshots.get(hash)
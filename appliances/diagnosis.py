@@ -0,0 +1,161 @@
+from collections import defaultdict
+from functools import partial
+
+from django.conf import settings
+from django.db.models import Count
+
+from core.utils.cache import catalog_cache
+from .models import Appliance, Historic, Problem, Solution, Symptom
+
+
+class CatalogGraph:
+    """Adjacency of the catalog: symptom -> categories, symptom -> causes
+    and problem -> solutions, plus the names needed to answer.
+
+    Built once per catalog version, so a diagnosis only walks dicts.
+    """
+
+    def __init__(self):
+        self.categories = defaultdict(set)
+        self.causes = defaultdict(set)
+        self.solutions = defaultdict(set)
+        self.appliance_categories = dict(
+            Appliance.objects.values_list("pk", "category_id")
+        )
+        self.symptoms = set(Symptom.objects.values_list("pk", flat=True))
+        self.problem_names = dict(Problem.objects.values_list("pk", "name"))
+        self.solution_names = dict(Solution.objects.values_list("pk", "name"))
+        for adjacency, through, source, target in (
+            (self.categories, Symptom.categories.through, "symptom", "category"),
+            (self.causes, Symptom.causes.through, "symptom", "problem"),
+            (self.solutions, Problem.solutions.through, "problem", "solution"),
+        ):
+            rows = through.objects.values_list(source + "_id", target + "_id")
+            for key, value in rows:
+                adjacency[key].add(value)
+
+
+class HistoricFrequencies:
+    """How many historics of an organization, per appliance category,
+    recorded each problem and solution, out of the category's historics
+    with an appliance."""
+
+    def __init__(self, org_id):
+        self.org_id = org_id
+        self.totals = dict(
+            Historic.objects.filter(org_id=org_id, appliance__isnull=False)
+            .values("appliance__category_id")
+            .annotate(count=Count("pk"))
+            .values_list("appliance__category_id", "count")
+            .order_by()
+        )
+        self.problems = self.count(Historic.problems.through, "problem_id")
+        self.solutions = self.count(Historic.solutions.through, "solution_id")
+
+    def count(self, through, field):
+        counts = defaultdict(dict)
+        rows = (
+            through.objects.filter(
+                historic__org_id=self.org_id, historic__appliance__isnull=False
+            )
+            .values("historic__appliance__category_id", field)
+            .annotate(count=Count("pk"))
+            .values_list("historic__appliance__category_id", field, "count")
+            .order_by()
+        )
+        for category_id, pk, count in rows:
+            counts[category_id][pk] = count
+        return counts
+
+    def share(self, counts, category_id, pk):
+        total = self.totals.get(category_id)
+        if not total:
+            return 0, 0
+        recorded = counts.get(category_id, {}).get(pk, 0)
+        return recorded, recorded / total
+
+
+def get_graph():
+    return catalog_cache.get_or_set("graph", CatalogGraph)
+
+
+def get_frequencies(org_id):
+    # Historics change all the time and are not part of the catalog
+    # version, so their counts are refreshed on a timer.
+    return catalog_cache.get_or_set(
+        "historic-frequencies:%s" % org_id,
+        partial(HistoricFrequencies, org_id),
+        timeout=getattr(settings, "DIAGNOSIS_FREQUENCIES_TIMEOUT", 10 * 60),
+    )
+
+
+def diagnose(symptoms, category_id, org_id, limit=10):
+    """Ranks the problems caused by the symptoms and their solutions.
+
+    A problem's coverage is the share of the relevant symptoms it causes;
+    symptoms unknown or restricted to other categories are not relevant
+    and come back as `ignored`. The score is the coverage times one plus
+    the share of the category's historics of the organization that
+    recorded the problem, so history breaks ties and at most doubles a
+    score. A solution scores the sum of the scores of the candidate
+    problems it solves, times one plus its own historic share.
+    """
+    graph = get_graph()
+    frequencies = get_frequencies(org_id)
+
+    relevant, ignored = [], []
+    for symptom in dict.fromkeys(symptoms):
+        categories = graph.categories.get(symptom)
+        applies = not categories or category_id in categories
+        if symptom in graph.symptoms and applies:
+            relevant.append(symptom)
+        else:
+            ignored.append(symptom)
+
+    causing = defaultdict(int)
+    for symptom in relevant:
+        for problem in graph.causes.get(symptom, ()):
+            causing[problem] += 1
+
+    problems = []
+    for problem, count in causing.items():
+        coverage = count / len(relevant)
+        recorded, share = frequencies.share(frequencies.problems, category_id, problem)
+        problems.append(
+            {
+                "id": problem,
+                "name": graph.problem_names[problem],
+                "score": coverage * (1 + share),
+                "coverage": coverage,
+                "recorded": recorded,
+            }
+        )
+
+    solving = defaultdict(list)
+    for problem in problems:
+        for solution in graph.solutions.get(problem["id"], ()):
+            solving[solution].append(problem)
+    solutions = []
+    for solution, solved in solving.items():
+        recorded, share = frequencies.share(
+            frequencies.solutions, category_id, solution
+        )
+        solutions.append(
+            {
+                "id": solution,
+                "name": graph.solution_names[solution],
+                "score": sum(problem["score"] for problem in solved) * (1 + share),
+                "recorded": recorded,
+                "problems": sorted(problem["id"] for problem in solved),
+            }
+        )
+
+    def rank(rows):
+        return sorted(rows, key=lambda row: (-row["score"], row["id"]))[:limit]
+
+    return {
+        "category": category_id,
+        "problems": rank(problems),
+        "solutions": rank(solutions),
+        "ignored": ignored,
+    }
@@ -0,0 +1,17 @@
+from django.core.management.base import BaseCommand
+
+from appliances.models import CooccurrenceMatrix
+
+
+class Command(BaseCommand):
+    help = (
+        "Recounts the symptom, problem and solution co-occurrence matrices "
+        "of every appliance category from the completed historics."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--chunk-size", type=int, default=2000)
+
+    def handle(self, *args, chunk_size, **options):
+        count = CooccurrenceMatrix.objects.rebuild(chunk_size=chunk_size)
+        self.stdout.write("Counted %d completed historics." % count)
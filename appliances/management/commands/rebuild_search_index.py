@@ -0,0 +1,17 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from appliances.search import get_search_index
+
+
+class Command(BaseCommand):
+    help = (
+        "Rebuilds the full-text index of the symptoms, problems and solutions "
+        "from the catalog."
+    )
+
+    def handle(self, *args, **options):
+        index = get_search_index()
+        if index is None:
+            raise CommandError("The database backend does not support search.")
+        count = index.rebuild()
+        self.stdout.write("Indexed %d catalog entries." % count)
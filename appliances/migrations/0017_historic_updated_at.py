@@ -0,0 +1,20 @@
+# Generated by Django 4.0.4 on 2026-10-18 09:12
+
+from django.db import migrations, models
+import django.utils.timezone
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('appliances', '0016_historic_org'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='historic',
+            name='updated_at',
+            field=models.DateTimeField(auto_now=True, default=django.utils.timezone.now),
+            preserve_default=False,
+        ),
+    ]
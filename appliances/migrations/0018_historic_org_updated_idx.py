@@ -0,0 +1,17 @@
+# Generated by Django 4.0.4 on 2026-10-18 10:05
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('appliances', '0017_historic_updated_at'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='historic',
+            index=models.Index(fields=['org', 'updated_at'], name='historic_org_updated_idx'),
+        ),
+    ]
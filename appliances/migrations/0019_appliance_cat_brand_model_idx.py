@@ -0,0 +1,17 @@
+# Generated by Django 4.0.4 on 2026-10-18 15:20
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('appliances', '0018_historic_org_updated_idx'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='appliance',
+            index=models.Index(fields=['category', 'brand', 'model'], name='appliance_cat_brand_model_idx'),
+        ),
+    ]
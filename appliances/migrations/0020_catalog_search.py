@@ -0,0 +1,58 @@
+# Generated by Django 4.0.4 on 2026-10-18 16:02
+
+from django.db import migrations
+
+# The table as it stood when it was added, and the rows of the catalog at
+# that point, in SQL so later changes to appliances.search do not change
+# this migration. SQLite row ids are pk * 3 + the position of the kind in
+# ("symptom", "problem", "solution").
+CREATE_SQL = {
+    'sqlite': [
+        "CREATE VIRTUAL TABLE appliances_catalog_search USING fts5("
+        "name, description, tokenize = 'unicode61 remove_diacritics 2')",
+        "INSERT INTO appliances_catalog_search (rowid, name, description) "
+        "SELECT id * 3, name, description FROM appliances_symptom",
+        "INSERT INTO appliances_catalog_search (rowid, name, description) "
+        "SELECT id * 3 + 1, name, description FROM appliances_problem",
+        "INSERT INTO appliances_catalog_search (rowid, name, description) "
+        "SELECT id * 3 + 2, name, description FROM appliances_solution",
+    ],
+    'postgresql': [
+        "CREATE TABLE appliances_catalog_search ("
+        "kind varchar(10) NOT NULL, object_id integer NOT NULL, "
+        "name varchar(40) NOT NULL, description varchar(150) NOT NULL, "
+        "document tsvector NOT NULL, PRIMARY KEY (kind, object_id))",
+        "CREATE INDEX appliances_catalog_search_idx "
+        "ON appliances_catalog_search USING GIN (document)",
+    ]
+    + [
+        "INSERT INTO appliances_catalog_search "
+        "(kind, object_id, name, description, document) "
+        "SELECT '%s', id, name, description, "
+        "setweight(to_tsvector('simple', name), 'A') || "
+        "setweight(to_tsvector('simple', description), 'B') "
+        "FROM appliances_%s" % (kind, kind)
+        for kind in ('symptom', 'problem', 'solution')
+    ],
+}
+
+
+def create_search_index(apps, schema_editor):
+    for sql in CREATE_SQL.get(schema_editor.connection.vendor, []):
+        schema_editor.execute(sql)
+
+
+def drop_search_index(apps, schema_editor):
+    if schema_editor.connection.vendor in CREATE_SQL:
+        schema_editor.execute("DROP TABLE appliances_catalog_search")
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('appliances', '0019_appliance_cat_brand_model_idx'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_search_index, drop_search_index),
+    ]
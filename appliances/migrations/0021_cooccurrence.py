@@ -0,0 +1,37 @@
+# Generated by Django 4.0.4 on 2026-10-18 17:40
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('appliances', '0020_catalog_search'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='CountedHistoric',
+            fields=[
+                ('historic_id', models.IntegerField(primary_key=True, serialize=False)),
+                ('category_id', models.IntegerField()),
+                ('symptoms', models.JSONField(default=list)),
+                ('problems', models.JSONField(default=list)),
+                ('solutions', models.JSONField(default=list)),
+            ],
+        ),
+        migrations.CreateModel(
+            name='CooccurrenceMatrix',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('relation', models.CharField(choices=[('symptom_problem', 'symptom_problem'), ('symptom_solution', 'symptom_solution'), ('problem_solution', 'problem_solution')], max_length=20)),
+                ('data', models.BinaryField(default=b'')),
+                ('category', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='appliances.category')),
+            ],
+        ),
+        migrations.AddConstraint(
+            model_name='cooccurrencematrix',
+            constraint=models.UniqueConstraint(fields=('category', 'relation'), name='unique_cooccurrence_matrix'),
+        ),
+    ]
@@ -0,0 +1,43 @@
+# Generated by Django 4.0.4 on 2026-10-18 20:10
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+def clear_counts(apps, schema_editor):
+    # The counts mixed every organization's historics; build_cooccurrence
+    # recounts them per organization.
+    apps.get_model("appliances", "CooccurrenceMatrix").objects.all().delete()
+    apps.get_model("appliances", "CountedHistoric").objects.all().delete()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('profiles', '0013_customer_org_scoped_indexes'),
+        ('appliances', '0021_cooccurrence'),
+    ]
+
+    operations = [
+        migrations.RunPython(clear_counts, migrations.RunPython.noop),
+        migrations.RemoveConstraint(
+            model_name='cooccurrencematrix',
+            name='unique_cooccurrence_matrix',
+        ),
+        migrations.AddField(
+            model_name='countedhistoric',
+            name='org_id',
+            field=models.IntegerField(default=0),
+            preserve_default=False,
+        ),
+        migrations.AddField(
+            model_name='cooccurrencematrix',
+            name='org',
+            field=models.ForeignKey(default=None, on_delete=django.db.models.deletion.CASCADE, to='profiles.organization'),
+            preserve_default=False,
+        ),
+        migrations.AddConstraint(
+            model_name='cooccurrencematrix',
+            constraint=models.UniqueConstraint(fields=('org', 'category', 'relation'), name='unique_cooccurrence_matrix'),
+        ),
+    ]
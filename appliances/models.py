@@ -1,5 +1,13 @@
-from django.db import models
+from functools import partial
+
+from django.db import models, transaction
+from django.db.models.signals import m2m_changed, post_delete, post_save, pre_delete
+from django.dispatch import receiver
+from django.utils import timezone
+from core.utils.cache import catalog_cache
+from core.utils.sparse import SparseCounts
 from profiles.models import Organization
+from .search import get_search_index
 
 # Create your models here.
 
@@ -26,6 +34,14 @@ class Appliance(models.Model):
     brand = models.ForeignKey(Brand, on_delete=models.CASCADE)
     category = models.ForeignKey(Category, on_delete=models.CASCADE)
 
+    class Meta:
+        indexes = [
+            models.Index(
+                fields=["category", "brand", "model"],
+                name="appliance_cat_brand_model_idx",
+            ),
+        ]
+
     def __str__(self) -> str:
         return self.model
 
@@ -66,3 +82,319 @@ class Historic(models.Model):
         Appliance, on_delete=models.CASCADE, blank=True, null=True
     )
     org = models.ForeignKey(Organization, on_delete=models.CASCADE, null=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=["org", "updated_at"], name="historic_org_updated_idx"),
+        ]
+
+
+class CountedHistoric(models.Model):
+    """What a completed historic added to the co-occurrence matrices, so
+    the same counts can be taken out again when it changes."""
+
+    historic_id = models.IntegerField(primary_key=True)
+    org_id = models.IntegerField()
+    category_id = models.IntegerField()
+    symptoms = models.JSONField(default=list)
+    problems = models.JSONField(default=list)
+    solutions = models.JSONField(default=list)
+
+    def state(self):
+        return (
+            self.org_id,
+            self.category_id,
+            self.symptoms,
+            self.problems,
+            self.solutions,
+        )
+
+
+class CooccurrenceMatrixManager(models.Manager):
+    STATE_FIELDS = ("org_id", "category_id", "symptoms", "problems", "solutions")
+
+    def historic_states(self, historics):
+        """{historic id: (org id, category id, symptom, problem and solution
+        ids)} of the completed historics of an organization with an
+        appliance among `historics`."""
+        states = {
+            pk: (org_id, category_id, [], [], [])
+            for pk, org_id, category_id in historics.filter(
+                completed=True, appliance__isnull=False, org__isnull=False
+            ).values_list("pk", "org_id", "appliance__category_id")
+        }
+        for index, name in enumerate(("symptoms", "problems", "solutions"), 2):
+            through = getattr(Historic, name).through
+            target = through._meta.get_field(name[:-1]).attname
+            rows = through.objects.filter(historic_id__in=list(states))
+            for pk, value in rows.values_list("historic_id", target).order_by(
+                "historic_id", target
+            ):
+                states[pk][index].append(value)
+        return states
+
+    def add(self, matrices, state, sign=1):
+        org_id, category_id, symptoms, problems, solutions = state
+        lists = {"symptom": symptoms, "problem": problems, "solution": solutions}
+        for relation, (rows, cols) in CooccurrenceMatrix.RELATIONS.items():
+            key = (org_id, category_id, relation)
+            if key not in matrices:
+                matrices[key] = SparseCounts()
+            matrices[key].add(lists[rows], lists[cols], sign)
+
+    def apply(self, matrices):
+        """Adds the (org id, category id, relation) deltas to the stored
+        matrices."""
+        # Counts taken out of a deleted organization or category have no
+        # matrix left to go to, and one can not be created for them.
+        org_ids = set(
+            Organization.objects.filter(
+                pk__in={key[0] for key in matrices}
+            ).values_list("pk", flat=True)
+        )
+        category_ids = set(
+            Category.objects.filter(pk__in={key[1] for key in matrices}).values_list(
+                "pk", flat=True
+            )
+        )
+        matrices = {
+            key: delta
+            for key, delta in matrices.items()
+            if key[0] in org_ids and key[1] in category_ids
+        }
+        if not matrices:
+            return
+        # Missing matrices are created empty first, ignoring the ones a
+        # concurrent sync creates, so that every one of them can be locked.
+        self.bulk_create(
+            [
+                CooccurrenceMatrix(
+                    org_id=org_id, category_id=category_id, relation=relation
+                )
+                for org_id, category_id, relation in matrices
+            ],
+            ignore_conflicts=True,
+        )
+        stored = {
+            (matrix.org_id, matrix.category_id, matrix.relation): matrix
+            for matrix in self.select_for_update().filter(
+                org_id__in={key[0] for key in matrices},
+                category_id__in={key[1] for key in matrices},
+            )
+        }
+        for key, delta in matrices.items():
+            matrix = stored[key]
+            counts = SparseCounts.from_bytes(matrix.data)
+            for row, total in delta.totals.items():
+                counts.totals[row] += total
+                counts.cells[row].update(delta.cells[row])
+            matrix.data = counts.to_bytes()
+            matrix.save(update_fields=["data"])
+
+    def sync_historic(self, historic_id):
+        """Brings the matrices in line with the current state of a historic:
+        takes out what it added before and adds what it holds now."""
+        with transaction.atomic():
+            counted = (
+                CountedHistoric.objects.select_for_update()
+                .filter(historic_id=historic_id)
+                .first()
+            )
+            state = self.historic_states(Historic.objects.filter(pk=historic_id))
+            state = state.get(historic_id)
+            previous = counted.state() if counted else None
+            if state == previous:
+                return
+            matrices = {}
+            if previous:
+                self.add(matrices, previous, sign=-1)
+            if state:
+                self.add(matrices, state)
+            self.apply(matrices)
+            if state:
+                CountedHistoric.objects.update_or_create(
+                    historic_id=historic_id,
+                    defaults=dict(zip(self.STATE_FIELDS, state)),
+                )
+            elif counted:
+                counted.delete()
+
+    def rebuild(self, chunk_size=2000):
+        """Recounts every completed historic, chunk by chunk, and returns the
+        number of historics counted."""
+        matrices = {}
+        counted = []
+        historics = Historic.objects.filter(
+            completed=True, appliance__isnull=False, org__isnull=False
+        )
+        pks = list(historics.order_by("pk").values_list("pk", flat=True))
+        for start in range(0, len(pks), chunk_size):
+            chunk = pks[start : start + chunk_size]
+            for pk, state in self.historic_states(
+                Historic.objects.filter(pk__in=chunk)
+            ).items():
+                self.add(matrices, state)
+                counted.append(
+                    CountedHistoric(
+                        historic_id=pk, **dict(zip(self.STATE_FIELDS, state))
+                    )
+                )
+        with transaction.atomic():
+            self.all().delete()
+            CountedHistoric.objects.all().delete()
+            self.bulk_create(
+                [
+                    CooccurrenceMatrix(
+                        org_id=org_id,
+                        category_id=category_id,
+                        relation=relation,
+                        data=counts.to_bytes(),
+                    )
+                    for (org_id, category_id, relation), counts in matrices.items()
+                ]
+            )
+            CountedHistoric.objects.bulk_create(counted, batch_size=chunk_size)
+        return len(counted)
+
+    def top(self, org_id, category_id, kind, pk, k=10):
+        """{target kind: (occurrences of the row, [(target id, count)])} of
+        every relation starting at `kind`, in an organization's historics."""
+        relations = [
+            relation
+            for relation, (rows, cols) in CooccurrenceMatrix.RELATIONS.items()
+            if rows == kind
+        ]
+        stored = dict(
+            self.filter(
+                org_id=org_id, category_id=category_id, relation__in=relations
+            ).values_list("relation", "data")
+        )
+        return {
+            CooccurrenceMatrix.RELATIONS[relation][1]: SparseCounts.top(
+                stored.get(relation, b""), pk, k
+            )
+            for relation in relations
+        }
+
+
+class CooccurrenceMatrix(models.Model):
+    """How often, among an organization's completed historics of an
+    appliance category, each symptom or problem was recorded together with
+    each problem or solution, as a SparseCounts blob per relation.
+
+    Kept up to date when historics change, through CountedHistoric;
+    build_cooccurrence recounts everything.
+    """
+
+    RELATIONS = {
+        "symptom_problem": ("symptom", "problem"),
+        "symptom_solution": ("symptom", "solution"),
+        "problem_solution": ("problem", "solution"),
+    }
+
+    org = models.ForeignKey(Organization, on_delete=models.CASCADE)
+    category = models.ForeignKey(Category, on_delete=models.CASCADE)
+    relation = models.CharField(
+        max_length=20, choices=[(relation, relation) for relation in RELATIONS]
+    )
+    data = models.BinaryField(default=b"")
+
+    objects = CooccurrenceMatrixManager()
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=["org", "category", "relation"],
+                name="unique_cooccurrence_matrix",
+            )
+        ]
+
+
+@receiver(m2m_changed, sender=Historic.symptoms.through)
+@receiver(m2m_changed, sender=Historic.problems.through)
+@receiver(m2m_changed, sender=Historic.solutions.through)
+def touch_historic_relations(sender, instance, action, reverse, pk_set, **kwargs):
+    if action not in ("post_add", "post_remove", "pre_clear"):
+        return
+    if not reverse:
+        historics = Historic.objects.filter(pk=instance.pk)
+    elif pk_set:
+        historics = Historic.objects.filter(pk__in=pk_set)
+    else:
+        links = sender.objects.filter(**{instance._meta.model_name: instance})
+        historics = Historic.objects.filter(pk__in=links.values("historic_id"))
+    historics.update(updated_at=timezone.now())
+
+
+@receiver([post_save, post_delete], sender=Brand)
+@receiver([post_save, post_delete], sender=Category)
+@receiver([post_save, post_delete], sender=Appliance)
+@receiver([post_save, post_delete], sender=Solution)
+@receiver([post_save, post_delete], sender=Problem)
+@receiver([post_save, post_delete], sender=Symptom)
+def invalidate_catalog(sender, **kwargs):
+    catalog_cache.invalidate()
+
+
+@receiver(m2m_changed, sender=Problem.solutions.through)
+@receiver(m2m_changed, sender=Symptom.categories.through)
+@receiver(m2m_changed, sender=Symptom.causes.through)
+def invalidate_catalog_relations(sender, action, **kwargs):
+    if action in ("post_add", "post_remove", "post_clear"):
+        catalog_cache.invalidate()
+
+
+@receiver(post_save, sender=Symptom)
+@receiver(post_save, sender=Problem)
+@receiver(post_save, sender=Solution)
+def index_catalog_entry(sender, instance, **kwargs):
+    index = get_search_index()
+    if index is not None:
+        index.update(instance)
+
+
+@receiver(post_delete, sender=Symptom)
+@receiver(post_delete, sender=Problem)
+@receiver(post_delete, sender=Solution)
+def unindex_catalog_entry(sender, instance, **kwargs):
+    index = get_search_index()
+    if index is not None:
+        index.remove(instance)
+
+
+def sync_cooccurrence_on_commit(historic_ids):
+    for historic_id in historic_ids:
+        transaction.on_commit(
+            partial(CooccurrenceMatrix.objects.sync_historic, historic_id)
+        )
+
+
+@receiver([post_save, post_delete], sender=Historic)
+def count_historic(sender, instance, **kwargs):
+    # On commit, once the relations saved after the historic are in place.
+    sync_cooccurrence_on_commit([instance.pk])
+
+
+@receiver(pre_delete, sender=Organization)
+@receiver(pre_delete, sender=Category)
+def forget_counted_historics(sender, instance, **kwargs):
+    # Their matrices go with the cascade, so there is nothing left to take
+    # the counts out of once the historics are synced.
+    field = "org_id" if sender is Organization else "category_id"
+    CountedHistoric.objects.filter(**{field: instance.pk}).delete()
+
+
+@receiver(m2m_changed, sender=Historic.symptoms.through)
+@receiver(m2m_changed, sender=Historic.problems.through)
+@receiver(m2m_changed, sender=Historic.solutions.through)
+def count_historic_relations(sender, instance, action, reverse, pk_set, **kwargs):
+    if action not in ("post_add", "post_remove", "pre_clear"):
+        return
+    if not reverse:
+        sync_cooccurrence_on_commit([instance.pk])
+    elif pk_set:
+        sync_cooccurrence_on_commit(pk_set)
+    else:
+        links = sender.objects.filter(**{instance._meta.model_name: instance})
+        sync_cooccurrence_on_commit(list(links.values_list("historic_id", flat=True)))
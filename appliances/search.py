@@ -0,0 +1,201 @@
+import re
+
+from django.apps import apps
+from django.db import connection
+
+# Searchable catalog models, by model name. Their position is part of the
+# SQLite row ids, so new kinds go at the end.
+KINDS = ("symptom", "problem", "solution")
+
+
+# Shorter prefixes match too much of the catalog to rank it quickly.
+MIN_PREFIX = 3
+
+
+def get_terms(text):
+    return re.findall(r"\w+", text.lower())
+
+
+def is_prefix(terms, index):
+    """Only the last term, the one still being typed, matches as a prefix."""
+    return index == len(terms) - 1 and len(terms[index]) >= MIN_PREFIX
+
+
+class SearchIndex:
+    """Ranked full-text index over the name and description of the
+    symptoms, problems and solutions, in a table of its own.
+
+    update() and remove() are called by the model signals and rebuild()
+    by the rebuild_search_index command. Any query term is enough, so "no
+    cooling, compressor clicks" finds "Compressor not starting"; entries
+    matching more terms, and in the name rather than the description,
+    rank first.
+    """
+
+    # Created by migration 0020 for the backends in BACKENDS.
+    table = "appliances_catalog_search"
+
+    def rows(self, kind, queryset=None):
+        if queryset is None:
+            queryset = apps.get_model("appliances", kind).objects.all()
+        for pk, name, description in queryset.values_list(
+            "pk", "name", "description"
+        ).iterator():
+            yield kind, pk, name, description
+
+    def update(self, instance):
+        kind = instance._meta.model_name
+        with connection.cursor() as cursor:
+            self.write(
+                cursor,
+                [(kind, instance.pk, instance.name, instance.description)],
+            )
+
+    def remove(self, instance):
+        with connection.cursor() as cursor:
+            self.delete(cursor, instance._meta.model_name, instance.pk)
+
+    def rebuild(self):
+        """Refills the index from the catalog and returns the entry count."""
+        count = 0
+        with connection.cursor() as cursor:
+            cursor.execute("DELETE FROM %s" % self.table)
+            for kind in KINDS:
+                rows = list(self.rows(kind))
+                self.write(cursor, rows, replace=False)
+                count += len(rows)
+        return count
+
+    def search(self, text, kinds=KINDS, limit=20):
+        """Returns up to `limit` {kind, id, name, description, score} dicts,
+        best first; a higher score is a better match."""
+        terms = get_terms(text)
+        if not terms:
+            return []
+        with connection.cursor() as cursor:
+            cursor.execute(*self.search_sql(terms, kinds, limit))
+            return [self.result(row) for row in cursor.fetchall()]
+
+
+class SQLiteSearchIndex(SearchIndex):
+    """FTS5 table. The row id encodes the kind and primary key, so an
+    entry is replaced or removed through the row id index."""
+
+    # Matches in the name weigh twice those in the description.
+    rank_sql = "bm25(appliances_catalog_search, 2.0, 1.0)"
+
+    @staticmethod
+    def rowid(kind, pk):
+        return pk * len(KINDS) + KINDS.index(kind)
+
+    def write(self, cursor, rows, replace=True):
+        if replace:
+            for kind, pk, name, description in rows:
+                self.delete(cursor, kind, pk)
+        cursor.executemany(
+            "INSERT INTO %s (rowid, name, description) VALUES (%%s, %%s, %%s)"
+            % self.table,
+            [
+                (self.rowid(kind, pk), name, description)
+                for kind, pk, name, description in rows
+            ],
+        )
+
+    def delete(self, cursor, kind, pk):
+        cursor.execute(
+            "DELETE FROM %s WHERE rowid = %%s" % self.table, [self.rowid(kind, pk)]
+        )
+
+    def search_sql(self, terms, kinds, limit):
+        sql = (
+            "SELECT rowid, name, description, -{rank} FROM {table} "
+            "WHERE {table} MATCH %s"
+        ).format(rank=self.rank_sql, table=self.table)
+        params = [
+            " OR ".join(
+                ('"%s"*' if is_prefix(terms, index) else '"%s"') % term
+                for index, term in enumerate(terms)
+            )
+        ]
+        if set(kinds) != set(KINDS):
+            sql += " AND rowid %% %d IN (%s)" % (
+                len(KINDS),
+                ", ".join("%s" for kind in kinds),
+            )
+            params += [KINDS.index(kind) for kind in kinds]
+        sql += " ORDER BY %s LIMIT %%s" % self.rank_sql
+        return sql, params + [limit]
+
+    def result(self, row):
+        rowid, name, description, score = row
+        pk, kind = divmod(rowid, len(KINDS))
+        return {
+            "kind": KINDS[kind],
+            "id": pk,
+            "name": name,
+            "description": description,
+            "score": score,
+        }
+
+
+class PostgreSQLSearchIndex(SearchIndex):
+    """tsvector column with a GIN index, name weighted A and description B.
+    The `simple` configuration does not stem, like the FTS5 tokenizer."""
+
+    def write(self, cursor, rows, replace=True):
+        cursor.executemany(
+            "INSERT INTO %s (kind, object_id, name, description, document) "
+            "VALUES (%%s, %%s, %%s, %%s, "
+            "setweight(to_tsvector('simple', %%s), 'A') || "
+            "setweight(to_tsvector('simple', %%s), 'B')) "
+            "ON CONFLICT (kind, object_id) DO UPDATE SET name = EXCLUDED.name, "
+            "description = EXCLUDED.description, document = EXCLUDED.document"
+            % self.table,
+            [
+                (kind, pk, name, description, name, description)
+                for kind, pk, name, description in rows
+            ],
+        )
+
+    def delete(self, cursor, kind, pk):
+        cursor.execute(
+            "DELETE FROM %s WHERE kind = %%s AND object_id = %%s" % self.table,
+            [kind, pk],
+        )
+
+    def search_sql(self, terms, kinds, limit):
+        sql = (
+            "SELECT kind, object_id, name, description, ts_rank(document, query) "
+            "FROM %s, to_tsquery('simple', %%s) query WHERE document @@ query"
+            % self.table
+        )
+        params = [
+            " | ".join(
+                ("%s:*" if is_prefix(terms, index) else "%s") % term
+                for index, term in enumerate(terms)
+            )
+        ]
+        if set(kinds) != set(KINDS):
+            sql += " AND kind IN (%s)" % ", ".join("%s" for kind in kinds)
+            params += list(kinds)
+        sql += " ORDER BY 5 DESC LIMIT %s"
+        return sql, params + [limit]
+
+    def result(self, row):
+        kind, pk, name, description, score = row
+        return {
+            "kind": kind,
+            "id": pk,
+            "name": name,
+            "description": description,
+            "score": score,
+        }
+
+
+BACKENDS = {"sqlite": SQLiteSearchIndex, "postgresql": PostgreSQLSearchIndex}
+
+
+def get_search_index(vendor=None):
+    """The index of the database backend, None where search is unsupported."""
+    backend = BACKENDS.get(vendor or connection.vendor)
+    return backend() if backend else None
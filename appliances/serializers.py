@@ -1,6 +1,23 @@
 from pyexpat import model
 from rest_framework import serializers
+from core.utils.sideload import Sideloader
 from .models import Appliance, Brand, Category, Historic, Problem, Solution, Symptom
+from .autocomplete import normalize
+from .diagnosis import get_graph
+from .search import KINDS, get_terms
+
+
+class ManyToManyIdsMixin:
+    """Serializers listing many-to-many relations as primary keys.
+
+    setup_eager_loading() prefetches the ids of every many-to-many field in
+    Meta.fields, so a list costs one query per relation instead of one per
+    row and relation.
+    """
+
+    @classmethod
+    def setup_eager_loading(cls, queryset):
+        return Sideloader.prefetch_ids(queryset, cls.Meta.fields)
 
 
 class BrandSerializer(serializers.ModelSerializer):
@@ -21,25 +38,116 @@ class ApplianceSerializer(serializers.ModelSerializer):
         fields = ["id", "model", "brand", "category"]
 
 
+class ApplianceNamedSerializer(ApplianceSerializer):
+    brand_name = serializers.CharField(source="brand.name", read_only=True)
+    category_name = serializers.CharField(source="category.name", read_only=True)
+
+    class Meta(ApplianceSerializer.Meta):
+        fields = ApplianceSerializer.Meta.fields + ["brand_name", "category_name"]
+
+    @classmethod
+    def setup_eager_loading(cls, queryset):
+        return queryset.select_related("brand", "category")
+
+
+class ApplianceFilterSerializer(serializers.Serializer):
+    brand = serializers.IntegerField(required=False)
+    category = serializers.IntegerField(required=False)
+    q = serializers.CharField(required=False, max_length=20)
+    names = serializers.BooleanField(required=False)
+
+
+class CatalogSearchQuerySerializer(serializers.Serializer):
+    q = serializers.CharField(max_length=200)
+    kind = serializers.ListField(
+        child=serializers.ChoiceField(choices=KINDS),
+        required=False,
+        allow_empty=False,
+    )
+    limit = serializers.IntegerField(
+        required=False, default=20, min_value=1, max_value=100
+    )
+
+    def validate_q(self, value):
+        if not get_terms(value):
+            raise serializers.ValidationError("Must contain a word.")
+        return value
+
+
+class AutocompleteQuerySerializer(serializers.Serializer):
+    q = serializers.CharField(max_length=50)
+    limit = serializers.IntegerField(
+        required=False, default=10, min_value=1, max_value=50
+    )
+
+    def validate_q(self, value):
+        if not normalize(value):
+            raise serializers.ValidationError("Must contain a letter or digit.")
+        return value
+
+
+class DiagnosisQuerySerializer(serializers.Serializer):
+    symptom = serializers.ListField(
+        child=serializers.IntegerField(), allow_empty=False, max_length=50
+    )
+    appliance = serializers.IntegerField(required=False)
+    category = serializers.IntegerField(required=False)
+    limit = serializers.IntegerField(
+        required=False, default=10, min_value=1, max_value=50
+    )
+
+    def validate(self, attrs):
+        if ("appliance" in attrs) == ("category" in attrs):
+            raise serializers.ValidationError(
+                "Give either an appliance or a category."
+            )
+        if "appliance" in attrs:
+            category = get_graph().appliance_categories.get(attrs["appliance"])
+            if category is None:
+                raise serializers.ValidationError(
+                    {"appliance": ["Unknown appliance."]}
+                )
+            attrs["category"] = category
+        return attrs
+
+
+class AssociationQuerySerializer(serializers.Serializer):
+    symptom = serializers.IntegerField(required=False)
+    problem = serializers.IntegerField(required=False)
+    category = serializers.IntegerField()
+    k = serializers.IntegerField(required=False, default=10, min_value=1, max_value=100)
+
+    def validate(self, attrs):
+        if ("symptom" in attrs) == ("problem" in attrs):
+            raise serializers.ValidationError("Give either a symptom or a problem.")
+        return attrs
+
+
 class SolutionSerializer(serializers.ModelSerializer):
     class Meta:
         model = Solution
         fields = ["id", "name", "description"]
 
 
-class ProblemSerializer(serializers.ModelSerializer):
+class ProblemSerializer(ManyToManyIdsMixin, serializers.ModelSerializer):
     class Meta:
         model = Problem
         fields = ["id", "name", "description", "solutions"]
 
 
-class SymptomSerializer(serializers.ModelSerializer):
+class SymptomSerializer(ManyToManyIdsMixin, serializers.ModelSerializer):
     class Meta:
         model = Symptom
         fields = ["id", "name", "description", "causes"]
 
 
-class HistoricSerializer(serializers.ModelSerializer):
+class SymptomCatalogSerializer(ManyToManyIdsMixin, serializers.ModelSerializer):
+    class Meta:
+        model = Symptom
+        fields = ["id", "name", "description", "categories", "causes"]
+
+
+class HistoricSerializer(ManyToManyIdsMixin, serializers.ModelSerializer):
     class Meta:
         model = Historic
         fields = ["id", "appliance", "symptoms", "problems", "solutions", "org", "completed"]
@@ -1,6 +1,8 @@
 from unicodedata import category
 from django.test import TestCase
 from appliances.models import (
+    CooccurrenceMatrix,
+    CountedHistoric,
     Brand,
     Category,
     Appliance,
@@ -10,6 +12,7 @@ from appliances.models import (
     Historic,
 )
 from profiles.models import Organization
+from profiles.tests.factories import OrganizationFactory
 from .factories import (
     ApplianceFactory,
     BrandFactory,
@@ -405,3 +408,115 @@ class ApplianceHistoricTest(TestCase):
         historic = HistoricFactory()
         newOrgCount = Organization.objects.all().count()
         self.assertEqual(newOrgCount, orgCount + 1)
+
+
+class CooccurrenceMatrixTest(TestCase):
+    def setUp(self):
+        self.org = OrganizationFactory()
+        self.appliance = ApplianceFactory()
+        self.category = self.appliance.category
+        self.warm, self.noise = SymptomFactory(), SymptomFactory()
+        self.leak, self.relay = ProblemFactory(), ProblemFactory()
+        self.gas = SolutionFactory()
+
+    def create(self, **kwargs):
+        kwargs.setdefault("org", self.org)
+        with self.captureOnCommitCallbacks(execute=True):
+            return HistoricFactory(appliance=self.appliance, **kwargs)
+
+    def top(self, kind, pk):
+        return CooccurrenceMatrix.objects.top(self.org.id, self.category.id, kind, pk)
+
+    def test_completed_historics_are_counted(self):
+        self.create(
+            completed=True,
+            symptoms=[self.warm, self.noise],
+            problems=[self.leak],
+            solutions=[self.gas],
+        )
+        self.create(completed=True, symptoms=[self.warm], problems=[self.relay])
+        self.create(symptoms=[self.warm], problems=[self.relay])
+
+        self.assertEqual(
+            self.top("symptom", self.warm.id),
+            {
+                "problem": (2, [(self.leak.id, 1), (self.relay.id, 1)]),
+                "solution": (2, [(self.gas.id, 1)]),
+            },
+        )
+        self.assertEqual(
+            self.top("problem", self.leak.id), {"solution": (1, [(self.gas.id, 1)])}
+        )
+
+    def test_marking_completed_and_changing_relations(self):
+        historic = self.create(symptoms=[self.warm], problems=[self.leak])
+        self.assertEqual(self.top("symptom", self.warm.id)["problem"], (0, []))
+
+        with self.captureOnCommitCallbacks(execute=True):
+            historic.completed = True
+            historic.save()
+        self.assertEqual(
+            self.top("symptom", self.warm.id)["problem"], (1, [(self.leak.id, 1)])
+        )
+
+        with self.captureOnCommitCallbacks(execute=True):
+            historic.problems.set([self.relay])
+        self.assertEqual(
+            self.top("symptom", self.warm.id)["problem"], (1, [(self.relay.id, 1)])
+        )
+
+        with self.captureOnCommitCallbacks(execute=True):
+            historic.delete()
+        self.assertEqual(self.top("symptom", self.warm.id)["problem"], (0, []))
+        self.assertFalse(CountedHistoric.objects.exists())
+
+    def test_deleting_the_organization(self):
+        self.create(completed=True, symptoms=[self.warm])
+        with self.captureOnCommitCallbacks(execute=True):
+            self.org.delete()
+
+        self.assertFalse(CountedHistoric.objects.exists())
+        self.assertFalse(CooccurrenceMatrix.objects.exists())
+
+    def test_deleting_the_category(self):
+        self.create(completed=True, symptoms=[self.warm])
+        with self.captureOnCommitCallbacks(execute=True):
+            self.category.delete()
+
+        self.assertFalse(CountedHistoric.objects.exists())
+        self.assertFalse(CooccurrenceMatrix.objects.exists())
+
+    def test_counts_of_a_deleted_organization_are_dropped(self):
+        historic = self.create(completed=True, symptoms=[self.warm])
+        matrices = {}
+        CooccurrenceMatrix.objects.add(
+            matrices, CountedHistoric.objects.get(pk=historic.pk).state(), sign=-1
+        )
+        self.org.delete()
+
+        CooccurrenceMatrix.objects.apply(matrices)
+        self.assertFalse(CooccurrenceMatrix.objects.exists())
+
+    def test_rebuild_matches_incremental_counts(self):
+        for i in range(3):
+            self.create(
+                completed=True, symptoms=[self.warm], problems=[self.leak, self.relay]
+            )
+        incremental = self.top("symptom", self.warm.id)
+
+        self.assertEqual(CooccurrenceMatrix.objects.rebuild(chunk_size=2), 3)
+        self.assertEqual(self.top("symptom", self.warm.id), incremental)
+        self.assertEqual(CountedHistoric.objects.count(), 3)
+
+    def test_organizations_are_counted_apart(self):
+        self.create(completed=True, symptoms=[self.warm], problems=[self.leak])
+        self.create(
+            org=OrganizationFactory(),
+            completed=True,
+            symptoms=[self.warm],
+            problems=[self.relay],
+        )
+
+        self.assertEqual(
+            self.top("symptom", self.warm.id)["problem"], (1, [(self.leak.id, 1)])
+        )
@@ -1,5 +1,8 @@
+import gzip
 from pydoc import describe
 from unicodedata import category
+from django.core.management import call_command
+from django.db import connection
 from django.test import TestCase
 from django.urls import reverse
 from appliances.models import (
@@ -14,13 +17,18 @@ from appliances.models import (
 from rest_framework.test import APIClient
 from django.contrib.auth.models import User
 import io
+import json
+from base64 import urlsafe_b64encode
 from rest_framework.parsers import JSONParser
 from appliances.tests.factories import (
+    ApplianceFactory,
     HistoricFactory,
     ProblemFactory,
     SolutionFactory,
     SymptomFactory,
 )
+from profiles.tests.factories import UserFactory
+from core.utils.cache import catalog_cache
 
 
 class BrandViewTest(TestCase):
@@ -158,6 +166,63 @@ class ApplianceViewTest(TestCase):
 
         self.assertEqual(len(data), 3)
 
+    def page(self, query):
+        response = self.notAuthenticatedClient.get(
+            reverse("appliances:appliance_list") + query
+        )
+        self.assertEqual(response.status_code, 200)
+        return response.json()
+
+    def test_filter_by_brand_and_category(self):
+        data = self.page("?category=%d&brand=%d" % (self.category2.id, self.brand1.id))
+
+        self.assertEqual([row["id"] for row in data["results"]], [self.appliance2.id])
+        self.assertIsNone(data["next"])
+
+    def test_filter_by_model_prefix(self):
+        data = self.page("?q=BRW1")
+        self.assertEqual(len(data["results"]), 3)
+
+        data = self.page("?q=BRW18")
+        self.assertEqual([row["id"] for row in data["results"]], [self.appliance3.id])
+
+    def test_keyset_pages_follow_the_index_order(self):
+        data = self.page("?limit=2")
+        self.assertEqual(
+            [row["id"] for row in data["results"]],
+            [self.appliance1.id, self.appliance2.id],
+        )
+
+        response = self.notAuthenticatedClient.get(data["next"])
+        data = response.json()
+        self.assertEqual([row["id"] for row in data["results"]], [self.appliance3.id])
+        self.assertIsNone(data["next"])
+        self.assertIsNotNone(data["previous"])
+
+    def test_names_are_joined_in_one_query(self):
+        with self.assertNumQueries(1):
+            data = self.page("?names=true&category=%d" % self.category1.id)
+
+        self.assertEqual(data["results"][0]["brand_name"], "Brand1")
+        self.assertEqual(data["results"][0]["category_name"], "cat1")
+
+    def test_invalid_filter(self):
+        response = self.notAuthenticatedClient.get(
+            reverse("appliances:appliance_list") + "?brand=x"
+        )
+
+        self.assertEqual(response.status_code, 400)
+
+    def test_tampered_cursor_returns_not_found(self):
+        cursor = urlsafe_b64encode(
+            json.dumps({"v": ["x", None, "BRW", 1], "r": 0}).encode("ascii")
+        ).decode("ascii")
+        response = self.notAuthenticatedClient.get(
+            reverse("appliances:appliance_list") + "?cursor=" + cursor
+        )
+
+        self.assertEqual(response.status_code, 404)
+
 
 class SolutionViewTest(TestCase):
     def setUp(self):
@@ -331,6 +396,472 @@ class SymptomViewTest(TestCase):
         self.assertEqual(data[1]["name"], "symptom2")
 
 
+class CatalogCacheTest(TestCase):
+    def setUp(self):
+        self.problem = ProblemFactory()
+        self.solution = SolutionFactory()
+        self.client = APIClient()
+        self.url = reverse("appliances:problem_list")
+
+    def get(self, **extra):
+        response = self.client.get(self.url, **extra)
+        self.assertEqual(response.status_code, 200)
+        return response
+
+    def test_warm_request_runs_no_query(self):
+        first = self.get()
+        with self.assertNumQueries(0):
+            second = self.get()
+
+        self.assertEqual(second.content, first.content)
+        self.assertEqual(second["Content-Type"], "application/json")
+
+    def test_save_and_delete_bump_the_version(self):
+        self.get()
+        self.problem.name = "Renamed"
+        self.problem.save()
+        self.assertEqual(self.get().json()[0]["name"], "Renamed")
+
+        self.problem.delete()
+        self.assertEqual(self.get().json(), [])
+
+    def test_m2m_changes_bump_the_version(self):
+        self.get()
+        self.problem.solutions.add(self.solution)
+        self.assertEqual(self.get().json()[0]["solutions"], [self.solution.id])
+
+        self.problem.solutions.clear()
+        self.assertEqual(self.get().json()[0]["solutions"], [])
+
+    def test_indented_json_is_cached_separately(self):
+        self.get()
+        response = self.get(HTTP_ACCEPT="application/json; indent=2")
+
+        self.assertIn(b"\n  ", response.content)
+
+    def test_accept_parameters_share_one_entry(self):
+        self.get()
+        entries = len(catalog_cache.entries)
+        for n in range(3):
+            with self.assertNumQueries(0):
+                self.get(HTTP_ACCEPT="application/json; x=%s" % n)
+
+        self.assertEqual(len(catalog_cache.entries), entries)
+
+
+class CatalogQueryCountTest(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+
+    def add_rows(self, count):
+        for i in range(count):
+            solution = SolutionFactory()
+            problem = ProblemFactory(solutions=[solution])
+            SymptomFactory(causes=[problem])
+
+    def assert_constant_queries(self, url, queries):
+        for count in (1, 10):
+            self.add_rows(count)
+            with self.assertNumQueries(queries):
+                response = self.client.get(reverse(url))
+            self.assertEqual(response.status_code, 200)
+
+    def test_problem_list(self):
+        self.assert_constant_queries("appliances:problem_list", 2)
+
+    def test_symptom_list(self):
+        self.assert_constant_queries("appliances:symptom_list", 2)
+
+
+class CatalogSnapshotTest(TestCase):
+    def setUp(self):
+        self.solution = SolutionFactory()
+        self.problem = ProblemFactory(solutions=[self.solution])
+        self.symptom = SymptomFactory()
+        self.symptom.causes.add(self.problem)
+        self.appliance = ApplianceFactory()
+        self.symptom.categories.add(self.appliance.category)
+        self.client = APIClient()
+        self.url = reverse("appliances:catalog")
+
+    def get(self, query="", **extra):
+        return self.client.get(self.url + query, **extra)
+
+    def test_full_document(self):
+        response = self.get()
+        data = response.json()
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response["ETag"], '"%s"' % data["hash"])
+        self.assertEqual(data["brands"][0]["id"], self.appliance.brand_id)
+        self.assertEqual(data["appliances"][0]["id"], self.appliance.id)
+        self.assertEqual(
+            data["symptoms"][0]["categories"], [self.appliance.category_id]
+        )
+        self.assertEqual(data["symptoms"][0]["causes"], [self.problem.id])
+        self.assertEqual(data["problems"][0]["solutions"], [self.solution.id])
+        self.assertEqual(data["solutions"][0]["id"], self.solution.id)
+
+    def test_snapshot_is_built_once_per_version(self):
+        self.get()
+        with self.assertNumQueries(0):
+            self.get()
+
+    def test_matching_etag_returns_304(self):
+        etag = self.get()["ETag"]
+
+        response = self.get(HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(response["ETag"], etag)
+
+    def test_since_returns_the_changes(self):
+        since = self.get().json()["hash"]
+        self.problem.name = "Renamed"
+        self.problem.save()
+        removed = self.solution.pk
+        added = SolutionFactory()
+        self.solution.delete()
+
+        data = self.get("?since=" + since).json()
+        self.assertEqual(data["since"], since)
+        self.assertEqual(
+            [row["name"] for row in data["changed"]["problems"]], ["Renamed"]
+        )
+        self.assertEqual(
+            [row["id"] for row in data["changed"]["solutions"]], [added.id]
+        )
+        self.assertEqual(data["deleted"]["solutions"], [removed])
+        self.assertEqual(data["changed"]["brands"], [])
+
+    def test_unknown_since_returns_the_full_document(self):
+        data = self.get("?since=unknown").json()
+
+        self.assertNotIn("since", data)
+        self.assertEqual(len(data["problems"]), 1)
+
+    def test_gzip_when_accepted(self):
+        plain = self.get()
+        response = self.get(HTTP_ACCEPT_ENCODING="gzip, deflate")
+
+        self.assertEqual(response["Content-Encoding"], "gzip")
+        self.assertEqual(gzip.decompress(response.content), plain.content)
+        self.assertIn("Accept-Encoding", response["Vary"])
+
+    def test_each_encoding_has_its_own_etag(self):
+        plain = self.get()
+        gzipped = self.get(HTTP_ACCEPT_ENCODING="gzip")
+
+        self.assertEqual(gzipped["ETag"], '"%s-gzip"' % plain.json()["hash"])
+        response = self.get(HTTP_IF_NONE_MATCH=gzipped["ETag"])
+        self.assertEqual(response.status_code, 200)
+        self.assertNotIn("Content-Encoding", response)
+        response = self.get(
+            HTTP_IF_NONE_MATCH=gzipped["ETag"], HTTP_ACCEPT_ENCODING="gzip"
+        )
+        self.assertEqual(response.status_code, 304)
+
+    def test_gzip_refused_with_a_zero_quality(self):
+        for header in ("gzip;q=0, identity", "*;q=0.5, gzip; q=0", "br"):
+            response = self.get(HTTP_ACCEPT_ENCODING=header)
+            self.assertNotIn("Content-Encoding", response, header)
+
+        response = self.get(HTTP_ACCEPT_ENCODING="br;q=1.0, *;q=0.1")
+        self.assertEqual(response["Content-Encoding"], "gzip")
+
+
+class CatalogSearchTest(TestCase):
+    def setUp(self):
+        self.compressor = ProblemFactory(
+            name="Compressor not starting",
+            description="The compressor clicks and stops.",
+        )
+        self.cooling = SymptomFactory(
+            name="No cooling", description="The fridge does not get cold."
+        )
+        self.gas = SolutionFactory(
+            name="Recharge gas", description="Refill the cooling circuit."
+        )
+        self.door = SolutionFactory(name="Replace door seal", description="")
+        self.client = APIClient()
+        self.url = reverse("appliances:catalog_search")
+
+    def search(self, query):
+        response = self.client.get(self.url + query)
+        self.assertEqual(response.status_code, 200)
+        return [(row["kind"], row["id"]) for row in response.json()["results"]]
+
+    def test_ranks_name_matches_first(self):
+        results = self.search("?q=no cooling, compressor clicks")
+
+        self.assertEqual(
+            results,
+            [
+                ("problem", self.compressor.id),
+                ("symptom", self.cooling.id),
+                ("solution", self.gas.id),
+            ],
+        )
+
+    def test_terms_match_as_prefixes(self):
+        self.assertEqual(self.search("?q=compress"), [("problem", self.compressor.id)])
+
+    def test_filters_kinds(self):
+        results = self.search("?q=cooling&kind=solution&kind=problem")
+
+        self.assertEqual(results, [("solution", self.gas.id)])
+
+    def test_index_follows_saves_and_deletes(self):
+        self.door.name = "Replace compressor relay"
+        self.door.save()
+        self.assertIn(("solution", self.door.id), self.search("?q=relay"))
+
+        self.door.delete()
+        self.assertEqual(self.search("?q=relay"), [])
+
+    def test_rebuild_command(self):
+        with connection.cursor() as cursor:
+            cursor.execute("DELETE FROM appliances_catalog_search")
+        out = io.StringIO()
+        call_command("rebuild_search_index", stdout=out)
+
+        self.assertIn("Indexed 4", out.getvalue())
+        self.assertEqual(self.search("?q=seal"), [("solution", self.door.id)])
+
+    def test_query_without_words(self):
+        response = self.client.get(self.url + "?q=,,")
+
+        self.assertEqual(response.status_code, 400)
+
+
+class DiagnosisTest(TestCase):
+    def setUp(self):
+        self.fridge = ApplianceFactory()
+        self.category = self.fridge.category
+        self.gas = SolutionFactory()
+        self.relay = SolutionFactory()
+        self.leak = ProblemFactory(solutions=[self.gas])
+        self.compressor = ProblemFactory(solutions=[self.relay, self.gas])
+        self.warm = SymptomFactory(
+            categories=[self.category], causes=[self.leak, self.compressor]
+        )
+        self.noise = SymptomFactory(causes=[self.compressor])
+        self.other = SymptomFactory(
+            categories=[ApplianceFactory().category], causes=[self.leak]
+        )
+        self.user = UserFactory()
+        self.org = self.user.profile.org
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+        self.url = reverse("appliances:diagnose")
+
+    def diagnose(self, query):
+        response = self.client.get(self.url + query)
+        self.assertEqual(response.status_code, 200)
+        return response.json()
+
+    def test_ranks_by_coverage(self):
+        data = self.diagnose(
+            "?symptom=%d&symptom=%d&appliance=%d"
+            % (self.warm.id, self.noise.id, self.fridge.id)
+        )
+
+        self.assertEqual(data["category"], self.category.id)
+        self.assertEqual(
+            [(row["id"], row["coverage"]) for row in data["problems"]],
+            [(self.compressor.id, 1.0), (self.leak.id, 0.5)],
+        )
+        self.assertEqual(
+            [(row["id"], row["score"]) for row in data["solutions"]],
+            [(self.gas.id, 1.5), (self.relay.id, 1.0)],
+        )
+        self.assertEqual(
+            data["solutions"][0]["problems"],
+            sorted([self.leak.id, self.compressor.id]),
+        )
+
+    def test_symptoms_of_other_categories_are_ignored(self):
+        data = self.diagnose(
+            "?symptom=%d&symptom=%d&category=%d"
+            % (self.noise.id, self.other.id, self.category.id)
+        )
+
+        self.assertEqual(data["ignored"], [self.other.id])
+        self.assertEqual([row["id"] for row in data["problems"]], [self.compressor.id])
+
+    def test_historics_of_the_category_weigh_in(self):
+        HistoricFactory(appliance=self.fridge, org=self.org, problems=[self.leak])
+        HistoricFactory(appliance=self.fridge, org=self.org, problems=[self.leak])
+        HistoricFactory(appliance=self.fridge, org=self.org)
+        # Other organizations' historics are not counted.
+        HistoricFactory(appliance=self.fridge, problems=[self.leak])
+
+        data = self.diagnose(
+            "?symptom=%d&category=%d" % (self.warm.id, self.category.id)
+        )
+
+        self.assertEqual(data["problems"][0]["id"], self.leak.id)
+        self.assertEqual(data["problems"][0]["recorded"], 2)
+
+    def test_graph_is_reused_until_the_catalog_changes(self):
+        query = "?symptom=%d&category=%d" % (self.noise.id, self.category.id)
+        self.diagnose(query)
+        with self.assertNumQueries(0):
+            self.diagnose(query)
+
+        fix = SolutionFactory()
+        self.compressor.solutions.add(fix)
+        solutions = [row["id"] for row in self.diagnose(query)["solutions"]]
+        self.assertIn(fix.id, solutions)
+
+    def test_needs_an_appliance_or_a_category(self):
+        response = self.client.get(self.url + "?symptom=%d" % self.warm.id)
+        self.assertEqual(response.status_code, 400)
+
+        response = self.client.get(self.url + "?symptom=%d&appliance=0" % self.warm.id)
+        self.assertEqual(response.status_code, 400)
+
+    def test_needs_authentication(self):
+        response = APIClient().get(
+            self.url + "?symptom=%d&category=%d" % (self.warm.id, self.category.id)
+        )
+        self.assertEqual(response.status_code, 401)
+
+
+class AutocompleteTest(TestCase):
+    def setUp(self):
+        self.whirlpool = Brand.objects.create(name="Whirlpool")
+        self.westinghouse = Brand.objects.create(name="Westinghouse")
+        self.fridge = Category.objects.create(name="Fridge")
+        self.wrf = Appliance.objects.create(
+            model="WRF-555", brand=self.whirlpool, category=self.fridge
+        )
+        self.wrs = Appliance.objects.create(
+            model="WRS321", brand=self.whirlpool, category=self.fridge
+        )
+        self.wrf_b = Appliance.objects.create(
+            model="wrf 560", brand=self.westinghouse, category=self.fridge
+        )
+        self.client = APIClient()
+        self.url = reverse("appliances:autocomplete")
+
+    def autocomplete(self, query):
+        response = self.client.get(self.url + query)
+        self.assertEqual(response.status_code, 200)
+        return response.json()
+
+    def test_matches_models_by_normalized_prefix(self):
+        data = self.autocomplete("?q=wr-f5")
+
+        self.assertEqual(
+            [row["id"] for row in data["appliances"]], [self.wrf.id, self.wrf_b.id]
+        )
+        self.assertEqual(
+            data["appliances"][0],
+            {
+                "id": self.wrf.id,
+                "model": "WRF-555",
+                "brand": self.whirlpool.id,
+                "brand_name": "Whirlpool",
+                "category": self.fridge.id,
+                "category_name": "Fridge",
+            },
+        )
+        self.assertEqual(data["brands"], [])
+
+    def test_matches_brands(self):
+        data = self.autocomplete("?q=w")
+
+        self.assertEqual(
+            [row["name"] for row in data["brands"]], ["Westinghouse", "Whirlpool"]
+        )
+        self.assertEqual(len(data["appliances"]), 3)
+
+    def test_limit(self):
+        data = self.autocomplete("?q=wr&limit=2")
+        self.assertEqual(
+            [row["id"] for row in data["appliances"]], [self.wrf.id, self.wrf_b.id]
+        )
+
+    def test_index_is_reused_until_the_catalog_changes(self):
+        self.autocomplete("?q=wr")
+        with self.assertNumQueries(0):
+            self.autocomplete("?q=wrs")
+
+        self.whirlpool.name = "Whirlpool Corp"
+        self.whirlpool.save()
+        data = self.autocomplete("?q=wrs")
+        self.assertEqual(data["appliances"][0]["brand_name"], "Whirlpool Corp")
+
+    def test_needs_a_letter_or_digit(self):
+        response = self.client.get(self.url + "?q=--")
+        self.assertEqual(response.status_code, 400)
+
+
+class AssociationViewTest(TestCase):
+    def setUp(self):
+        self.user = UserFactory()
+        self.appliance = ApplianceFactory()
+        self.symptom = SymptomFactory()
+        self.leak, self.relay = ProblemFactory(), ProblemFactory()
+        with self.captureOnCommitCallbacks(execute=True):
+            for problems in ([self.leak], [self.leak], [self.relay]):
+                HistoricFactory(
+                    appliance=self.appliance,
+                    org=self.user.profile.org,
+                    completed=True,
+                    symptoms=[self.symptom],
+                    problems=problems,
+                )
+            # Another organization's historic is not counted.
+            HistoricFactory(
+                appliance=self.appliance,
+                completed=True,
+                symptoms=[self.symptom],
+                problems=[self.relay],
+            )
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+        self.url = reverse("appliances:associations")
+
+    def test_top_problems_of_a_symptom(self):
+        response = self.client.get(
+            self.url
+            + "?symptom=%d&category=%d&k=1"
+            % (self.symptom.id, self.appliance.category_id)
+        )
+
+        self.assertEqual(response.status_code, 200)
+        data = response.json()
+        self.assertEqual(data["occurrences"], 3)
+        self.assertEqual(
+            data["problems"],
+            [
+                {
+                    "id": self.leak.id,
+                    "name": self.leak.name,
+                    "count": 2,
+                    "confidence": 2 / 3,
+                }
+            ],
+        )
+        self.assertEqual(data["solutions"], [])
+
+    def test_needs_a_symptom_or_a_problem(self):
+        response = self.client.get(
+            self.url + "?category=%d" % self.appliance.category_id
+        )
+
+        self.assertEqual(response.status_code, 400)
+
+    def test_needs_authentication(self):
+        response = APIClient().get(
+            self.url
+            + "?symptom=%d&category=%d" % (self.symptom.id, self.appliance.category_id)
+        )
+
+        self.assertEqual(response.status_code, 401)
+
+
 class HistoricViewTest(TestCase):
     def setUp(self):
 
@@ -517,3 +1048,149 @@ class HistoricViewTest(TestCase):
             format="json",
         )
         self.assertEqual(response.status_code, 404)
+
+
+class HistoricNormalizedListViewTest(TestCase):
+    def setUp(self):
+        self.user1 = User.objects.create_user("root1", "email1@exemple.com", "root")
+        self.client = APIClient()
+        self.client.force_authenticate(self.user1)
+
+        self.appliance = ApplianceFactory()
+        self.solution = SolutionFactory()
+        self.problem = ProblemFactory(solutions=(self.solution,))
+        self.symptom = SymptomFactory(causes=(self.problem,))
+        for i in range(3):
+            HistoricFactory(
+                org=self.user1.profile.org,
+                appliance=self.appliance,
+                symptoms=(self.symptom,),
+                problems=(self.problem,),
+                solutions=(self.solution,),
+            )
+
+    def test_list_historics_in_normalized_format(self):
+        response = self.client.get(
+            "%s?format=normalized" % reverse("appliances:historic_list")
+        )
+
+        self.assertEqual(response.status_code, 200)
+        data = response.json()
+        self.assertEqual(len(data["results"]), 3)
+        self.assertEqual(data["results"][0]["appliance"], self.appliance.id)
+        self.assertEqual(data["results"][0]["symptoms"], [self.symptom.id])
+
+        included = data["included"]
+        self.assertEqual(list(included["appliances"]), [str(self.appliance.id)])
+        self.assertEqual(
+            included["appliances"][str(self.appliance.id)]["model"],
+            self.appliance.model,
+        )
+        self.assertEqual(len(included["organizations"]), 1)
+        self.assertEqual(
+            included["symptoms"][str(self.symptom.id)]["causes"], [self.problem.id]
+        )
+        self.assertEqual(
+            included["problems"][str(self.problem.id)]["solutions"],
+            [self.solution.id],
+        )
+        self.assertEqual(len(included["solutions"]), 1)
+
+    def test_normalized_format_negotiated_by_accept_header(self):
+        response = self.client.get(
+            reverse("appliances:historic_list"),
+            HTTP_ACCEPT="application/vnd.appliance-service.normalized+json",
+        )
+
+        self.assertEqual(response.status_code, 200)
+        self.assertIn("included", response.json())
+
+    def test_normalized_query_count_does_not_grow_with_rows(self):
+        url = "%s?format=normalized" % reverse("appliances:historic_list")
+        self.client.get(url)
+        with self.assertNumQueries(12):
+            self.client.get(url)
+
+        for i in range(5):
+            HistoricFactory(
+                org=self.user1.profile.org,
+                symptoms=(SymptomFactory(causes=(ProblemFactory(),)),),
+            )
+        with self.assertNumQueries(12):
+            self.client.get(url)
+
+    def test_plain_query_count_does_not_grow_with_rows(self):
+        url = reverse("appliances:historic_list")
+        with self.assertNumQueries(5):
+            self.client.get(url)
+
+        for i in range(5):
+            HistoricFactory(
+                org=self.user1.profile.org,
+                symptoms=(SymptomFactory(),),
+                problems=(ProblemFactory(),),
+            )
+        with self.assertNumQueries(5):
+            self.client.get(url)
+
+
+class HistoricETagTest(TestCase):
+    def setUp(self):
+        self.user1 = User.objects.create_user("root1", "email1@exemple.com", "root")
+        self.client = APIClient()
+        self.client.force_authenticate(self.user1)
+
+        self.historic = HistoricFactory(org=self.user1.profile.org)
+        self.other = HistoricFactory()
+        self.symptom = SymptomFactory()
+        self.detail_url = reverse(
+            "appliances:historic_detail", kwargs={"historic_pk": self.historic.id}
+        )
+        self.list_url = reverse("appliances:historic_list")
+
+    def test_detail_returns_304_for_matching_etag(self):
+        etag = self.client.get(self.detail_url)["ETag"]
+        response = self.client.get(self.detail_url, HTTP_IF_NONE_MATCH=etag)
+
+        self.assertRegex(etag, r'^"[0-9a-f]+"$')
+        self.assertEqual(response.status_code, 304)
+
+    def test_detail_etag_changes_when_symptoms_change(self):
+        etag = self.client.get(self.detail_url)["ETag"]
+        self.historic.symptoms.add(self.symptom)
+        after_add = self.client.get(self.detail_url)["ETag"]
+        self.symptom.historic_set.clear()
+        after_clear = self.client.get(self.detail_url)["ETag"]
+
+        self.assertEqual(len({etag, after_add, after_clear}), 3)
+
+    def test_detail_etag_changes_when_a_nested_symptom_is_renamed(self):
+        self.historic.symptoms.add(self.symptom)
+        etag = self.client.get(self.detail_url)["ETag"]
+        self.symptom.name = "renamed"
+        self.symptom.save()
+        response = self.client.get(self.detail_url, HTTP_IF_NONE_MATCH=etag)
+
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response["ETag"], etag)
+
+    def test_other_org_detail_has_no_etag(self):
+        url = reverse(
+            "appliances:historic_detail", kwargs={"historic_pk": self.other.id}
+        )
+        response = self.client.get(url, HTTP_IF_NONE_MATCH="*")
+
+        self.assertEqual(response.status_code, 403)
+        self.assertFalse(response.has_header("ETag"))
+
+    def test_list_weak_etag(self):
+        etag = self.client.get(self.list_url)["ETag"]
+        self.assertTrue(etag.startswith('W/"'))
+        self.assertEqual(
+            self.client.get(self.list_url, HTTP_IF_NONE_MATCH=etag).status_code, 304
+        )
+        self.client.put(self.detail_url, {"completed": True}, format="json")
+
+        self.assertEqual(
+            self.client.get(self.list_url, HTTP_IF_NONE_MATCH=etag).status_code, 200
+        )
@@ -11,6 +11,11 @@ urlpatterns = [
     path("solutions/", views.SolutionListView.as_view(), name="solution_list"),
     path("problems/", views.ProblemListView.as_view(), name="problem_list"),
     path("symptoms/", views.SymptomListView.as_view(), name="symptom_list"),
+    path("catalog/", views.CatalogView.as_view(), name="catalog"),
+    path("search/", views.CatalogSearchView.as_view(), name="catalog_search"),
+    path("autocomplete/", views.AutocompleteView.as_view(), name="autocomplete"),
+    path("diagnose/", views.DiagnosisView.as_view(), name="diagnose"),
+    path("associations/", views.AssociationView.as_view(), name="associations"),
     path("historics/", views.HistoricListView.as_view(), name="historic_list"),
     path("historics/<int:historic_pk>/", views.HistoricDetailView.as_view(), name="historic_detail"),
 ]
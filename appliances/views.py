@@ -1,72 +1,363 @@
 from functools import partial
+from django.http import HttpResponse
 from django.shortcuts import get_object_or_404, render
+from django.utils.cache import get_conditional_response, patch_vary_headers
 from rest_framework.views import APIView
 from rest_framework.response import Response
 from .serializers import (
+    AssociationQuerySerializer,
+    ApplianceFilterSerializer,
+    ApplianceNamedSerializer,
     ApplianceSerializer,
+    AutocompleteQuerySerializer,
     BrandSerializer,
+    CatalogSearchQuerySerializer,
     CategorySerializer,
+    DiagnosisQuerySerializer,
     HistoricSerializer,
     ProblemSerializer,
     SolutionSerializer,
     SymptomSerializer,
 )
-from .models import Appliance, Brand, Category, Historic, Problem, Solution, Symptom
+from .models import (
+    Appliance,
+    Brand,
+    Category,
+    CooccurrenceMatrix,
+    Historic,
+    Problem,
+    Solution,
+    Symptom,
+)
 from rest_framework.permissions import IsAuthenticated
+from rest_framework.renderers import JSONRenderer
+from rest_framework.settings import api_settings
+from core.utils.cache import analytics_cache, catalog_cache
+from core.utils.etags import conditional, fingerprint, make_etag
+from core.utils.pagination import KeysetPagination
+from core.utils.sideload import NormalizedJSONRenderer, Sideloader, is_normalized
+from profiles.serializers import OrganizationSerializer
+from .autocomplete import autocomplete
+from .catalog import current_snapshot, find_snapshot
+from .diagnosis import diagnose, get_graph
+from .search import KINDS, get_search_index
 from .permissions import IsHistoricOwner
 from rest_framework import status
 
 # Create your views here.
 
 
-class BrandListView(APIView):
-    def get(self, request, format=None):
-        brands = Brand.objects.all()
-        serializer = BrandSerializer(brands, many=True)
-        return Response(data=serializer.data)
+def accepts_gzip(request):
+    """Whether Accept-Encoding allows gzip, explicitly or through "*",
+    with a non-zero q-value."""
+    qualities = {}
+    for coding in request.headers.get("Accept-Encoding", "").split(","):
+        name, _, params = coding.partition(";")
+        quality = 1.0
+        for param in params.split(";"):
+            key, _, value = param.partition("=")
+            if key.strip().lower() == "q":
+                try:
+                    quality = float(value)
+                except ValueError:
+                    quality = 0.0
+        qualities[name.strip().lower()] = quality
+    return qualities.get("gzip", qualities.get("*", 0.0)) > 0
+
+
+def historic_list_etag(request, **kwargs):
+    org_id = request.user.profile.org_id
+    historics = Historic.objects.filter(org_id=org_id)
+    return make_etag(
+        request,
+        org_id,
+        catalog_cache.version(),
+        analytics_cache.version(org_id),
+        *fingerprint(historics, "updated_at"),
+        weak=True,
+    )
+
+
+def historic_detail_etag(request, historic_pk, **kwargs):
+    org_id = request.user.profile.org_id
+    updated_at = (
+        Historic.objects.filter(pk=historic_pk, org_id=org_id)
+        .values_list("updated_at", flat=True)
+        .first()
+    )
+    if updated_at is None:
+        return None
+    return make_etag(
+        request, catalog_cache.version(), analytics_cache.version(org_id), updated_at
+    )
 
 
-class CategoryListView(APIView):
+class CatalogListView(APIView):
+    """Lists a global catalog model out of catalog_cache.
+
+    JSON responses are cached rendered, per renderer media type and indent,
+    and other formats as serialized data, so a warm request runs no query
+    and no serializer. Catalog writes bump the cache version.
+    """
+
+    model = None
+    serializer_class = None
+
+    def get_queryset(self):
+        queryset = self.model.objects.all()
+        if hasattr(self.serializer_class, "setup_eager_loading"):
+            queryset = self.serializer_class.setup_eager_loading(queryset)
+        return queryset
+
+    def get_data(self):
+        serializer = self.serializer_class(self.get_queryset(), many=True)
+        return serializer.data
+
     def get(self, request, format=None):
-        categories = Category.objects.all()
-        serializer = CategorySerializer(categories, many=True)
-        return Response(data=serializer.data)
+        name = self.model._meta.model_name
+        renderer = request.accepted_renderer
+        if not isinstance(renderer, JSONRenderer):
+            return Response(data=catalog_cache.get_or_set(name, self.get_data))
+        media_type = request.accepted_media_type
+        context = self.get_renderer_context()
+        # Other Accept parameters do not change the output, and keying on
+        # them would let clients grow the process-local cache at will.
+        content = catalog_cache.get_or_set(
+            (name, renderer.media_type, renderer.get_indent(media_type, context)),
+            lambda: renderer.render(self.get_data(), media_type, context),
+        )
+        return HttpResponse(content, content_type=renderer.media_type)
 
 
-class ApplianceListView(APIView):
+class BrandListView(CatalogListView):
+    model = Brand
+    serializer_class = BrandSerializer
+
+
+class CategoryListView(CatalogListView):
+    model = Category
+    serializer_class = CategorySerializer
+
+
+class ApplianceListView(CatalogListView):
+    """The whole appliance catalog, or a page of it.
+
+    ?brand=, ?category=, ?q= (model prefix), ?names= (brand and category
+    names joined in) or a cursor switch to a keyset-paginated page ordered
+    like the (category, brand, model) index, so filtered pages are index
+    range scans.
+    """
+
+    model = Appliance
+    serializer_class = ApplianceSerializer
+    ordering = ("category_id", "brand_id", "model", "id")
+
+    def is_paginated(self, request):
+        return KeysetPagination.is_requested(request) or any(
+            name in request.query_params
+            for name in list(ApplianceFilterSerializer().fields) + ["limit"]
+        )
+
     def get(self, request, format=None):
+        if not self.is_paginated(request):
+            return super().get(request, format)
+
+        filters = ApplianceFilterSerializer(data=request.query_params)
+        filters.is_valid(raise_exception=True)
         appliances = Appliance.objects.all()
-        serializer = ApplianceSerializer(appliances, many=True)
-        return Response(data=serializer.data)
+        if "category" in filters.validated_data:
+            appliances = appliances.filter(category=filters.validated_data["category"])
+        if "brand" in filters.validated_data:
+            appliances = appliances.filter(brand=filters.validated_data["brand"])
+        if filters.validated_data.get("q"):
+            appliances = appliances.filter(
+                model__startswith=filters.validated_data["q"]
+            )
+        serializer_class = self.serializer_class
+        if filters.validated_data.get("names"):
+            serializer_class = ApplianceNamedSerializer
+            appliances = serializer_class.setup_eager_loading(appliances)
+
+        paginator = KeysetPagination(ordering=self.ordering)
+        result_page = paginator.paginate_queryset(appliances, request)
+        serializer = serializer_class(result_page, many=True)
+        return Response(
+            {
+                "results": serializer.data,
+                "next": paginator.get_next_link(),
+                "previous": paginator.get_previous_link(),
+            }
+        )
+
 
+class SolutionListView(CatalogListView):
+    model = Solution
+    serializer_class = SolutionSerializer
+
+
+class ProblemListView(CatalogListView):
+    model = Problem
+    serializer_class = ProblemSerializer
+
+
+class SymptomListView(CatalogListView):
+    model = Symptom
+    serializer_class = SymptomSerializer
+
+
+class CatalogView(APIView):
+    """The whole catalog in one document, for clients that keep a copy.
+
+    The ETag is the content hash of the snapshot. With ?since=<hash> of a
+    snapshot this process still knows, only the changed rows and the
+    deleted ids are returned; otherwise the full document. Both are served
+    gzipped when the client accepts it, with "-gzip" added to the ETag.
+    """
 
-class SolutionListView(APIView):
     def get(self, request, format=None):
-        solutions = Solution.objects.all()
-        serializer = SolutionSerializer(solutions, many=True)
-        return Response(data=serializer.data)
+        snapshot = current_snapshot()
+        since = find_snapshot(request.query_params.get("since"))
+        gzip = accepts_gzip(request)
+        # Each encoding is a representation of its own and needs its own tag.
+        etag = ('W/"%s%s"' if since else '"%s%s"') % (
+            snapshot.hash,
+            "-gzip" if gzip else "",
+        )
+        response = get_conditional_response(request, etag=etag)
+        if response is None:
+            if since is None:
+                content, gzipped = snapshot.content, snapshot.gzipped
+            else:
+                content, gzipped = snapshot.delta(since)
+            if gzip:
+                response = HttpResponse(gzipped, content_type="application/json")
+                response["Content-Encoding"] = "gzip"
+            else:
+                response = HttpResponse(content, content_type="application/json")
+        patch_vary_headers(response, ["Accept-Encoding"])
+        response["ETag"] = etag
+        return response
+
 
+class CatalogSearchView(APIView):
+    """Ranked full-text search over the symptoms, problems and solutions."""
 
-class ProblemListView(APIView):
     def get(self, request, format=None):
-        problems = Problem.objects.all()
-        serializer = ProblemSerializer(problems, many=True)
-        return Response(data=serializer.data)
+        query = CatalogSearchQuerySerializer(data=request.query_params)
+        query.is_valid(raise_exception=True)
+        index = get_search_index()
+        if index is None:
+            return Response(
+                {"detail": "Search is not supported by this database."},
+                status=status.HTTP_501_NOT_IMPLEMENTED,
+            )
+        results = index.search(
+            query.validated_data["q"],
+            kinds=query.validated_data.get("kind", KINDS),
+            limit=query.validated_data["limit"],
+        )
+        return Response({"results": results})
 
 
-class SymptomListView(APIView):
+class AutocompleteView(APIView):
+    """Appliance models and brands starting with the typed text, read from
+    an in-memory prefix index rebuilt once per catalog version."""
+
     def get(self, request, format=None):
-        symptoms = Symptom.objects.all()
-        serializer = SymptomSerializer(symptoms, many=True)
-        return Response(data=serializer.data)
+        query = AutocompleteQuerySerializer(data=request.query_params)
+        query.is_valid(raise_exception=True)
+        return Response(
+            autocomplete(query.validated_data["q"], query.validated_data["limit"])
+        )
+
+
+class DiagnosisView(APIView):
+    """Problems and solutions ranked for symptoms of an appliance or
+    category, read from the in-memory catalog graph and weighted by the
+    historics of the user's organization."""
+
+    permission_classes = [IsAuthenticated]
+
+    def get(self, request, format=None):
+        query = DiagnosisQuerySerializer(data=request.query_params)
+        query.is_valid(raise_exception=True)
+        return Response(
+            diagnose(
+                query.validated_data["symptom"],
+                query.validated_data["category"],
+                request.user.profile.org_id,
+                query.validated_data["limit"],
+            )
+        )
+
+
+class AssociationView(APIView):
+    """The problems and solutions most often recorded with a symptom, or
+    the solutions most often recorded with a problem, in the completed
+    historics of a category of the user's organization."""
+
+    permission_classes = [IsAuthenticated]
+
+    def get(self, request, format=None):
+        query = AssociationQuerySerializer(data=request.query_params)
+        query.is_valid(raise_exception=True)
+        kind = "symptom" if "symptom" in query.validated_data else "problem"
+        pk = query.validated_data[kind]
+        top = CooccurrenceMatrix.objects.top(
+            request.user.profile.org_id,
+            query.validated_data["category"],
+            kind,
+            pk,
+            query.validated_data["k"],
+        )
+        graph = get_graph()
+        names = {"problem": graph.problem_names, "solution": graph.solution_names}
+        data = {"category": query.validated_data["category"], kind: pk}
+        for target, (occurrences, pairs) in top.items():
+            data["occurrences"] = occurrences
+            data[target + "s"] = [
+                {
+                    "id": target_pk,
+                    "name": names[target][target_pk],
+                    "count": count,
+                    "confidence": count / occurrences,
+                }
+                for target_pk, count in pairs
+                # Deleted catalog entries stay counted until the next build.
+                if target_pk in names[target]
+            ]
+        return Response(data)
 
 
 class HistoricListView(APIView):
 
     permission_classes = [IsAuthenticated]
+    renderer_classes = api_settings.DEFAULT_RENDERER_CLASSES + [NormalizedJSONRenderer]
+
+    sideloader = Sideloader(
+        Historic,
+        {
+            "appliance": ("appliances", ApplianceSerializer),
+            "org": ("organizations", OrganizationSerializer),
+            "symptoms": ("symptoms", SymptomSerializer),
+            "problems": ("problems", ProblemSerializer),
+            "solutions": ("solutions", SolutionSerializer),
+        },
+    )
 
+    @conditional(historic_list_etag)
     def get(self, request, format=None):
         historics = Historic.objects.filter(org=request.user.profile.org)
+        if is_normalized(request):
+            historics = list(self.sideloader.setup_eager_loading(historics))
+            serializer = HistoricSerializer(historics, many=True)
+            return Response(
+                {
+                    "results": serializer.data,
+                    "included": self.sideloader.get_included(historics),
+                }
+            )
+        historics = HistoricSerializer.setup_eager_loading(historics)
         serializer = HistoricSerializer(historics, many=True)
         return Response(data=serializer.data)
 
@@ -75,6 +366,7 @@ class HistoricDetailView(APIView):
 
     permission_classes = [IsAuthenticated, IsHistoricOwner]
 
+    @conditional(historic_detail_etag)
     def get(self, request, historic_pk, format=None):
         historic = get_object_or_404(Historic, pk=historic_pk)
         self.check_object_permissions(request, historic)
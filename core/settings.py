@@ -112,6 +112,45 @@ db_from_env = dj_database_url.config(
 DATABASES["default"].update(db_from_env)
 
 
+# Cache
+# https://docs.djangoproject.com/en/4.0/topics/cache/
+# Analytics and catalog entries are invalidated through the cache, so every
+# worker has to share it: without DEBUG, the WSGI and ASGI applications refuse
+# to start on the local memory cache, so REDIS_URL is required in production.
+
+REDIS_URL = os.environ.get("REDIS_URL")
+CACHES = {
+    "default": {
+        "BACKEND": "django.core.cache.backends.locmem.LocMemCache",
+    }
+}
+if REDIS_URL:
+    CACHES["default"] = {
+        "BACKEND": "django.core.cache.backends.redis.RedisCache",
+        "LOCATION": REDIS_URL,
+    }
+
+# Backstop for changes that do not go through the ORM.
+ANALYTICS_CACHE_TIMEOUT = int(os.environ.get("ANALYTICS_CACHE_TIMEOUT", 60 * 60))
+
+# Backstop for the catalog lists, snapshot, diagnosis graph and autocomplete
+# index each process keeps in memory, for changes that do not bump the
+# catalog version.
+CATALOG_CACHE_TIMEOUT = int(os.environ.get("CATALOG_CACHE_TIMEOUT", 5 * 60))
+
+# Threads running the independent queries of a dashboard concurrently, each
+# with its own database connection; 1 or less runs them one after another.
+# The connections persist like request ones (conn_max_age), so each worker
+# process can hold this many connections on top of its request threads.
+ANALYTICS_QUERY_WORKERS = int(os.environ.get("ANALYTICS_QUERY_WORKERS", 4))
+
+# Seconds the historic counts weighting diagnoses are reused before being
+# counted again; catalog changes refresh them too.
+DIAGNOSIS_FREQUENCIES_TIMEOUT = int(
+    os.environ.get("DIAGNOSIS_FREQUENCIES_TIMEOUT", 10 * 60)
+)
+
+
 # Password validation
 # https://docs.djangoproject.com/en/4.0/ref/settings/#auth-password-validators
 
@@ -1,4 +1,18 @@
-from django.test import TestCase
+import threading
+from datetime import date
+from unittest import mock
+
+from django.core.exceptions import ImproperlyConfigured
+from django.test import TestCase, TransactionTestCase, override_settings
+from core.utils.cache import (
+    LocalVersionedCache,
+    OrgVersionedCache,
+    require_shared_cache,
+)
+from core.utils.columns import Column, shape
+from core.utils.concurrency import run_concurrently
+from core.utils.sparse import SparseCounts
+from core.utils.dates import bucket_dates, bucket_label, fill_buckets, truncate
 from core.utils.utils import concatenateLists, getDisctionaryOfLists, renameListNulls
 
 
@@ -50,3 +64,212 @@ class RenameListNullsTest(TestCase):
     def test_rename_list_nulls_with_0(self):
         l = renameListNulls(self.mainList, 0)
         self.assertEqual(l, [1, 2, 3, 0, 1, 0])
+
+
+class OrgVersionedCacheTest(TestCase):
+    def setUp(self):
+        self.cache = OrgVersionedCache("test", timeout=60)
+        self.cache.cache.clear()
+        self.calls = 0
+
+    def compute(self):
+        self.calls += 1
+        return {"calls": self.calls}
+
+    def test_second_read_is_a_hit(self):
+        self.assertEqual(self.cache.get_or_set(1, "key", self.compute), {"calls": 1})
+        self.assertEqual(self.cache.get_or_set(1, "key", self.compute), {"calls": 1})
+        self.assertEqual(self.calls, 1)
+
+    def test_bump_retires_every_key_of_the_organization(self):
+        self.cache.get_or_set(1, "a", self.compute)
+        self.cache.get_or_set(1, "b", self.compute)
+        self.cache.get_or_set(2, "a", self.compute)
+
+        self.cache.bump(1)
+
+        self.assertEqual(self.cache.get_or_set(1, "a", self.compute), {"calls": 4})
+        self.assertEqual(self.cache.get_or_set(1, "b", self.compute), {"calls": 5})
+        self.assertEqual(self.cache.get_or_set(2, "a", self.compute), {"calls": 3})
+
+    def test_invalidate_bumps_again_on_commit(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            self.cache.invalidate(1)
+            # Computed while the change was not committed yet.
+            self.cache.get_or_set(1, "key", self.compute)
+
+        self.assertEqual(self.cache.get_or_set(1, "key", self.compute), {"calls": 2})
+
+
+class RequireSharedCacheTest(TestCase):
+    local = {"default": {"BACKEND": "django.core.cache.backends.locmem.LocMemCache"}}
+    redis = {
+        "default": {
+            "BACKEND": "django.core.cache.backends.redis.RedisCache",
+            "LOCATION": "redis://localhost:6379",
+        }
+    }
+
+    def test_local_cache_is_refused_in_production(self):
+        with override_settings(DEBUG=False, CACHES=self.local):
+            with self.assertRaises(ImproperlyConfigured):
+                require_shared_cache()
+
+    def test_local_cache_is_allowed_with_debug(self):
+        with override_settings(DEBUG=True, CACHES=self.local):
+            require_shared_cache()
+
+    def test_shared_cache_is_allowed_in_production(self):
+        with override_settings(DEBUG=False, CACHES=self.redis):
+            require_shared_cache()
+
+
+class LocalVersionedCacheTest(TestCase):
+    def setUp(self):
+        self.cache = LocalVersionedCache("test-local")
+        self.calls = 0
+
+    def compute(self):
+        self.calls += 1
+        return self.calls
+
+    def test_bump_retires_every_entry(self):
+        self.assertEqual(self.cache.get_or_set("a", self.compute), 1)
+        self.assertEqual(self.cache.get_or_set("a", self.compute), 1)
+
+        self.cache.bump()
+        self.assertEqual(self.cache.get_or_set("a", self.compute), 2)
+
+    def test_timeout_expires_within_a_version(self):
+        with mock.patch("core.utils.cache.monotonic", return_value=100):
+            self.cache.get_or_set("a", self.compute, timeout=10)
+        with mock.patch("core.utils.cache.monotonic", return_value=109):
+            self.assertEqual(self.cache.get_or_set("a", self.compute), 1)
+        with mock.patch("core.utils.cache.monotonic", return_value=111):
+            self.assertEqual(self.cache.get_or_set("a", self.compute), 2)
+
+    @override_settings(CATALOG_CACHE_TIMEOUT=60)
+    def test_entries_expire_without_a_bump(self):
+        with mock.patch("core.utils.cache.monotonic", return_value=100):
+            self.cache.get_or_set("a", self.compute)
+        with mock.patch("core.utils.cache.monotonic", return_value=159):
+            self.assertEqual(self.cache.get_or_set("a", self.compute), 1)
+        with mock.patch("core.utils.cache.monotonic", return_value=161):
+            self.assertEqual(self.cache.get_or_set("a", self.compute), 2)
+
+
+class SparseCountsTest(TestCase):
+    def setUp(self):
+        self.counts = SparseCounts()
+        self.counts.add([1, 5], [10, 11])
+        self.counts.add([5], [11, 12])
+
+    def test_top_reads_a_row_from_the_bytes(self):
+        data = self.counts.to_bytes()
+
+        self.assertEqual(SparseCounts.top(data, 5, 2), (2, [(11, 2), (10, 1)]))
+        self.assertEqual(SparseCounts.top(data, 1, 5), (1, [(10, 1), (11, 1)]))
+        self.assertEqual(SparseCounts.top(data, 3, 5), (0, []))
+        self.assertEqual(SparseCounts.top(b"", 3, 5), (0, []))
+
+    def test_round_trip_drops_emptied_cells_and_rows(self):
+        counts = SparseCounts.from_bytes(self.counts.to_bytes())
+        counts.add([1], [10, 11], sign=-1)
+        counts.add([5], [12], sign=-1)
+        data = counts.to_bytes()
+
+        self.assertEqual(SparseCounts.top(data, 1, 5), (0, []))
+        self.assertEqual(SparseCounts.top(data, 5, 5), (1, [(11, 2), (10, 1)]))
+        self.assertEqual(len(data), 4 * (2 + 1 + 1 + 2 + 2 + 2))
+
+
+class BucketTest(TestCase):
+    def test_truncate(self):
+        value = date(2022, 8, 18)
+        self.assertEqual(truncate(value, "day"), value)
+        self.assertEqual(truncate(value, "week"), date(2022, 8, 15))
+        self.assertEqual(truncate(value, "month"), date(2022, 8, 1))
+        self.assertEqual(truncate(value, "quarter"), date(2022, 7, 1))
+
+    def test_bucket_dates_cross_years(self):
+        self.assertEqual(
+            list(bucket_dates(date(2021, 11, 20), date(2022, 4, 1), "quarter")),
+            [date(2021, 10, 1), date(2022, 1, 1), date(2022, 4, 1)],
+        )
+        self.assertEqual(
+            list(bucket_dates(date(2021, 12, 31), date(2022, 1, 31), "month")),
+            [date(2021, 12, 1), date(2022, 1, 1)],
+        )
+
+    def test_labels(self):
+        value = date(2022, 8, 1)
+        self.assertEqual(bucket_label(value, "month"), "8-2022")
+        self.assertEqual(bucket_label(value, "quarter"), "Q3-2022")
+        self.assertEqual(bucket_label(value, "day"), "2022-08-01")
+
+    def test_fill_buckets(self):
+        january, february, march = date(2022, 1, 1), date(2022, 2, 1), date(2022, 3, 1)
+        values = {march: (1,), january: (2,)}
+
+        self.assertEqual(fill_buckets(values, "month"), [(january, 2), (march, 1)])
+        self.assertEqual(
+            fill_buckets(values, "month", january, date(2022, 3, 20)),
+            [(january, 2), (february, 0), (march, 1)],
+        )
+
+
+class ShapeTest(TestCase):
+    def setUp(self):
+        self.rows = [(1, 2021, None, 0), (2, 2021, "open", 3), (1, 2022, "done", 0)]
+
+    def test_columns(self):
+        data = shape(
+            self.rows,
+            labels=Column(0, 1, format="{}-{}".format),
+            status=Column(2, null="null"),
+            count=Column(3),
+        )
+
+        self.assertEqual(
+            data,
+            {
+                "labels": ["1-2021", "2-2021", "1-2022"],
+                "status": ["null", "open", "done"],
+                "count": [0, 3, 0],
+            },
+        )
+
+    def test_falsy_values_are_kept(self):
+        data = shape(self.rows, count=Column(3, null=-1))
+
+        self.assertEqual(data, {"count": [0, 3, 0]})
+
+    def test_no_rows(self):
+        self.assertEqual(shape([], data=Column(0)), {"data": []})
+
+
+def thread_name():
+    return threading.current_thread().name
+
+
+class RunConcurrentlyTest(TransactionTestCase):
+    def test_calls_run_on_the_pool_in_order(self):
+        results = run_concurrently([lambda i=i: (i, thread_name()) for i in range(5)])
+
+        self.assertEqual([i for i, name in results], list(range(5)))
+        for i, name in results:
+            self.assertTrue(name.startswith("analytics"))
+
+    @override_settings(ANALYTICS_QUERY_WORKERS=1)
+    def test_disabled_pool_runs_inline(self):
+        self.assertEqual(
+            run_concurrently([thread_name, thread_name]), [thread_name()] * 2
+        )
+
+
+class RunConcurrentlyInTransactionTest(TestCase):
+    def test_runs_inline(self):
+        # The pool's connections would not see the test's transaction.
+        self.assertEqual(
+            run_concurrently([thread_name, thread_name]), [thread_name()] * 2
+        )
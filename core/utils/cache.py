@@ -0,0 +1,184 @@
+from time import monotonic
+from uuid import uuid4
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.core.cache import caches
+from django.core.exceptions import ImproperlyConfigured
+from django.db import transaction
+
+# Backends whose entries only exist in the process that wrote them.
+LOCAL_BACKENDS = ("django.core.cache.backends.locmem.LocMemCache",)
+
+
+def require_shared_cache(alias="default"):
+    """Refuses to serve outside DEBUG on a per-process cache.
+
+    The analytics and catalog versions are bumped in the cache, so with
+    several workers a local cache only invalidates the worker that handled
+    the change, and the others keep serving stale data. Called by the WSGI
+    and ASGI entry points, not by management commands or tests.
+    """
+    if settings.DEBUG:
+        return
+    if settings.CACHES[alias]["BACKEND"] in LOCAL_BACKENDS:
+        raise ImproperlyConfigured(
+            "The %r cache is local to each process; set REDIS_URL so every "
+            "worker shares the cache versions, or run with DEBUG." % alias
+        )
+
+
+class OrgVersionedCache:
+    """Cache namespace per organization, invalidated by bumping its version.
+
+    Every entry is stored together with the version of its organization at
+    the time it was computed, and a hit needs both to match, so bump()
+    retires all of an organization's entries at once without knowing their
+    keys. The version and the entry are read with a single get_many. The
+    timeout bounds how long an entry survives a change that did not bump
+    the version.
+    """
+
+    def __init__(self, prefix, timeout=None, alias="default"):
+        self.prefix = prefix
+        self.timeout = timeout
+        self.alias = alias
+
+    @property
+    def cache(self):
+        return caches[self.alias]
+
+    def get_timeout(self):
+        if self.timeout is not None:
+            return self.timeout
+        return getattr(settings, "ANALYTICS_CACHE_TIMEOUT", 60 * 60)
+
+    def version_key(self, org_id):
+        return "%s:version:%s" % (self.prefix, org_id)
+
+    def entry_key(self, org_id, key):
+        return "%s:%s:%s" % (self.prefix, org_id, key)
+
+    def lookup(self, org_id, key):
+        """Returns (hit, data or None, version to store a computed entry
+        with)."""
+        version_key = self.version_key(org_id)
+        entry_key = self.entry_key(org_id, key)
+        values = self.cache.get_many([version_key, entry_key])
+        version = values.get(version_key)
+        entry = values.get(entry_key)
+        if version is not None and entry is not None and entry[0] == version:
+            return True, entry[1], version
+
+        if version is None:
+            version = self.create_version(org_id)
+        return False, None, version
+
+    def create_version(self, org_id):
+        version_key = self.version_key(org_id)
+        version = uuid4().hex
+        if not self.cache.add(version_key, version, timeout=None):
+            version = self.cache.get(version_key, version)
+        return version
+
+    def version(self, org_id):
+        """The organization's current version, which changes with every
+        invalidation of its entries."""
+        version = self.cache.get(self.version_key(org_id))
+        if version is None:
+            version = self.create_version(org_id)
+        return version
+
+    def store(self, org_id, key, version, data):
+        self.cache.set(
+            self.entry_key(org_id, key), (version, data), timeout=self.get_timeout()
+        )
+
+    def get_or_set(self, org_id, key, compute):
+        hit, data, version = self.lookup(org_id, key)
+        if not hit:
+            data = compute()
+            self.store(org_id, key, version, data)
+        return data
+
+    async def aget_or_set(self, org_id, key, compute):
+        """get_or_set() for async views; `compute` is a coroutine function."""
+        hit, data, version = await sync_to_async(self.lookup)(org_id, key)
+        if not hit:
+            data = await compute()
+            await sync_to_async(self.store)(org_id, key, version, data)
+        return data
+
+    def bump(self, org_id):
+        self.cache.set(self.version_key(org_id), uuid4().hex, timeout=None)
+
+    def invalidate(self, org_id):
+        # The second bump retires entries computed by concurrent requests
+        # that read the database before the change was committed.
+        self.bump(org_id)
+        transaction.on_commit(lambda: self.bump(org_id))
+
+
+class LocalVersionedCache:
+    """Process-local store for data that changes rarely and is shared by
+    every organization, such as the appliance catalog.
+
+    Entries live in a dict of this process, so a hit costs no
+    serialization, only reading the version from the shared cache. Each
+    entry remembers the version it was computed with; bump() retires all
+    of them in every process at once. The timeout bounds how long an entry
+    survives a change that did not bump the version, or a version that
+    was not shared.
+    """
+
+    def __init__(self, prefix, timeout=None, alias="default"):
+        self.prefix = prefix
+        self.timeout = timeout
+        self.alias = alias
+        self.entries = {}
+
+    def get_timeout(self):
+        if self.timeout is not None:
+            return self.timeout
+        return getattr(settings, "CATALOG_CACHE_TIMEOUT", 5 * 60)
+
+    @property
+    def cache(self):
+        return caches[self.alias]
+
+    @property
+    def version_key(self):
+        return "%s:version" % self.prefix
+
+    def version(self):
+        version = self.cache.get(self.version_key)
+        if version is None:
+            version = uuid4().hex
+            if not self.cache.add(self.version_key, version, timeout=None):
+                version = self.cache.get(self.version_key, version)
+        return version
+
+    def get_or_set(self, key, compute, timeout=None):
+        """`timeout` (seconds) replaces the default one, for data that
+        depends on more than what bumps the version."""
+        version = self.version()
+        entry = self.entries.get(key)
+        now = monotonic()
+        if entry is not None and entry[0] == version and entry[2] > now:
+            return entry[1]
+        data = compute()
+        if timeout is None:
+            timeout = self.get_timeout()
+        self.entries[key] = (version, data, now + timeout)
+        return data
+
+    def bump(self):
+        self.cache.set(self.version_key, uuid4().hex, timeout=None)
+
+    def invalidate(self):
+        self.bump()
+        transaction.on_commit(self.bump)
+
+
+analytics_cache = OrgVersionedCache("analytics")
+catalog_cache = LocalVersionedCache("catalog")
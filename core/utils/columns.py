@@ -0,0 +1,36 @@
+class Column:
+    """One output series of shape(), read from fields of every row.
+
+    `fields` are positions in the row tuples. A single field is copied as
+    is, with None replaced by `null`; `format` is called with the values
+    of all the fields and builds labels out of several of them.
+    """
+
+    def __init__(self, *fields, format=None, null=None):
+        self.fields = fields
+        self.format = format
+        self.null = null
+
+    def build(self, columns):
+        values = [columns[field] for field in self.fields]
+        if self.format is not None:
+            series = list(map(self.format, *values))
+        else:
+            series = list(values[0])
+        if self.null is not None:
+            series = [self.null if value is None else value for value in series]
+        return series
+
+
+def shape(rows, **columns):
+    """Builds {name: series} out of values_list() tuples.
+
+    The rows are transposed once and every Column then works on whole
+    columns, so no per-row dict is created:
+
+        shape(rows, labels=Column(0, null="null"), data=Column(1))
+    """
+    transposed = list(zip(*rows))
+    if not transposed:
+        return {name: [] for name in columns}
+    return {name: column.build(transposed) for name, column in columns.items()}
@@ -0,0 +1,60 @@
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.db import close_old_connections, connection
+
+_executor = None
+
+
+def get_workers():
+    return getattr(settings, "ANALYTICS_QUERY_WORKERS", 4)
+
+
+def get_executor():
+    global _executor
+    if _executor is None:
+        _executor = ThreadPoolExecutor(
+            max_workers=get_workers(),
+            thread_name_prefix="analytics",
+        )
+    return _executor
+
+
+def use_executor(calls):
+    # Worker threads have their own connections, which can not see what
+    # the caller's open transaction has not committed yet.
+    return len(calls) > 1 and get_workers() > 1 and not connection.in_atomic_block
+
+
+def run_call(call):
+    # Worker threads outlive requests, so their connections are recycled
+    # the way request_started/request_finished do it for request threads.
+    close_old_connections()
+    try:
+        return call()
+    finally:
+        close_old_connections()
+
+
+def run_concurrently(calls):
+    """Runs independent callables, each typically one query, on the bounded
+    analytics pool and returns their results in order.
+
+    The calls run inline when there is a single one, when the pool is
+    disabled with ANALYTICS_QUERY_WORKERS <= 1 or inside a transaction.
+    """
+    if not use_executor(calls):
+        return [call() for call in calls]
+    return list(get_executor().map(run_call, calls))
+
+
+async def arun_concurrently(calls):
+    """Awaitable run_concurrently() for async views."""
+    if not await sync_to_async(use_executor)(calls):
+        return [await sync_to_async(call)() for call in calls]
+    loop = asyncio.get_running_loop()
+    return await asyncio.gather(
+        *(loop.run_in_executor(get_executor(), run_call, call) for call in calls)
+    )
@@ -0,0 +1,124 @@
+from datetime import date, timedelta
+from itertools import islice
+
+from django.db.models import Func, IntegerField
+from django.db.models.functions import TruncDay, TruncMonth, TruncQuarter, TruncWeek
+from rest_framework import serializers
+
+BUCKETS = {
+    "day": TruncDay,
+    "week": TruncWeek,
+    "month": TruncMonth,
+    "quarter": TruncQuarter,
+}
+
+
+class DaysBetween(Func):
+    """Whole days from the second date expression to the first one.
+
+    PostgreSQL subtracts dates into days already; SQLite goes through
+    julian days.
+    """
+
+    arity = 2
+    arg_joiner = " - "
+    template = "(%(expressions)s)"
+    output_field = IntegerField()
+
+    def as_sqlite(self, compiler, connection, **extra_context):
+        clone = self.copy()
+        clone.set_source_expressions(
+            [Func(date, function="JULIANDAY") for date in self.get_source_expressions()]
+        )
+        return super(DaysBetween, clone).as_sql(
+            compiler, connection, template="CAST(%(expressions)s AS INTEGER)"
+        )
+
+
+def truncate(value, bucket):
+    """Python counterpart of the Trunc function of `bucket`."""
+    if bucket == "week":
+        return value - timedelta(days=value.weekday())
+    if bucket == "month":
+        return value.replace(day=1)
+    if bucket == "quarter":
+        return value.replace(month=(value.month - 1) // 3 * 3 + 1, day=1)
+    return value
+
+
+def next_bucket(value, bucket):
+    if bucket == "day":
+        return value + timedelta(days=1)
+    if bucket == "week":
+        return value + timedelta(days=7)
+    months = 3 if bucket == "quarter" else 1
+    month = value.month - 1 + months
+    return value.replace(year=value.year + month // 12, month=month % 12 + 1)
+
+
+def bucket_dates(start, end, bucket):
+    current = truncate(start, bucket)
+    while current <= end:
+        yield current
+        current = next_bucket(current, bucket)
+
+
+def bucket_label(value, bucket):
+    if bucket == "month":
+        return "%d-%d" % (value.month, value.year)
+    if bucket == "quarter":
+        return "Q%d-%d" % ((value.month - 1) // 3 + 1, value.year)
+    return value.isoformat()
+
+
+def fill_buckets(values, bucket, start=None, end=None, empty=(0,)):
+    """Lays {bucket date: tuple of values} out as (bucket date, *values) rows.
+
+    With a start every bucket from start to end gets a row and the ones
+    missing from `values` get `empty`; without one only the given buckets
+    do.
+    """
+    if start is None:
+        dates = sorted(values)
+    else:
+        dates = bucket_dates(start, end, bucket)
+    return [(value,) + values.get(value, empty) for value in dates]
+
+
+class DateRangeSerializer(serializers.Serializer):
+    """?from=&to=&bucket= of the analytics endpoints.
+
+    `to` defaults to today once `from` is given. The range may not span
+    more than max_buckets buckets.
+    """
+
+    max_buckets = 1000
+
+    to = serializers.DateField(required=False)
+    bucket = serializers.ChoiceField(choices=list(BUCKETS), required=False)
+
+    def get_fields(self):
+        fields = super().get_fields()
+        # "from" is a keyword and cannot be declared as a class attribute.
+        fields["from"] = serializers.DateField(required=False)
+        return fields
+
+    def validate(self, attrs):
+        start = attrs.get("from")
+        if start is None:
+            return attrs
+        end = attrs.setdefault("to", date.today())
+        if start > end:
+            raise serializers.ValidationError({"from": ["Must not be after to."]})
+        bucket = attrs.get("bucket", "month")
+        buckets = islice(bucket_dates(start, end, bucket), self.max_buckets + 1)
+        if sum(1 for value in buckets) > self.max_buckets:
+            raise serializers.ValidationError(
+                {"bucket": ["Range spans more than %d buckets." % self.max_buckets]}
+            )
+        return attrs
+
+    def cache_key(self):
+        return "%s:%s:%s" % tuple(
+            self.validated_data.get(name) for name in ("from", "to", "bucket")
+        )
@@ -0,0 +1,49 @@
+from functools import wraps
+from hashlib import md5
+
+from django.db.models import Count, Max
+from django.utils.cache import get_conditional_response
+
+
+def make_etag(request, *parts, weak=False):
+    """Hashes the parts a representation depends on into an ETag.
+
+    The full path and the negotiated media type are always part of the
+    hash, so different pages, fieldsets and formats never share a tag.
+    """
+    renderer = getattr(request, "accepted_renderer", None)
+    key = (request.get_full_path(), getattr(renderer, "media_type", None)) + parts
+    digest = md5(repr(key).encode()).hexdigest()
+    return ('W/"%s"' if weak else '"%s"') % digest
+
+
+def fingerprint(queryset, *version_fields):
+    """Row count and latest value of each version field, in one aggregate."""
+    aggregates = [Count("pk")] + [Max(field) for field in version_fields]
+    return tuple(queryset.aggregate(*aggregates).values())
+
+
+def conditional(etag_func):
+    """Answers conditional GETs on an APIView handler.
+
+    etag_func(request, *args, **kwargs) runs after authentication and
+    returns the tag of the current representation, or None when the object
+    is not visible to the user so the handler answers as usual. A matching
+    If-None-Match returns 304 without running the handler.
+    """
+
+    def decorator(handler):
+        @wraps(handler)
+        def inner(view, request, *args, **kwargs):
+            etag = etag_func(request, *args, **kwargs)
+            response = get_conditional_response(request, etag=etag)
+            if response is None:
+                response = handler(view, request, *args, **kwargs)
+            succeeded = 200 <= response.status_code < 300
+            if etag and (succeeded or response.status_code == 304):
+                response.headers.setdefault("ETag", etag)
+            return response
+
+        return inner
+
+    return decorator
@@ -0,0 +1,68 @@
+import csv
+import json
+
+from django.core.serializers.json import DjangoJSONEncoder
+from rest_framework.renderers import BaseRenderer
+
+
+class Echo:
+    """Pseudo-buffer handing back what csv.writer writes to it."""
+
+    def write(self, value):
+        return value
+
+
+class StreamingRenderer(BaseRenderer):
+    """Renderer for exports that are streamed rather than built in memory.
+
+    Views pass a header and an iterable of row tuples to stream() and wrap
+    the result in a StreamingHttpResponse. Rows are grouped into chunks so
+    the server is not handed one tiny write per row. render() only formats
+    the small payloads DRF produces by itself, such as errors.
+    """
+
+    charset = "utf-8"
+    rows_per_chunk = 500
+
+    def render_header(self, header):
+        return ""
+
+    def render_row(self, header, row):
+        raise NotImplementedError
+
+    def stream(self, header, rows):
+        chunk = [self.render_header(header)]
+        for row in rows:
+            chunk.append(self.render_row(header, row))
+            if len(chunk) >= self.rows_per_chunk:
+                yield "".join(chunk)
+                chunk = []
+        yield "".join(chunk)
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if data is None:
+            return b""
+        content = "".join(self.stream(list(data), [list(data.values())]))
+        return content.encode(self.charset)
+
+
+class CSVRenderer(StreamingRenderer):
+    media_type = "text/csv"
+    format = "csv"
+
+    def __init__(self):
+        self.writer = csv.writer(Echo())
+
+    def render_header(self, header):
+        return self.writer.writerow(header)
+
+    def render_row(self, header, row):
+        return self.writer.writerow(row)
+
+
+class NDJSONRenderer(StreamingRenderer):
+    media_type = "application/x-ndjson"
+    format = "ndjson"
+
+    def render_row(self, header, row):
+        return json.dumps(dict(zip(header, row)), cls=DjangoJSONEncoder) + "\n"
@@ -0,0 +1,133 @@
+import json
+from base64 import urlsafe_b64decode, urlsafe_b64encode
+from binascii import Error as BinasciiError
+
+from django.core.exceptions import ValidationError
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db.models import Q
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import BasePagination
+from rest_framework.utils.urls import remove_query_param, replace_query_param
+
+
+class KeysetPagination(BasePagination):
+    """Cursor pagination that seeks on a unique ordering instead of OFFSET.
+
+    The ordering must end with a unique column (usually "id"), so every row
+    has a distinct position. Cursors are opaque and no total count is run,
+    so every page costs the same whatever its depth.
+    """
+
+    mode_query_param = "pagination"
+    cursor_query_param = "cursor"
+    limit_query_param = "limit"
+    offset_query_param = "offset"
+    default_limit = 16
+    max_limit = 1000
+    invalid_cursor_message = "Invalid cursor"
+
+    def __init__(self, ordering):
+        self.ordering = tuple(ordering)
+
+    @classmethod
+    def is_requested(cls, request):
+        return (
+            request.query_params.get(cls.mode_query_param) == "cursor"
+            or cls.cursor_query_param in request.query_params
+        )
+
+    def get_limit(self, request):
+        try:
+            limit = int(request.query_params[self.limit_query_param])
+        except (KeyError, ValueError):
+            return self.default_limit
+        if limit <= 0:
+            return self.default_limit
+        return min(limit, self.max_limit)
+
+    def decode_cursor(self, request):
+        encoded = request.query_params.get(self.cursor_query_param)
+        if not encoded:
+            return None, False
+        try:
+            payload = json.loads(urlsafe_b64decode(encoded.encode("ascii")))
+            values, reverse = payload["v"], bool(payload["r"])
+        except (BinasciiError, UnicodeError, ValueError, KeyError, TypeError):
+            raise NotFound(self.invalid_cursor_message)
+        if not isinstance(values, list) or len(values) != len(self.ordering):
+            raise NotFound(self.invalid_cursor_message)
+        return values, reverse
+
+    def coerce_values(self, model, values):
+        """Converts the cursor values to the types of the ordering fields, so
+        a tampered cursor is rejected instead of failing in the query."""
+        try:
+            coerced = [
+                model._meta.get_field(field).to_python(value)
+                for field, value in zip(self.ordering, values)
+            ]
+        except (ValidationError, TypeError, ValueError):
+            raise NotFound(self.invalid_cursor_message)
+        if any(value is None for value in coerced):
+            raise NotFound(self.invalid_cursor_message)
+        return coerced
+
+    def encode_cursor(self, values, reverse):
+        payload = json.dumps({"v": values, "r": int(reverse)}, cls=DjangoJSONEncoder)
+        encoded = urlsafe_b64encode(payload.encode("ascii")).decode("ascii")
+        url = remove_query_param(self.base_url, self.offset_query_param)
+        return replace_query_param(url, self.cursor_query_param, encoded)
+
+    def get_position(self, instance):
+        return [getattr(instance, field) for field in self.ordering]
+
+    def get_seek_filter(self, values, reverse):
+        # (a, b, c) > (x, y, z) written out as a OR of equality prefixes,
+        # which every backend can resolve with an index range scan.
+        lookup = "lt" if reverse else "gt"
+        condition = Q()
+        for index, field in enumerate(self.ordering):
+            prefix = {self.ordering[i]: values[i] for i in range(index)}
+            prefix["%s__%s" % (field, lookup)] = values[index]
+            condition |= Q(**prefix)
+        return condition
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.base_url = request.build_absolute_uri()
+        self.limit = self.get_limit(request)
+        values, reverse = self.decode_cursor(request)
+
+        if reverse:
+            queryset = queryset.order_by(*["-%s" % field for field in self.ordering])
+        else:
+            queryset = queryset.order_by(*self.ordering)
+        if values is not None:
+            values = self.coerce_values(queryset.model, values)
+            queryset = queryset.filter(self.get_seek_filter(values, reverse))
+
+        results = list(queryset[: self.limit + 1])
+        has_more = len(results) > self.limit
+        results = results[: self.limit]
+        if reverse:
+            results.reverse()
+
+        if reverse:
+            self.has_next = values is not None
+            self.has_previous = has_more
+        else:
+            self.has_next = has_more
+            self.has_previous = values is not None
+
+        self.first_position = self.get_position(results[0]) if results else values
+        self.last_position = self.get_position(results[-1]) if results else values
+        return results
+
+    def get_next_link(self):
+        if not self.has_next or self.last_position is None:
+            return None
+        return self.encode_cursor(self.last_position, reverse=False)
+
+    def get_previous_link(self):
+        if not self.has_previous or self.first_position is None:
+            return None
+        return self.encode_cursor(self.first_position, reverse=True)
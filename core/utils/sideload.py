@@ -0,0 +1,80 @@
+from django.db.models import Prefetch
+from rest_framework.renderers import JSONRenderer
+
+
+class NormalizedJSONRenderer(JSONRenderer):
+    """JSON renderer selected when the client asks for the normalized shape.
+
+    Negotiated with `Accept: application/vnd.appliance-service.normalized+json`
+    or with `?format=normalized`.
+    """
+
+    media_type = "application/vnd.appliance-service.normalized+json"
+    format = "normalized"
+
+
+def is_normalized(request):
+    renderer = getattr(request, "accepted_renderer", None)
+    return renderer is not None and renderer.format == NormalizedJSONRenderer.format
+
+
+class Sideloader:
+    """Builds the top-level `included` map of a normalized response.
+
+    `relations` maps a relation of the rows to the key it is included under
+    and the serializer used to render it, e.g.
+    {"customer": ("customers", CustomerSerializer)}. Relations sharing a key
+    are merged, so each referenced object is fetched and serialized once
+    per response whatever the number of rows pointing at it.
+    """
+
+    def __init__(self, model, relations):
+        self.model = model
+        self.relations = relations
+
+    @staticmethod
+    def get_many_to_many(model, names):
+        return [name for name in names if model._meta.get_field(name).many_to_many]
+
+    @classmethod
+    def prefetch_ids(cls, queryset, names):
+        """Prefetches only the primary keys of the given many-to-many fields."""
+        return queryset.prefetch_related(
+            *[
+                Prefetch(
+                    name,
+                    queryset=queryset.model._meta.get_field(
+                        name
+                    ).related_model.objects.only("pk"),
+                )
+                for name in cls.get_many_to_many(queryset.model, names)
+            ]
+        )
+
+    def setup_eager_loading(self, queryset):
+        return self.prefetch_ids(queryset, self.relations.keys())
+
+    def collect_ids(self, rows):
+        ids = {}
+        for name, (key, serializer_class) in self.relations.items():
+            field = self.model._meta.get_field(name)
+            key_ids = ids.setdefault(key, (serializer_class, set()))[1]
+            for row in rows:
+                if field.many_to_many:
+                    key_ids.update(related.pk for related in getattr(row, name).all())
+                else:
+                    value = getattr(row, field.attname)
+                    if value is not None:
+                        key_ids.add(value)
+        return ids
+
+    def get_included(self, rows):
+        included = {}
+        for key, (serializer_class, ids) in self.collect_ids(rows).items():
+            model = serializer_class.Meta.model
+            queryset = self.prefetch_ids(
+                model.objects.filter(pk__in=ids), serializer_class.Meta.fields
+            )
+            data = serializer_class(queryset, many=True).data
+            included[key] = {str(item["id"]): item for item in data}
+        return included
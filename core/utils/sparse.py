@@ -0,0 +1,106 @@
+import heapq
+import sys
+from array import array
+from bisect import bisect_left
+from collections import Counter, defaultdict
+
+
+class SparseCounts:
+    """Sparse count matrix with a total per row.
+
+    It is updated as {row: Counter({col: count})} and stored as packed
+    little-endian uint32 arrays in CSR layout: a header with the number of
+    rows and cells, then row ids, row totals, row offsets, column ids and
+    counts. top() reads one row straight from the stored bytes.
+    """
+
+    typecode = "I"
+
+    def __init__(self):
+        self.cells = defaultdict(Counter)
+        self.totals = Counter()
+
+    def add(self, rows, cols, sign=1):
+        """Counts one observation of every row together with every col."""
+        for row in rows:
+            self.totals[row] += sign
+            for col in cols:
+                self.cells[row][col] += sign
+
+    @classmethod
+    def pack(cls, values):
+        packed = array(cls.typecode, values)
+        if sys.byteorder == "big":
+            packed.byteswap()
+        return packed.tobytes()
+
+    @classmethod
+    def unpack(cls, data, start, count):
+        size = array(cls.typecode).itemsize
+        values = array(cls.typecode)
+        values.frombytes(data[start * size : (start + count) * size])
+        if sys.byteorder == "big":
+            values.byteswap()
+        return values
+
+    def to_bytes(self):
+        row_ids, totals, offsets, cols, counts = [], [], [0], [], []
+        for row in sorted(row for row, total in self.totals.items() if total > 0):
+            row_ids.append(row)
+            totals.append(self.totals[row])
+            for col, count in sorted(self.cells[row].items()):
+                if count > 0:
+                    cols.append(col)
+                    counts.append(count)
+            offsets.append(len(cols))
+        return self.pack(
+            [len(row_ids), len(cols)] + row_ids + totals + offsets + cols + counts
+        )
+
+    @classmethod
+    def layout(cls, data):
+        """Number of rows and cells, then the start of each array in items."""
+        rows, cells = cls.unpack(data, 0, 2)
+        ids = 2
+        totals = ids + rows
+        offsets = totals + rows
+        cols = offsets + rows + 1
+        counts = cols + cells
+        return rows, cells, ids, totals, offsets, cols, counts
+
+    @classmethod
+    def from_bytes(cls, data):
+        matrix = cls()
+        if not data:
+            return matrix
+        rows, cells, ids, totals, offsets, cols, counts = cls.layout(data)
+        row_ids = cls.unpack(data, ids, rows)
+        row_totals = cls.unpack(data, totals, rows)
+        row_offsets = cls.unpack(data, offsets, rows + 1)
+        col_ids = cls.unpack(data, cols, cells)
+        col_counts = cls.unpack(data, counts, cells)
+        for index, row in enumerate(row_ids):
+            matrix.totals[row] = row_totals[index]
+            start, end = row_offsets[index], row_offsets[index + 1]
+            matrix.cells[row] = Counter(
+                dict(zip(col_ids[start:end], col_counts[start:end]))
+            )
+        return matrix
+
+    @classmethod
+    def top(cls, data, row, k):
+        """(row total, up to k (col, count) pairs with the highest counts)."""
+        if not data:
+            return 0, []
+        rows, cells, ids, totals, offsets, cols, counts = cls.layout(data)
+        row_ids = cls.unpack(data, ids, rows)
+        index = bisect_left(row_ids, row)
+        if index == rows or row_ids[index] != row:
+            return 0, []
+        total = cls.unpack(data, totals + index, 1)[0]
+        start, end = cls.unpack(data, offsets + index, 2)
+        pairs = zip(
+            cls.unpack(data, cols + start, end - start),
+            cls.unpack(data, counts + start, end - start),
+        )
+        return total, heapq.nlargest(k, pairs, key=lambda pair: (pair[1], -pair[0]))
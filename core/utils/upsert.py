@@ -0,0 +1,44 @@
+from django.db import connection
+
+
+def increment(model, rows, unique, counters):
+    """Inserts rows, or adds their counters to the existing row with the same
+    unique fields, in one INSERT ... ON CONFLICT DO UPDATE statement.
+
+    Rows are dicts of field attnames. The statement is atomic per row, so
+    concurrent first writes of a key cannot both insert it. PostgreSQL and
+    SQLite 3.24+ support it.
+    """
+    if not rows:
+        return
+    fields = [model._meta.get_field(name) for name in rows[0]]
+    quote = connection.ops.quote_name
+    table = quote(model._meta.db_table)
+    conflict = "ON CONFLICT (%s) DO UPDATE SET %s" % (
+        ", ".join(quote(model._meta.get_field(name).column) for name in unique),
+        ", ".join(
+            "{column} = {table}.{column} + EXCLUDED.{column}".format(
+                column=quote(model._meta.get_field(name).column), table=table
+            )
+            for name in counters
+        ),
+    )
+    placeholders = "(%s)" % ", ".join(["%s"] * len(fields))
+    batch_size = max(connection.ops.bulk_batch_size(fields, rows), 1)
+    with connection.cursor() as cursor:
+        for start in range(0, len(rows), batch_size):
+            batch = rows[start : start + batch_size]
+            cursor.execute(
+                "INSERT INTO %s (%s) VALUES %s %s"
+                % (
+                    table,
+                    ", ".join(quote(field.column) for field in fields),
+                    ", ".join([placeholders] * len(batch)),
+                    conflict,
+                ),
+                [
+                    field.get_db_prep_save(row[field.attname], connection)
+                    for row in batch
+                    for field in fields
+                ],
+            )
@@ -0,0 +1,31 @@
+from functools import partial
+
+from django.db.models import Count
+
+from core.utils.columns import Column, shape
+from core.utils.dates import BUCKETS, bucket_label, fill_buckets
+from .models import Customer
+
+
+def customer_history(org, start=None, end=None, bucket="month"):
+    customers = Customer.objects.filter(owner=org)
+    if start is not None:
+        customers = customers.filter(created_at__gte=start)
+    if end is not None:
+        customers = customers.filter(created_at__lte=end)
+    counts = {
+        value: (count,)
+        for value, count in customers.annotate(bucket=BUCKETS[bucket]("created_at"))
+        .values("bucket")
+        .annotate(count=Count("id"))
+        .values_list("bucket", "count")
+        .order_by()
+    }
+    data = shape(
+        fill_buckets(counts, bucket, start, end),
+        data=Column(1),
+        labels=Column(0, format=partial(bucket_label, bucket=bucket)),
+    )
+    # created_at is never null, so the bucket counts add up to the total.
+    data["total"] = sum(data["data"])
+    return data
@@ -2,8 +2,10 @@ import email
 from django.db import models
 from django.contrib.auth.models import User
 from django.dispatch import receiver
-from django.db.models.signals import post_save
+from django.db.models.signals import m2m_changed, post_delete, post_save, pre_delete
+from django.utils import timezone
 from datetime import date
+from core.utils.cache import analytics_cache
 
 # Create your models here.
 class Address(models.Model):
@@ -33,11 +35,55 @@ class Customer(models.Model):
     phone1 = models.CharField(max_length=30, null=True, blank=True)
     phone2 = models.CharField(max_length=30, null=True, blank=True)
     created_at = models.DateField(default=date.today())
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        indexes = [
+            models.Index(
+                fields=["owner", "created_at"], name="customer_owner_created_idx"
+            ),
+            models.Index(
+                fields=["owner", "updated_at"], name="customer_owner_updated_idx"
+            ),
+        ]
 
     def has_object_permission(self, request):
         return self.owner == request.user.profile.org
 
 
+@receiver(m2m_changed, sender=Customer.addresses.through)
+def touch_customer_addresses(sender, instance, action, reverse, pk_set, **kwargs):
+    if action not in ("post_add", "post_remove", "pre_clear"):
+        return
+    if not reverse:
+        customers = Customer.objects.filter(pk=instance.pk)
+    elif pk_set:
+        customers = Customer.objects.filter(pk__in=pk_set)
+    else:
+        customers = Customer.objects.filter(addresses=instance)
+    customers.update(updated_at=timezone.now())
+
+
+@receiver(post_save, sender=Address)
+@receiver(pre_delete, sender=Address)
+def touch_address_customers(sender, instance, **kwargs):
+    Customer.objects.filter(addresses=instance).update(updated_at=timezone.now())
+
+
+@receiver(post_save, sender=Organization)
+def invalidate_organization_analytics(sender, instance, **kwargs):
+    # Ids can be reused, so a new organization must not see cached entries
+    # left behind by a deleted one, and the version of a renamed one is part
+    # of the ETags of the services and historics that nest it.
+    analytics_cache.invalidate(instance.pk)
+
+
+@receiver(post_save, sender=Customer)
+@receiver(post_delete, sender=Customer)
+def invalidate_customer_analytics(sender, instance, **kwargs):
+    analytics_cache.invalidate(instance.owner_id)
+
+
 class Profile(models.Model):
     user = models.OneToOneField(User, on_delete=models.CASCADE)
     org = models.ForeignKey(
@@ -1,7 +1,7 @@
 from locale import currency
 from rest_framework import serializers
 
-from profiles.models import Address, Customer
+from profiles.models import Address, Customer, Organization
 
 
 class CustomerSerializer(serializers.ModelSerializer):
@@ -14,3 +14,9 @@ class AddressSerializer(serializers.ModelSerializer):
     class Meta:
         model = Address
         fields = ["id","number", "street", "neighborhood", "city"]
+
+
+class OrganizationSerializer(serializers.ModelSerializer):
+    class Meta:
+        model = Organization
+        fields = ["id", "name"]
@@ -1,14 +1,18 @@
 from datetime import date, timedelta
 from django import views
+from django.db import connection
 from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
 from django.urls import reverse
 from django.contrib.auth.models import User
 from rest_framework.test import APIClient
 import io
+import json
+from base64 import urlsafe_b64encode
 from rest_framework.parsers import JSONParser
 
 from profiles.models import Address, Customer
-from profiles.tests.factories import CustomerFactory
+from profiles.tests.factories import AddressFactory, CustomerFactory, UserFactory
 
 
 class TestCustomerView(TestCase):
@@ -113,6 +117,199 @@ class TestCustomerView(TestCase):
         self.assertEqual(response.status_code, 401)
 
 
+class TestCustomerCursorListView(TestCase):
+    def setUp(self):
+        self.user1 = User.objects.create_user("root1", "email1@exemple.com", "root")
+        self.client = APIClient()
+        self.client.force_authenticate(user=self.user1)
+
+        self.customers = []
+        for days in (3, 1, 1, 2, 0):
+            self.customers.append(
+                CustomerFactory(
+                    owner=self.user1.profile.org,
+                    created_at=date.today() - timedelta(days=days),
+                )
+            )
+        self.ordered = sorted(self.customers, key=lambda c: (c.created_at, c.id))
+
+    def get_page(self, url):
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        stream = io.BytesIO(response.content)
+        return JSONParser().parse(stream)
+
+    def test_first_cursor_page_is_ordered_by_creation_date_and_id(self):
+        data = self.get_page(
+            "%s?pagination=cursor&limit=2" % reverse("profiles:customer_list")
+        )
+
+        self.assertEqual(
+            [c["id"] for c in data["results"]], [c.id for c in self.ordered[:2]]
+        )
+        self.assertIsNone(data["previous"])
+        self.assertIn("cursor=", data["next"])
+        self.assertNotIn("count", data)
+
+    def test_follow_next_cursors_through_every_customer(self):
+        url = "%s?pagination=cursor&limit=2" % reverse("profiles:customer_list")
+        ids = []
+        while url:
+            data = self.get_page(url)
+            ids += [c["id"] for c in data["results"]]
+            url = data["next"]
+
+        self.assertEqual(ids, [c.id for c in self.ordered])
+
+    def test_previous_cursor_returns_the_previous_page(self):
+        first = self.get_page(
+            "%s?pagination=cursor&limit=2" % reverse("profiles:customer_list")
+        )
+        second = self.get_page(first["next"])
+        back = self.get_page(second["previous"])
+
+        self.assertEqual(back["results"], first["results"])
+        self.assertIsNone(back["previous"])
+
+    def test_invalid_cursor_returns_not_found(self):
+        response = self.client.get(
+            "%s?cursor=not-a-cursor" % reverse("profiles:customer_list")
+        )
+        self.assertEqual(response.status_code, 404)
+
+    def test_tampered_cursor_values_return_not_found(self):
+        for values in (["notadate", 1], [None, None], [{}, "x"]):
+            cursor = urlsafe_b64encode(
+                json.dumps({"v": values, "r": 0}).encode("ascii")
+            ).decode("ascii")
+            response = self.client.get(
+                "%s?cursor=%s" % (reverse("profiles:customer_list"), cursor)
+            )
+            self.assertEqual(response.status_code, 404, values)
+
+    def test_cursor_page_runs_no_count_or_offset_query(self):
+        first = self.get_page(
+            "%s?pagination=cursor&limit=2" % reverse("profiles:customer_list")
+        )
+        with CaptureQueriesContext(connection) as context:
+            self.client.get(first["next"])
+
+        # The only aggregate is the ETag fingerprint; the page itself is
+        # fetched without a count or an offset.
+        sql = " ".join(
+            query["sql"]
+            for query in context.captured_queries
+            if "pk__count" not in query["sql"]
+        )
+        self.assertNotIn("COUNT(", sql)
+        self.assertNotIn("OFFSET", sql)
+
+
+class TestCustomerNormalizedListView(TestCase):
+    def setUp(self):
+        self.user1 = User.objects.create_user("root1", "email1@exemple.com", "root")
+        self.client = APIClient()
+        self.client.force_authenticate(user=self.user1)
+
+        self.address = AddressFactory()
+        self.customer1 = CustomerFactory(
+            owner=self.user1.profile.org, addresses=(self.address,)
+        )
+        self.customer2 = CustomerFactory(
+            owner=self.user1.profile.org, addresses=(self.address, AddressFactory())
+        )
+
+    def test_list_customers_in_normalized_format(self):
+        response = self.client.get(
+            "%s?limit=10&offset=0&format=normalized" % reverse("profiles:customer_list")
+        )
+
+        self.assertEqual(response.status_code, 200)
+        data = response.json()
+        self.assertEqual(len(data["results"]), 2)
+        self.assertEqual(data["results"][0]["owner"], self.user1.profile.org.id)
+
+        included = data["included"]
+        self.assertEqual(
+            list(included["organizations"]), [str(self.user1.profile.org.id)]
+        )
+        self.assertEqual(len(included["addresses"]), 2)
+        self.assertEqual(
+            included["addresses"][str(self.address.id)]["street"], self.address.street
+        )
+
+    def test_default_format_has_no_included_map(self):
+        response = self.client.get(
+            "%s?limit=10&offset=0" % reverse("profiles:customer_list")
+        )
+        self.assertNotIn("included", response.json())
+
+
+class TestCustomerETag(TestCase):
+    def setUp(self):
+        self.user1 = User.objects.create_user("root1", "email1@exemple.com", "root")
+        self.user2 = User.objects.create_user("root2", "email2@exemple.com", "root")
+        self.client = APIClient()
+        self.client.force_authenticate(self.user1)
+
+        self.customer = CustomerFactory(owner=self.user1.profile.org)
+        self.other = CustomerFactory(owner=self.user2.profile.org)
+        self.detail_url = reverse(
+            "profiles:customer_detail", kwargs={"pk": self.customer.id}
+        )
+        self.list_url = "%s?limit=16" % reverse("profiles:customer_list")
+
+    def test_detail_returns_304_for_matching_etag(self):
+        etag = self.client.get(self.detail_url)["ETag"]
+        response = self.client.get(self.detail_url, HTTP_IF_NONE_MATCH=etag)
+
+        self.assertRegex(etag, r'^"[0-9a-f]+"$')
+        self.assertEqual(response.status_code, 304)
+
+    def test_detail_etag_changes_on_update(self):
+        etag = self.client.get(self.detail_url)["ETag"]
+        self.client.put(
+            self.detail_url,
+            {"name": "Renamed", "owner": self.user1.profile.org.id},
+            format="json",
+        )
+        response = self.client.get(self.detail_url, HTTP_IF_NONE_MATCH=etag)
+
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response["ETag"], etag)
+
+    def test_detail_etag_changes_when_addresses_change(self):
+        etag = self.client.get(self.detail_url)["ETag"]
+        self.client.post(
+            reverse("profiles:customer_address_list", kwargs={"pk": self.customer.id}),
+            {"number": "1", "street": "street", "neighborhood": "center"},
+            format="json",
+        )
+
+        response = self.client.get(self.detail_url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+
+    def test_other_org_detail_is_forbidden_without_etag(self):
+        url = reverse("profiles:customer_detail", kwargs={"pk": self.other.id})
+        response = self.client.get(url, HTTP_IF_NONE_MATCH="*")
+
+        self.assertEqual(response.status_code, 403)
+        self.assertFalse(response.has_header("ETag"))
+
+    def test_list_weak_etag_changes_on_create_and_delete(self):
+        first = self.client.get(self.list_url)["ETag"]
+        self.assertEqual(
+            self.client.get(self.list_url, HTTP_IF_NONE_MATCH=first).status_code, 304
+        )
+        CustomerFactory(owner=self.user1.profile.org)
+        second = self.client.get(self.list_url)["ETag"]
+        self.customer.delete()
+        third = self.client.get(self.list_url)["ETag"]
+
+        self.assertTrue(first.startswith('W/"'))
+        self.assertEqual(len({first, second, third}), 3)
+
+
 class TestCustomerDetailView(TestCase):
     def setUp(self):
         self.user1 = User.objects.create_user("root1", "email1@exemple.com", "root")
@@ -846,4 +1043,42 @@ class TestCustomerAddressDetailView(TestCase):
 
 class CustomerHistoryTest(TestCase):
     def setUp(self):
-        pass
+        self.user1 = UserFactory()
+        self.user1Client = APIClient()
+        self.user1Client.force_authenticate(user=self.user1)
+        for created_at in (
+            date(2022, 1, 3),
+            date(2022, 1, 3),
+            date(2022, 1, 5),
+            date(2022, 3, 1),
+        ):
+            CustomerFactory(owner=self.user1.profile.org, created_at=created_at)
+        CustomerFactory(created_at=date(2022, 1, 4))
+
+    def history(self, query=""):
+        response = self.user1Client.get(reverse("profiles:customer_history") + query)
+        self.assertEqual(response.status_code, 200)
+        return response.json()
+
+    def test_month_buckets(self):
+        data = self.history()
+
+        self.assertEqual(data["labels"], ["1-2022", "3-2022"])
+        self.assertEqual(data["data"], [3, 1])
+        self.assertEqual(data["total"], 4)
+
+    def test_range_fills_empty_buckets(self):
+        data = self.history("?from=2022-01-03&to=2022-01-06&bucket=day")
+
+        self.assertEqual(
+            data["labels"], ["2022-01-03", "2022-01-04", "2022-01-05", "2022-01-06"]
+        )
+        self.assertEqual(data["data"], [2, 0, 1, 0])
+        self.assertEqual(data["total"], 3)
+
+    def test_invalid_bucket(self):
+        response = self.user1Client.get(
+            reverse("profiles:customer_history") + "?bucket=hour"
+        )
+
+        self.assertEqual(response.status_code, 400)
@@ -2,20 +2,55 @@ from django.shortcuts import get_object_or_404, render
 from rest_framework.response import Response
 from rest_framework import status
 from rest_framework.decorators import api_view, permission_classes, APIView
-from core.utils.utils import concatenateLists, getDisctionaryOfLists
+from core.utils.cache import analytics_cache
+from core.utils.dates import DateRangeSerializer
+from core.utils.etags import conditional, fingerprint, make_etag
+from core.utils.pagination import KeysetPagination
+from core.utils.sideload import NormalizedJSONRenderer, Sideloader, is_normalized
+from profiles.analytics import customer_history
 from profiles.models import Address, Customer
-from profiles.serializers import AddressSerializer, CustomerSerializer
+from profiles.serializers import (
+    AddressSerializer,
+    CustomerSerializer,
+    OrganizationSerializer,
+)
 from rest_framework.permissions import IsAuthenticated
 from .permissions import IsAddressOwner, IsCustomerOwner
-from django.db.models import Count
 from rest_framework.pagination import LimitOffsetPagination
+from rest_framework.settings import api_settings
 
 # Create your views here.
 
 
+def customer_list_etag(request, **kwargs):
+    org_id = request.user.profile.org_id
+    customers = Customer.objects.filter(owner_id=org_id)
+    return make_etag(request, org_id, *fingerprint(customers, "updated_at"), weak=True)
+
+
+def customer_detail_etag(request, pk, **kwargs):
+    updated_at = (
+        Customer.objects.filter(pk=pk, owner_id=request.user.profile.org_id)
+        .values_list("updated_at", flat=True)
+        .first()
+    )
+    if updated_at is None:
+        return None
+    return make_etag(request, updated_at)
+
+
 class CustomerListView(APIView):
 
     permission_classes = [IsAuthenticated]
+    renderer_classes = api_settings.DEFAULT_RENDERER_CLASSES + [NormalizedJSONRenderer]
+
+    sideloader = Sideloader(
+        Customer,
+        {
+            "owner": ("organizations", OrganizationSerializer),
+            "addresses": ("addresses", AddressSerializer),
+        },
+    )
 
     def post(self, request, format=None):
         data = request.data
@@ -26,24 +61,33 @@ class CustomerListView(APIView):
             return Response(serializer.data, status=status.HTTP_201_CREATED)
         return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
 
+    @conditional(customer_list_etag)
     def get(self, request, format=None):
         customer_by_org = Customer.objects.filter(owner=request.user.profile.org)
-        limitPagination = LimitOffsetPagination()
+        normalized = is_normalized(request)
+        if normalized:
+            customer_by_org = self.sideloader.setup_eager_loading(customer_by_org)
+        if KeysetPagination.is_requested(request):
+            limitPagination = KeysetPagination(ordering=("created_at", "id"))
+        else:
+            limitPagination = LimitOffsetPagination()
         result_page = limitPagination.paginate_queryset(customer_by_org, request)
         serializer = CustomerSerializer(result_page, many=True)
-        return Response(
-            {
-                "results": serializer.data,
-                "next": limitPagination.get_next_link(),
-                "previous": limitPagination.get_previous_link(),
-            }
-        )
+        data = {
+            "results": serializer.data,
+            "next": limitPagination.get_next_link(),
+            "previous": limitPagination.get_previous_link(),
+        }
+        if normalized:
+            data["included"] = self.sideloader.get_included(result_page or [])
+        return Response(data)
 
 
 class CustomerDetailView(APIView):
 
     permission_classes = [IsAuthenticated, IsCustomerOwner]
 
+    @conditional(customer_detail_etag)
     def get(self, request, pk, format=None):
         customer = get_object_or_404(Customer, pk=pk)
         self.check_object_permissions(request, customer)
@@ -70,23 +114,20 @@ class CustomerHistoryView(APIView):
     permission_classes = [IsAuthenticated]
 
     def get(self, request, format=None):
-        customerTotalCount = Customer.objects.filter(
-            owner=request.user.profile.org
-        ).count()
-        customers = (
-            Customer.objects.filter(owner=request.user.profile.org)
-            .values("created_at__month", "created_at__year")
-            .annotate(count=Count("created_at__month"))
-            .order_by("created_at__year", "created_at__month")
-        )
-
-        dict = getDisctionaryOfLists(customers)
-        data = []
-        labels = concatenateLists(
-            dict["created_at__month"], dict["created_at__year"], "-"
-        )
+        query = DateRangeSerializer(data=request.query_params)
+        query.is_valid(raise_exception=True)
+        org_id = request.user.profile.org_id
         return Response(
-            {"data": dict["count"], "labels": labels, "total": customerTotalCount}
+            analytics_cache.get_or_set(
+                org_id,
+                "customerHistory:%s" % query.cache_key(),
+                lambda: customer_history(
+                    org_id,
+                    query.validated_data.get("from"),
+                    query.validated_data.get("to"),
+                    query.validated_data.get("bucket", "month"),
+                ),
+            )
         )
 
 
@@ -0,0 +1,357 @@
+import heapq
+from collections import defaultdict
+from datetime import date, timedelta
+from decimal import Decimal
+from functools import partial
+from operator import itemgetter
+
+from django.db.models import (
+    Avg,
+    CharField,
+    Count,
+    F,
+    Max,
+    Min,
+    Q,
+    Sum,
+    Value,
+    Window,
+)
+from django.db.models.functions import RowNumber, TruncMonth
+
+from core.utils.columns import Column, shape
+from core.utils.concurrency import run_concurrently
+from profiles.analytics import customer_history
+from core.utils.dates import (
+    BUCKETS,
+    DaysBetween,
+    bucket_dates,
+    bucket_label,
+    fill_buckets,
+    next_bucket,
+    truncate,
+)
+from profiles.models import Customer
+from .models import CustomerCohort, Service, ServiceMonthlyRollup
+
+
+def service_history(org, start=None, end=None, bucket="month"):
+    """Revenue and count of the services that ended in each bucket.
+
+    Month buckets are read from the rollups, the others are truncated from
+    end_date. With a start every bucket up to end is listed.
+    """
+    if bucket == "month":
+        rollups = ServiceMonthlyRollup.objects.filter(org=org, count__gt=0)
+        if start is not None:
+            rollups = rollups.filter(
+                Q(year__gt=start.year) | Q(year=start.year, month__gte=start.month)
+            )
+        if end is not None:
+            rollups = rollups.filter(
+                Q(year__lt=end.year) | Q(year=end.year, month__lte=end.month)
+            )
+        totals = {
+            date(year, month, 1): (revenue, count)
+            for year, month, revenue, count in rollups.values_list(
+                "year", "month", "revenue", "count"
+            )
+        }
+    else:
+        services = Service.objects.filter(owner=org, end_date__isnull=False)
+        if start is not None:
+            services = services.filter(end_date__gte=start)
+        if end is not None:
+            services = services.filter(end_date__lte=end)
+        totals = {
+            row[0]: row[1:]
+            for row in services.annotate(bucket=BUCKETS[bucket]("end_date"))
+            .values("bucket")
+            .annotate(revenue=Sum("price"), count=Count("id"))
+            .values_list("bucket", "revenue", "count")
+            .order_by()
+        }
+    return shape(
+        fill_buckets(totals, bucket, start, end, empty=(0, 0)),
+        incomeHistoryData=Column(1),
+        incomeHistoryLabels=Column(0, format=partial(bucket_label, bucket=bucket)),
+        serviceCountHistoryData=Column(2),
+    )
+
+
+def services_by_status(org, days, start=None, end=None, bucket=None):
+    """Services started in the last `days` days, or from start to end, per
+    status. A bucket adds every status' count per bucket of start_date."""
+    services = Service.objects.filter(owner=org)
+    if start is None:
+        start = date.today() - timedelta(days=days)
+    services = services.filter(start_date__gte=start)
+    if end is not None:
+        services = services.filter(start_date__lte=end)
+    services = services.order_by(F("status__id").asc(nulls_last=True))
+
+    if bucket is None:
+        return shape(
+            services.values("status__name")
+            .annotate(status__count=Count("*"))
+            .values_list("status__name", "status__count"),
+            data=Column(1),
+            labels=Column(0, null="null"),
+        )
+
+    counts = {}
+    for status, name, value, count in (
+        services.annotate(bucket=BUCKETS[bucket]("start_date"))
+        .values("status__id", "status__name", "bucket")
+        .annotate(count=Count("*"))
+        .values_list("status__id", "status__name", "bucket", "count")
+    ):
+        counts.setdefault((status, name), {})[value] = (count,)
+    end = end or date.today()
+    series = [
+        [count for value, count in fill_buckets(values, bucket, start, end)]
+        for values in counts.values()
+    ]
+    data = shape(list(counts), labels=Column(1, null="null"))
+    data["data"] = [sum(values) for values in series]
+    data["buckets"] = list(
+        map(partial(bucket_label, bucket=bucket), bucket_dates(start, end, bucket))
+    )
+    data["series"] = series
+    return data
+
+
+def customer_totals(org):
+    """Income and service count of every customer of the organization."""
+    return (
+        Service.objects.filter(owner=org)
+        .values("customer__id", "customer__name")
+        .annotate(income=Sum("price"), services=Count("id"))
+    )
+
+
+def top_customers(totals, key, quantity):
+    """Picks the top customers by `key` from already fetched customer_totals."""
+    return heapq.nlargest(quantity, totals, key=itemgetter(key))
+
+
+def dashboard_queries(org, widgets, days):
+    """The independent queries behind the dashboard `widgets`, by name.
+
+    Both top customer widgets share the customerTotals query.
+    """
+    queries = {}
+    if "serviceHistory" in widgets:
+        queries["serviceHistory"] = partial(service_history, org)
+    if "servicesByStatus" in widgets:
+        queries["servicesByStatus"] = partial(services_by_status, org, days)
+    if {"topCustomersIncome", "topCustomersServices"} & set(widgets):
+        queries["customerTotals"] = lambda: list(customer_totals(org))
+    if "customerHistory" in widgets:
+        queries["customerHistory"] = partial(customer_history, org)
+    return queries
+
+
+def dashboard(results, widgets, quantity):
+    """Builds the dashboard out of the results of dashboard_queries()."""
+    data = {}
+    for widget in widgets:
+        if widget == "topCustomersIncome":
+            data[widget] = top_customers(results["customerTotals"], "income", quantity)
+        elif widget == "topCustomersServices":
+            data[widget] = top_customers(
+                results["customerTotals"], "services", quantity
+            )
+        else:
+            data[widget] = results[widget]
+    return data
+
+
+def customer_cohorts(org, start=None, end=None, months=12):
+    """Retention of the organization's customers by creation month.
+
+    `active` has a row per cohort: how many of its customers had a service
+    starting 0 to `months` months after the month they were created in.
+    Months that have not happened yet are None. The range selects cohort
+    months; with a start every month up to end is a cohort.
+
+    The counts are read from the CustomerCohort table, which is kept up to
+    date on writes, so this costs two indexed queries however many
+    services the customers have.
+    """
+    customers = Customer.objects.filter(owner=org)
+    cells = CustomerCohort.objects.filter(
+        org=org, customers__gt=0, month__gte=F("cohort")
+    )
+    if start is not None:
+        start = truncate(start, "month")
+        customers = customers.filter(created_at__gte=start)
+        cells = cells.filter(cohort__gte=start)
+    if end is not None:
+        end = truncate(end, "month")
+        customers = customers.filter(created_at__lt=next_bucket(end, "month"))
+        cells = cells.filter(cohort__lte=end)
+
+    # created_at is grouped as is and folded into months here, which keeps
+    # the query on the (owner, created_at) index.
+    created, active = run_concurrently(
+        [
+            lambda: list(
+                customers.values("created_at")
+                .annotate(count=Count("id"))
+                .values_list("created_at", "count")
+                .order_by()
+            ),
+            lambda: list(cells.values_list("cohort", "month", "customers")),
+        ]
+    )
+    sizes = defaultdict(int)
+    for created_at, count in created:
+        sizes[truncate(created_at, "month")] += count
+    counts = {
+        (cohort, (month.year - cohort.year) * 12 + month.month - cohort.month): count
+        for cohort, month, count in active
+    }
+
+    cohorts = fill_buckets(
+        {cohort: (size,) for cohort, size in sizes.items()}, "month", start, end
+    )
+    current = truncate(date.today(), "month")
+    matrix = []
+    for cohort, size in cohorts:
+        row = []
+        month = cohort
+        for offset in range(months + 1):
+            row.append(counts.get((cohort, offset), 0) if month <= current else None)
+            month = next_bucket(month, "month")
+        matrix.append(row)
+    data = shape(
+        cohorts,
+        cohorts=Column(0, format=partial(bucket_label, bucket="month")),
+        sizes=Column(1),
+    )
+    data["offsets"] = list(range(months + 1))
+    data["active"] = matrix
+    return data
+
+
+PERCENTILES = (50, 90, 99)
+
+STATISTICS_GROUPS = {
+    "status": F("status__name"),
+    "category": F("historic__appliance__category__name"),
+    "month": TruncMonth("start_date"),
+}
+
+
+def statistic_values(org, metric, start=None, end=None):
+    """The organization's services started in the range, annotated with the
+    value of `metric`: days until end_date or price."""
+    services = Service.objects.filter(owner=org)
+    if start is not None:
+        services = services.filter(start_date__gte=start)
+    if end is not None:
+        services = services.filter(start_date__lte=end)
+    if metric == "duration":
+        return services.filter(end_date__isnull=False).annotate(
+            value=DaysBetween("end_date", "start_date")
+        )
+    return services.annotate(value=F("price"))
+
+
+def histogram_edges(low, high, bins):
+    # Decimal parameters reach SQLite as text, which never compares equal
+    # to the integer days of a duration.
+    number = Decimal if isinstance(low, Decimal) else float
+    low, high = number(low), number(high)
+    if low == high:
+        return [low, high]
+    step = (high - low) / bins
+    return [low + step * i for i in range(bins)] + [high]
+
+
+def percentiles(services):
+    """Nearest-rank PERCENTILES of `value` per `key`.
+
+    Every service is ranked within its key by a window function and only
+    the rows sitting at a percentile rank leave the database. Django can
+    not filter on window functions yet, so the ranked query is wrapped in
+    an outer SELECT by hand.
+    """
+    ranked = (
+        services.annotate(
+            rank=Window(
+                RowNumber(), partition_by=[F("key")], order_by=F("value").asc()
+            ),
+            total=Window(Count("id"), partition_by=[F("key")]),
+        )
+        .values_list("key", "value", "rank", "total")
+        .order_by()
+    )
+    compiler = ranked.query.get_compiler(using=ranked.db)
+    sql, params = compiler.as_sql()
+    quote = compiler.connection.ops.quote_name
+    ranks = " OR ".join(
+        "%s = (%s * %d + 99) / 100" % (quote("rank"), quote("total"), percentile)
+        for percentile in PERCENTILES
+    )
+    with compiler.connection.cursor() as cursor:
+        cursor.execute("SELECT * FROM (%s) ranked WHERE %s" % (sql, ranks), params)
+        rows = compiler.results_iter(results=[cursor.fetchall()])
+        # Columns come in select order, which is not the values_list() one.
+        aliases = [alias for expression, sql, alias in compiler.select]
+        rows = [itemgetter(*map(aliases.index, ranked._fields))(row) for row in rows]
+
+    values = defaultdict(dict)
+    for key, value, rank, total in rows:
+        for percentile in PERCENTILES:
+            if rank == (total * percentile + 99) // 100:
+                values[key]["p%d" % percentile] = value
+    return values
+
+
+def service_statistics(org, metric, group=None, start=None, end=None, bins=10):
+    """Count, mean, PERCENTILES and histogram of a service metric per group.
+
+    The histogram edges split the range of the metric over all groups into
+    `bins` equal parts, so the groups can be compared bin by bin.
+    """
+    key = STATISTICS_GROUPS[group] if group else Value("all", CharField())
+    services = statistic_values(org, metric, start, end).annotate(key=key)
+    limits = services.aggregate(low=Min("value"), high=Max("value"))
+    if limits["low"] is None:
+        return {"metric": metric, "group": group, "edges": [], "groups": []}
+
+    edges = histogram_edges(limits["low"], limits["high"], bins)
+    histogram = {}
+    for i in range(len(edges) - 1):
+        last = i == len(edges) - 2
+        upper = Q(value__lte=edges[i + 1]) if last else Q(value__lt=edges[i + 1])
+        histogram["bin%d" % i] = Count("id", filter=Q(value__gte=edges[i]) & upper)
+    rows = (
+        services.values("key")
+        .annotate(count=Count("id"), mean=Avg("value"), **histogram)
+        .order_by(F("key").asc(nulls_last=True))
+    )
+    ranks = percentiles(services)
+
+    groups = []
+    for row in rows:
+        label = row["key"]
+        if group == "month":
+            label = bucket_label(label, "month")
+        groups.append(
+            {
+                "key": "null" if label is None else label,
+                "count": row["count"],
+                "mean": row["mean"],
+                **ranks[row["key"]],
+                "histogram": [row["bin%d" % i] for i in range(len(histogram))],
+            }
+        )
+    return {
+        "metric": metric,
+        "group": group,
+        "edges": [round(edge, 2) for edge in edges],
+        "groups": groups,
+    }
@@ -0,0 +1,333 @@
+import random
+import statistics
+import time
+import timeit
+from contextlib import contextmanager
+from datetime import date, timedelta
+from decimal import Decimal
+
+from asgiref.sync import async_to_sync
+from django.contrib.auth.models import User
+from django.db import connection
+from django.test import AsyncRequestFactory, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import resolve, reverse
+from rest_framework.authtoken.models import Token
+from rest_framework.test import APIRequestFactory, force_authenticate
+
+from appliances.models import Historic
+from core.utils.cache import analytics_cache
+from core.utils.columns import Column, shape
+from core.utils.utils import concatenateLists, getDisctionaryOfLists, renameListNulls
+from profiles.models import Customer, Organization
+from service import analytics
+from service.models import CustomerCohort, Service, ServiceMonthlyRollup, Status
+from service.serializers import DashboardQuerySerializer
+
+
+class QueryBenchmark:
+    """Seeds a dataset of a given size and measures the org-scoped endpoints.
+
+    Services are spread over several organizations so that every query has
+    to isolate one organization's rows, which is what the composite
+    indexes are for. Seeding is deterministic for a given size. run()
+    measures each endpoint twice: without the indexes declared in
+    Meta.indexes of the benchmarked models and with them.
+    """
+
+    organizations = 10
+    services_per_customer = 10
+    batch_size = 5000
+    history_days = 3 * 365
+
+    endpoints = [
+        ("service:service_history", {}, ""),
+        ("service:services_status_count", {"days": 365}, ""),
+        ("service:top_customers_income", {"quantity": 10}, ""),
+        ("service:top_customers_services", {"quantity": 10}, ""),
+        ("service:service_list", {}, "?limit=16&offset=0"),
+        ("service:service_list", {}, "?pagination=cursor&limit=16"),
+        ("profiles:customer_history", {}, ""),
+        ("profiles:customer_list", {}, "?limit=16&offset=0"),
+    ]
+    indexed_models = [Service, Customer, Historic]
+
+    def __init__(self, size, seed=0):
+        self.size = size
+        self.random = random.Random(seed)
+        self.factory = APIRequestFactory(SERVER_NAME="localhost")
+
+    def seed(self):
+        self.user = User.objects.create_user("benchmark")
+        orgs = [self.user.profile.org] + Organization.objects.bulk_create(
+            [Organization(name="benchmark") for i in range(self.organizations - 1)]
+        )
+        self.statuses = Status.objects.bulk_create(
+            [
+                Status(name="status %d" % i, description="", is_conclusive=i == 0)
+                for i in range(5)
+            ]
+        )
+        for org in orgs:
+            self.seed_organization(org, self.size // self.organizations)
+        ServiceMonthlyRollup.objects.rebuild()
+        CustomerCohort.objects.rebuild()
+        with connection.cursor() as cursor:
+            cursor.execute("ANALYZE")
+
+    def random_date(self):
+        return date.today() - timedelta(days=self.random.randrange(self.history_days))
+
+    def seed_organization(self, org, services):
+        customers = Customer.objects.bulk_create(
+            [
+                Customer(name="customer", owner=org, created_at=self.random_date())
+                for i in range(max(1, services // self.services_per_customer))
+            ],
+            batch_size=self.batch_size,
+        )
+        for offset in range(0, services, self.batch_size):
+            count = min(self.batch_size, services - offset)
+            historics = Historic.objects.bulk_create(
+                [Historic(org=org) for i in range(count)]
+            )
+            batch = []
+            for historic in historics:
+                start_date = self.random_date()
+                status = self.random.choice(self.statuses)
+                end_date = None
+                if status.is_conclusive or self.random.random() < 0.5:
+                    end_date = start_date + timedelta(days=self.random.randrange(30))
+                batch.append(
+                    Service(
+                        owner=org,
+                        historic=historic,
+                        customer=self.random.choice(customers),
+                        status=status,
+                        start_date=start_date,
+                        end_date=end_date,
+                        price=Decimal(self.random.randrange(1, 200000)) / 100,
+                    )
+                )
+            Service.objects.bulk_create(batch)
+
+    @contextmanager
+    def without_indexes(self):
+        # Index SQL is executed directly instead of through a schema editor
+        # context, which SQLite refuses to open inside a transaction.
+        editor = connection.schema_editor()
+        indexes = [
+            (model, index)
+            for model in self.indexed_models
+            for index in model._meta.indexes
+        ]
+        with connection.cursor() as cursor:
+            for model, index in indexes:
+                cursor.execute(str(index.remove_sql(model, editor)))
+            cursor.execute("ANALYZE")
+        try:
+            yield
+        finally:
+            with connection.cursor() as cursor:
+                for model, index in indexes:
+                    cursor.execute(str(index.create_sql(model, editor)))
+                cursor.execute("ANALYZE")
+
+    def explain(self, sql):
+        with connection.cursor() as cursor:
+            cursor.execute("%s %s" % (connection.ops.explain_query_prefix(), sql))
+            rows = cursor.fetchall()
+        return [" ".join(str(column) for column in row) for row in rows]
+
+    def measure(self, name, kwargs, query, repeat):
+        url = reverse(name, kwargs=kwargs)
+        view = resolve(url).func
+        path = url + query
+        timings = []
+        for i in range(repeat):
+            # Measures the queries, not the analytics cache.
+            analytics_cache.bump(self.user.profile.org_id)
+            request = self.factory.get(path)
+            force_authenticate(request, user=self.user)
+            with CaptureQueriesContext(connection) as context:
+                started = time.perf_counter()
+                response = view(request, **kwargs)
+                response.render()
+                timings.append((time.perf_counter() - started) * 1000)
+        return {
+            "endpoint": path,
+            "status": response.status_code,
+            "queries": len(context.captured_queries),
+            "median_ms": round(statistics.median(timings), 2),
+            "plans": [
+                {"sql": captured["sql"], "plan": self.explain(captured["sql"])}
+                for captured in context.captured_queries
+            ],
+        }
+
+    def measure_all(self, phase, repeat):
+        results = []
+        for name, kwargs, query in self.endpoints:
+            result = self.measure(name, kwargs, query, repeat)
+            result.update({"size": self.size, "phase": phase})
+            results.append(result)
+        return results
+
+    def run(self, repeat=5):
+        with self.without_indexes():
+            results = self.measure_all("without indexes", repeat)
+        return results + self.measure_all("with indexes", repeat)
+
+
+class DashboardBenchmark:
+    """Times the dashboard of a seeded QueryBenchmark three ways.
+
+    It is built with its queries run one after another, with them run
+    concurrently on the analytics pool, and through the async view. Each
+    query is also timed alone, so the concurrent times can be held
+    against the slowest query and the sequential ones against the sum.
+    The analytics cache is bumped before every request.
+    """
+
+    def __init__(self, benchmark):
+        self.benchmark = benchmark
+        self.user = benchmark.user
+        self.org_id = self.user.profile.org_id
+        self.token = Token.objects.get_or_create(user=self.user)[0]
+        self.path = reverse("service:dashboard")
+        self.async_path = reverse("service:dashboard_async")
+
+    def median_ms(self, function, repeat):
+        timings = []
+        for i in range(repeat):
+            analytics_cache.bump(self.org_id)
+            started = time.perf_counter()
+            function()
+            timings.append((time.perf_counter() - started) * 1000)
+        return round(statistics.median(timings), 2)
+
+    def sync_request(self):
+        request = self.benchmark.factory.get(self.path)
+        force_authenticate(request, user=self.user)
+        response = resolve(self.path).func(request)
+        assert response.status_code == 200, response.render().content
+
+    def async_request(self):
+        request = AsyncRequestFactory().get(
+            self.async_path, authorization="Token %s" % self.token.key
+        )
+        response = async_to_sync(resolve(self.async_path).func)(request)
+        assert response.status_code == 200, response.content
+
+    def run(self, repeat=5):
+        queries = analytics.dashboard_queries(
+            self.org_id, DashboardQuerySerializer.available_widgets, 30
+        )
+        results = [
+            {"mode": "query %s" % name, "median_ms": self.median_ms(query, repeat)}
+            for name, query in queries.items()
+        ]
+        with override_settings(ANALYTICS_QUERY_WORKERS=1):
+            sequential = self.median_ms(self.sync_request, repeat)
+        concurrent = self.median_ms(self.sync_request, repeat)
+        results += [
+            {"mode": "sequential", "median_ms": sequential},
+            {"mode": "concurrent", "median_ms": concurrent},
+            {"mode": "async", "median_ms": self.median_ms(self.async_request, repeat)},
+        ]
+        for result in results:
+            result["size"] = self.benchmark.size
+        return results
+
+
+class ShapingBenchmark:
+    """Times the analytics result shaping of core.utils.columns against the
+    per-row helpers of core.utils.utils on synthetic rows.
+
+    Each case takes the same rows once as values() dicts, which the helpers
+    pivot, and once as values_list() tuples, which shape() consumes, and
+    both have to produce the same series.
+    """
+
+    def __init__(self, rows, seed=0):
+        self.rows = rows
+        self.random = random.Random(seed)
+
+    def history_rows(self):
+        return [
+            (
+                self.random.randint(1, 12),
+                self.random.randint(2000, 2022),
+                Decimal(self.random.randrange(100000)) / 100,
+                self.random.randrange(100),
+            )
+            for i in range(self.rows)
+        ]
+
+    def status_rows(self):
+        names = ["status %d" % i for i in range(5)] + [None]
+        return [
+            (self.random.choice(names), self.random.randrange(100))
+            for i in range(self.rows)
+        ]
+
+    def history_cases(self):
+        rows = self.history_rows()
+        dicts = [
+            {"month": month, "year": year, "revenue": revenue, "count": count}
+            for month, year, revenue, count in rows
+        ]
+
+        def helpers():
+            pivot = getDisctionaryOfLists(dicts)
+            return {
+                "data": pivot["revenue"],
+                "labels": concatenateLists(pivot["month"], pivot["year"], "-"),
+                "count": pivot["count"],
+            }
+
+        def columns():
+            return shape(
+                rows,
+                data=Column(2),
+                labels=Column(0, 1, format="{}-{}".format),
+                count=Column(3),
+            )
+
+        return helpers, columns
+
+    def status_cases(self):
+        rows = self.status_rows()
+        dicts = [{"name": name, "count": count} for name, count in rows]
+
+        def helpers():
+            pivot = getDisctionaryOfLists(dicts)
+            return {
+                "data": pivot["count"],
+                "labels": renameListNulls(pivot["name"], "null"),
+            }
+
+        def columns():
+            return shape(rows, data=Column(1), labels=Column(0, null="null"))
+
+        return helpers, columns
+
+    def measure(self, name, helpers, columns, repeat):
+        if helpers() != columns():
+            raise AssertionError("%s: the series differ" % name)
+        timings = {}
+        for label, function in (("helpers", helpers), ("columns", columns)):
+            timings[label] = min(timeit.repeat(function, number=1, repeat=repeat))
+        return {
+            "case": name,
+            "rows": self.rows,
+            "helpers_ms": round(timings["helpers"] * 1000, 3),
+            "columns_ms": round(timings["columns"] * 1000, 3),
+            "speedup": round(timings["helpers"] / timings["columns"], 2),
+        }
+
+    def run(self, repeat=20):
+        return [
+            self.measure("history", *self.history_cases(), repeat),
+            self.measure("status", *self.status_cases(), repeat),
+        ]
@@ -0,0 +1,43 @@
+import json
+
+from django.core.management.base import BaseCommand
+from django.db import connection
+
+from service.benchmark import DashboardBenchmark, QueryBenchmark
+
+
+class Command(BaseCommand):
+    help = (
+        "Seeds a throwaway test database for each size and reports the median "
+        "time of every dashboard query alone and of the whole dashboard with "
+        "the queries run sequentially, concurrently and from the async view."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--sizes", nargs="+", type=int, default=[100000])
+        parser.add_argument("--repeat", type=int, default=5)
+        parser.add_argument("--output", help="Write every result as JSON here.")
+
+    def handle(self, *args, sizes, repeat, output, **options):
+        results = []
+        for size in sizes:
+            self.stdout.write("Seeding %d services..." % size)
+            old_name = connection.settings_dict["NAME"]
+            connection.creation.create_test_db(
+                verbosity=0, autoclobber=True, serialize=False
+            )
+            try:
+                benchmark = QueryBenchmark(size)
+                benchmark.seed()
+                size_results = DashboardBenchmark(benchmark).run(repeat)
+            finally:
+                connection.creation.destroy_test_db(old_name, verbosity=0)
+            for result in size_results:
+                self.stdout.write(
+                    "%(size)9d  %(mode)-28s %(median_ms)10.2f ms" % result
+                )
+            results += size_results
+
+        if output:
+            with open(output, "w") as file:
+                json.dump(results, file, indent=2)
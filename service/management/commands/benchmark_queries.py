@@ -0,0 +1,57 @@
+import json
+
+from django.core.management.base import BaseCommand
+from django.db import connection
+
+from service.benchmark import QueryBenchmark
+
+
+class Command(BaseCommand):
+    help = (
+        "Seeds a throwaway test database for each size and reports the query "
+        "count, median time and query plans of the org-scoped endpoints, "
+        "without and with the composite indexes."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--sizes", nargs="+", type=int, default=[10000, 100000, 1000000]
+        )
+        parser.add_argument("--repeat", type=int, default=5)
+        parser.add_argument(
+            "--plans", action="store_true", help="Print the plan of every query."
+        )
+        parser.add_argument("--output", help="Write every result as JSON here.")
+
+    def handle(self, *args, sizes, repeat, plans, output, **options):
+        results = []
+        for size in sizes:
+            self.stdout.write("Seeding %d services..." % size)
+            old_name = connection.settings_dict["NAME"]
+            connection.creation.create_test_db(
+                verbosity=0, autoclobber=True, serialize=False
+            )
+            try:
+                benchmark = QueryBenchmark(size)
+                benchmark.seed()
+                size_results = benchmark.run(repeat)
+            finally:
+                connection.creation.destroy_test_db(old_name, verbosity=0)
+            self.report(size_results, plans)
+            results += size_results
+
+        if output:
+            with open(output, "w") as file:
+                json.dump(results, file, indent=2)
+
+    def report(self, results, plans):
+        for result in results:
+            self.stdout.write(
+                "%(size)9d  %(phase)-16s %(endpoint)-50s "
+                "%(queries)3d queries %(median_ms)10.2f ms" % result
+            )
+            if plans:
+                for query in result["plans"]:
+                    self.stdout.write("    " + query["sql"])
+                    for line in query["plan"]:
+                        self.stdout.write("        " + line)
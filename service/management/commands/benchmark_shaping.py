@@ -0,0 +1,29 @@
+import json
+
+from django.core.management.base import BaseCommand
+
+from service.benchmark import ShapingBenchmark
+
+
+class Command(BaseCommand):
+    help = (
+        "Times the columnar shaping of analytics results against the per-row "
+        "list helpers on synthetic rows. Needs no database."
+    )
+    requires_system_checks = []
+
+    def add_arguments(self, parser):
+        parser.add_argument("--rows", type=int, default=10000)
+        parser.add_argument("--repeat", type=int, default=20)
+        parser.add_argument("--output", help="Write every result as JSON here.")
+
+    def handle(self, *args, rows, repeat, output, **options):
+        results = ShapingBenchmark(rows).run(repeat)
+        for result in results:
+            self.stdout.write(
+                "%(case)-8s %(rows)8d rows  helpers %(helpers_ms)9.3f ms  "
+                "columns %(columns_ms)9.3f ms  %(speedup)5.2fx" % result
+            )
+        if output:
+            with open(output, "w") as file:
+                json.dump(results, file, indent=2)
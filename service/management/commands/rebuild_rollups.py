@@ -0,0 +1,47 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from service.models import CustomerCohort, ServiceMonthlyRollup
+
+
+class Command(BaseCommand):
+    help = (
+        "Rebuilds the monthly service rollups and the customer cohorts from "
+        "the services. With --check it only reports the months that drifted "
+        "and fails if there are any."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--org", type=int, nargs="+", dest="orgs", help="Organization ids."
+        )
+        parser.add_argument("--check", action="store_true")
+
+    def handle(self, *args, orgs, check, **options):
+        drift = ServiceMonthlyRollup.objects.drift(orgs)
+        for (org_id, year, month), expected, stored in drift:
+            self.stdout.write(
+                "org %s %d-%02d: expected %s, stored %s"
+                % (org_id, year, month, expected, stored)
+            )
+        cohort_drift = CustomerCohort.objects.drift(orgs)
+        for (org_id, cohort, month), expected, stored in cohort_drift:
+            self.stdout.write(
+                "org %s cohort %s %s: expected %s, stored %s"
+                % (org_id, cohort, month, expected, stored)
+            )
+        if check:
+            if drift or cohort_drift:
+                raise CommandError(
+                    "%d monthly rollups and %d customer cohorts drifted."
+                    % (len(drift), len(cohort_drift))
+                )
+            self.stdout.write(
+                "Monthly rollups and customer cohorts match the services."
+            )
+            return
+        rollups = ServiceMonthlyRollup.objects.rebuild(orgs)
+        cohorts = CustomerCohort.objects.rebuild(orgs)
+        self.stdout.write(
+            "Rebuilt %d monthly rollups and %d customer cohorts."
+            % (len(rollups), len(cohorts))
+        )
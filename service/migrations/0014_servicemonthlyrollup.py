@@ -0,0 +1,56 @@
+# Generated by Django 4.0.4 on 2026-10-18 06:54
+
+from django.db import migrations, models
+from django.db.models import Count, Sum
+from django.db.models.functions import ExtractMonth, ExtractYear
+import django.db.models.deletion
+
+
+def build_rollups(apps, schema_editor):
+    Service = apps.get_model('service', 'Service')
+    ServiceMonthlyRollup = apps.get_model('service', 'ServiceMonthlyRollup')
+    rows = (
+        Service.objects.filter(end_date__isnull=False)
+        .values('owner_id', year=ExtractYear('end_date'), month=ExtractMonth('end_date'))
+        .annotate(revenue=Sum('price'), count=Count('id'))
+        .order_by()
+    )
+    ServiceMonthlyRollup.objects.bulk_create(
+        [
+            ServiceMonthlyRollup(
+                org_id=row['owner_id'],
+                year=row['year'],
+                month=row['month'],
+                revenue=row['revenue'],
+                count=row['count'],
+            )
+            for row in rows
+        ]
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('profiles', '0013_customer_org_scoped_indexes'),
+        ('service', '0013_service_org_scoped_indexes'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ServiceMonthlyRollup',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('year', models.PositiveSmallIntegerField()),
+                ('month', models.PositiveSmallIntegerField()),
+                ('revenue', models.DecimalField(decimal_places=2, default=0, max_digits=14)),
+                ('count', models.IntegerField(default=0)),
+                ('org', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='profiles.organization')),
+            ],
+        ),
+        migrations.AddConstraint(
+            model_name='servicemonthlyrollup',
+            constraint=models.UniqueConstraint(fields=('org', 'year', 'month'), name='unique_service_monthly_rollup'),
+        ),
+        migrations.RunPython(build_rollups, migrations.RunPython.noop),
+    ]
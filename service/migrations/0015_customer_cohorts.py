@@ -0,0 +1,77 @@
+# Generated by Django 4.0.4 on 2026-10-18 14:12
+
+from django.db import migrations, models
+from django.db.models import Count, F
+from django.db.models.functions import TruncMonth
+import django.db.models.deletion
+
+
+def build_cohorts(apps, schema_editor):
+    Service = apps.get_model('service', 'Service')
+    CustomerActivity = apps.get_model('service', 'CustomerActivity')
+    CustomerCohort = apps.get_model('service', 'CustomerCohort')
+    services = Service.objects.filter(customer__isnull=False)
+    months = dict(
+        org_id=F('customer__owner_id'),
+        cohort=TruncMonth('customer__created_at'),
+        month=TruncMonth('start_date'),
+    )
+    CustomerActivity.objects.bulk_create(
+        [
+            CustomerActivity(**row)
+            for row in services.values('customer_id', **months)
+            .annotate(services=Count('id'))
+            .order_by()
+        ],
+        batch_size=5000,
+    )
+    CustomerCohort.objects.bulk_create(
+        [
+            CustomerCohort(**row)
+            for row in services.values(**months)
+            .annotate(customers=Count('customer_id', distinct=True))
+            .order_by()
+        ],
+        batch_size=5000,
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('profiles', '0013_customer_org_scoped_indexes'),
+        ('service', '0014_servicemonthlyrollup'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='CustomerActivity',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('cohort', models.DateField()),
+                ('month', models.DateField()),
+                ('services', models.IntegerField(default=0)),
+                ('customer', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='profiles.customer')),
+                ('org', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='profiles.organization')),
+            ],
+        ),
+        migrations.CreateModel(
+            name='CustomerCohort',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('cohort', models.DateField()),
+                ('month', models.DateField()),
+                ('customers', models.IntegerField(default=0)),
+                ('org', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='profiles.organization')),
+            ],
+        ),
+        migrations.AddConstraint(
+            model_name='customeractivity',
+            constraint=models.UniqueConstraint(fields=('customer', 'month'), name='unique_customer_activity'),
+        ),
+        migrations.AddConstraint(
+            model_name='customercohort',
+            constraint=models.UniqueConstraint(fields=('org', 'cohort', 'month'), name='unique_customer_cohort'),
+        ),
+        migrations.RunPython(build_cohorts, migrations.RunPython.noop),
+    ]
@@ -1,6 +1,17 @@
-from django.db import models
+from collections import defaultdict
+from decimal import Decimal
+
+from django.db import models, transaction
+from django.db.models import Count, F, Sum
+from django.db.models.functions import ExtractMonth, ExtractYear, TruncMonth
+from django.db.models.signals import post_delete, post_save, pre_delete
+from django.dispatch import receiver
+from django.utils import timezone
+from core.utils.cache import analytics_cache
+from core.utils.dates import truncate
+from core.utils.upsert import increment
 from profiles.models import Address, Customer, Organization
-from appliances.models import Historic
+from appliances.models import Appliance, Category, Historic
 from datetime import date
 
 # Create your models here.
@@ -13,6 +24,362 @@ class Status(models.Model):
     is_active = models.BooleanField(default=True)
 
 
+class ServiceMonthlyRollupManager(models.Manager):
+    def deltas(self, removed=(), added=()):
+        """Turns (owner_id, end_date, price) rows leaving and entering the
+        rollups into {(org_id, year, month): [revenue, count]} deltas."""
+        deltas = defaultdict(lambda: [Decimal(0), 0])
+        for sign, rows in ((-1, removed), (1, added)):
+            for owner_id, end_date, price in rows:
+                if end_date is None:
+                    continue
+                delta = deltas[(owner_id, end_date.year, end_date.month)]
+                delta[0] += sign * price
+                delta[1] += sign
+        return deltas
+
+    def apply(self, deltas):
+        created = []
+        for (org_id, year, month), (revenue, count) in deltas.items():
+            if not revenue and not count:
+                continue
+            # A missing row can only gain services; removals from a missing
+            # row happen when the organization itself is being deleted.
+            if count > 0:
+                created.append(
+                    {
+                        "org_id": org_id,
+                        "year": year,
+                        "month": month,
+                        "revenue": revenue,
+                        "count": count,
+                    }
+                )
+            else:
+                self.filter(org_id=org_id, year=year, month=month).update(
+                    revenue=F("revenue") + revenue, count=F("count") + count
+                )
+        increment(
+            ServiceMonthlyRollup,
+            created,
+            unique=["org_id", "year", "month"],
+            counters=["revenue", "count"],
+        )
+
+    def compute(self, services):
+        """Aggregates services into rollup rows from scratch."""
+        return (
+            services.filter(end_date__isnull=False)
+            .values(
+                "owner_id",
+                year=ExtractYear("end_date"),
+                month=ExtractMonth("end_date"),
+            )
+            .annotate(revenue=Sum("price"), count=Count("id"))
+            .order_by()
+        )
+
+    def rebuild(self, orgs=None):
+        services = Service.objects.all()
+        rollups = self.all()
+        if orgs is not None:
+            services = services.filter(owner__in=orgs)
+            rollups = rollups.filter(org__in=orgs)
+        with transaction.atomic():
+            rollups.delete()
+            return self.bulk_create(
+                [
+                    ServiceMonthlyRollup(
+                        org_id=row["owner_id"],
+                        year=row["year"],
+                        month=row["month"],
+                        revenue=row["revenue"],
+                        count=row["count"],
+                    )
+                    for row in self.compute(services)
+                ]
+            )
+
+    def drift(self, orgs=None):
+        """Lists the (org_id, year, month) whose rollup disagrees with the
+        services, with the expected and the stored (revenue, count)."""
+        services = Service.objects.all()
+        rollups = self.filter(count__gt=0)
+        if orgs is not None:
+            services = services.filter(owner__in=orgs)
+            rollups = rollups.filter(org__in=orgs)
+        expected = {
+            (row["owner_id"], row["year"], row["month"]): (row["revenue"], row["count"])
+            for row in self.compute(services)
+        }
+        stored = {
+            (rollup.org_id, rollup.year, rollup.month): (rollup.revenue, rollup.count)
+            for rollup in rollups
+        }
+        return [
+            (key, expected.get(key), stored.get(key))
+            for key in sorted(set(expected) | set(stored))
+            if expected.get(key) != stored.get(key)
+        ]
+
+
+class ServiceMonthlyRollup(models.Model):
+    """Revenue and count of an organization's services by end_date month.
+
+    Kept up to date by Service.save() and the Service post_delete receiver
+    in the same transaction as the change, and by the bulk paths that write
+    services with queryset methods. rebuild_rollups recomputes it.
+    """
+
+    org = models.ForeignKey(Organization, on_delete=models.CASCADE)
+    year = models.PositiveSmallIntegerField()
+    month = models.PositiveSmallIntegerField()
+    revenue = models.DecimalField(max_digits=14, decimal_places=2, default=0)
+    count = models.IntegerField(default=0)
+
+    objects = ServiceMonthlyRollupManager()
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=["org", "year", "month"], name="unique_service_monthly_rollup"
+            )
+        ]
+
+
+class CustomerActivityManager(models.Manager):
+    def deltas(self, removed=(), added=()):
+        """Turns (customer_id, start_date) rows leaving and entering the
+        activity into {(customer_id, month): services} deltas."""
+        deltas = defaultdict(int)
+        for sign, rows in ((-1, removed), (1, added)):
+            for customer_id, start_date in rows:
+                if customer_id is None:
+                    continue
+                deltas[(customer_id, truncate(start_date, "month"))] += sign
+        return deltas
+
+    def apply(self, deltas):
+        """Applies deltas and moves the cohort cells of the customer months
+        that gained their first service or lost their last one."""
+        deltas = {key: delta for key, delta in deltas.items() if delta}
+        if not deltas:
+            return
+        customers = {
+            pk: (owner_id, truncate(created_at, "month"))
+            for pk, owner_id, created_at in Customer.objects.filter(
+                pk__in={customer_id for customer_id, month in deltas}
+            ).values_list("pk", "owner_id", "created_at")
+        }
+        # A customer being deleted has already left the cohorts.
+        deltas = {key: delta for key, delta in deltas.items() if key[0] in customers}
+
+        created = []
+        for (customer_id, month), delta in deltas.items():
+            org_id, cohort = customers[customer_id]
+            if delta > 0:
+                created.append(
+                    {
+                        "org_id": org_id,
+                        "customer_id": customer_id,
+                        "cohort": cohort,
+                        "month": month,
+                        "services": delta,
+                    }
+                )
+            else:
+                self.filter(customer_id=customer_id, month=month).update(
+                    services=F("services") + delta
+                )
+        increment(
+            CustomerActivity,
+            created,
+            unique=["customer_id", "month"],
+            counters=["services"],
+        )
+
+        # The writes lock these rows until the transaction ends, so the
+        # counts read back are the ones they left, and the count before is
+        # that minus the delta.
+        activity = self.filter(
+            customer_id__in=customers, month__in={month for c, month in deltas}
+        )
+        cells = defaultdict(int)
+        rows = activity.values_list(
+            "customer_id", "month", "org_id", "cohort", "services"
+        )
+        for customer_id, month, org_id, cohort, services in rows:
+            delta = deltas.get((customer_id, month))
+            if delta is None:
+                continue
+            if services - delta <= 0 < services:
+                cells[(org_id, cohort, month)] += 1
+            elif services <= 0 < services - delta:
+                cells[(org_id, cohort, month)] -= 1
+        activity.filter(services__lte=0).delete()
+        CustomerCohort.objects.apply(cells)
+
+
+class CustomerActivity(models.Model):
+    """Services a customer started in a month, the support table that keeps
+    CustomerCohort counting distinct customers."""
+
+    org = models.ForeignKey(Organization, on_delete=models.CASCADE)
+    customer = models.ForeignKey(Customer, on_delete=models.CASCADE)
+    cohort = models.DateField()
+    month = models.DateField()
+    services = models.IntegerField(default=0)
+
+    objects = CustomerActivityManager()
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=["customer", "month"], name="unique_customer_activity"
+            )
+        ]
+
+
+class CustomerCohortManager(models.Manager):
+    def apply(self, cells):
+        created = []
+        for (org_id, cohort, month), delta in cells.items():
+            if delta > 0:
+                created.append(
+                    {
+                        "org_id": org_id,
+                        "cohort": cohort,
+                        "month": month,
+                        "customers": delta,
+                    }
+                )
+            elif delta < 0:
+                self.filter(org_id=org_id, cohort=cohort, month=month).update(
+                    customers=F("customers") + delta
+                )
+        increment(
+            CustomerCohort,
+            created,
+            unique=["org_id", "cohort", "month"],
+            counters=["customers"],
+        )
+
+    def move_customer(self, customer):
+        """Moves a customer's activity to the cohort of its created_at."""
+        cohort = truncate(
+            Customer._meta.get_field("created_at").to_python(customer.created_at),
+            "month",
+        )
+        activity = CustomerActivity.objects.filter(customer=customer).exclude(
+            cohort=cohort
+        )
+        cells = defaultdict(int)
+        rows = activity.values_list("org_id", "cohort", "month")
+        for org_id, previous, month in rows:
+            cells[(org_id, previous, month)] -= 1
+            cells[(org_id, cohort, month)] += 1
+        if cells:
+            activity.update(cohort=cohort)
+            self.apply(cells)
+
+    def remove_customer(self, customer):
+        activity = CustomerActivity.objects.filter(customer=customer)
+        cells = defaultdict(int)
+        for org_id, cohort, month in activity.values_list("org_id", "cohort", "month"):
+            cells[(org_id, cohort, month)] -= 1
+        activity.delete()
+        self.apply(cells)
+
+    def compute(self, services):
+        """Customers active per (org, cohort, month) from scratch."""
+        return (
+            services.filter(customer__isnull=False)
+            .values(
+                org_id=F("customer__owner_id"),
+                cohort=TruncMonth("customer__created_at"),
+                month=TruncMonth("start_date"),
+            )
+            .annotate(customers=Count("customer_id", distinct=True))
+            .order_by()
+        )
+
+    def rebuild(self, orgs=None):
+        services = Service.objects.all()
+        activity = CustomerActivity.objects.all()
+        cohorts = self.all()
+        if orgs is not None:
+            services = services.filter(customer__owner__in=orgs)
+            activity = activity.filter(org__in=orgs)
+            cohorts = cohorts.filter(org__in=orgs)
+        with transaction.atomic():
+            activity.delete()
+            cohorts.delete()
+            CustomerActivity.objects.bulk_create(
+                [
+                    CustomerActivity(**row)
+                    for row in services.filter(customer__isnull=False)
+                    .values(
+                        "customer_id",
+                        org_id=F("customer__owner_id"),
+                        cohort=TruncMonth("customer__created_at"),
+                        month=TruncMonth("start_date"),
+                    )
+                    .annotate(services=Count("id"))
+                    .order_by()
+                ],
+                batch_size=5000,
+            )
+            return self.bulk_create(
+                [CustomerCohort(**row) for row in self.compute(services)],
+                batch_size=5000,
+            )
+
+    def drift(self, orgs=None):
+        """Lists the (org_id, cohort, month) whose count of active customers
+        disagrees with the services, with the expected and stored counts."""
+        services = Service.objects.all()
+        cohorts = self.filter(customers__gt=0)
+        if orgs is not None:
+            services = services.filter(customer__owner__in=orgs)
+            cohorts = cohorts.filter(org__in=orgs)
+        expected = {
+            (row["org_id"], row["cohort"], row["month"]): row["customers"]
+            for row in self.compute(services)
+        }
+        stored = {
+            (cell.org_id, cell.cohort, cell.month): cell.customers for cell in cohorts
+        }
+        return [
+            (key, expected.get(key), stored.get(key))
+            for key in sorted(set(expected) | set(stored))
+            if expected.get(key) != stored.get(key)
+        ]
+
+
+class CustomerCohort(models.Model):
+    """How many customers created in the `cohort` month started a service
+    in `month`.
+
+    Maintained with CustomerActivity by Service.save(), the Service and
+    Customer receivers and the bulk create path, like ServiceMonthlyRollup.
+    rebuild_rollups recomputes both.
+    """
+
+    org = models.ForeignKey(Organization, on_delete=models.CASCADE)
+    cohort = models.DateField()
+    month = models.DateField()
+    customers = models.IntegerField(default=0)
+
+    objects = CustomerCohortManager()
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=["org", "cohort", "month"], name="unique_customer_cohort"
+            )
+        ]
+
+
 class Service(models.Model):
     owner = models.ForeignKey(Organization, on_delete=models.CASCADE)
     historic = models.ForeignKey(Historic, on_delete=models.CASCADE)
@@ -22,3 +389,124 @@ class Service(models.Model):
     end_date = models.DateField(null=True)
     price = models.DecimalField(max_digits=6, decimal_places=2, default=0)
     status = models.ForeignKey(Status, on_delete=models.SET_NULL, null=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    def rollup_row(self):
+        return (
+            self.owner_id,
+            self._meta.get_field("end_date").to_python(self.end_date),
+            self._meta.get_field("price").to_python(self.price),
+        )
+
+    def activity_row(self):
+        return (
+            self.customer_id,
+            self._meta.get_field("start_date").to_python(self.start_date),
+        )
+
+    def save(self, *args, **kwargs):
+        with transaction.atomic():
+            previous = None
+            if self.pk is not None:
+                previous = (
+                    Service.objects.select_for_update()
+                    .filter(pk=self.pk)
+                    .values_list(
+                        "owner_id", "end_date", "price", "customer_id", "start_date"
+                    )
+                    .first()
+                )
+            super().save(*args, **kwargs)
+            ServiceMonthlyRollup.objects.apply(
+                ServiceMonthlyRollup.objects.deltas(
+                    removed=[previous[:3]] if previous else [],
+                    added=[self.rollup_row()],
+                )
+            )
+            CustomerActivity.objects.apply(
+                CustomerActivity.objects.deltas(
+                    removed=[previous[3:]] if previous else [],
+                    added=[self.activity_row()],
+                )
+            )
+
+    class Meta:
+        indexes = [
+            models.Index(
+                fields=["owner", "end_date"], name="service_owner_end_date_idx"
+            ),
+            models.Index(
+                fields=["owner", "start_date", "status"],
+                name="service_owner_start_status_idx",
+            ),
+            models.Index(
+                fields=["owner", "updated_at"], name="service_owner_updated_idx"
+            ),
+        ]
+
+
+@receiver(post_save, sender=Address)
+@receiver(post_save, sender=Status)
+@receiver(pre_delete, sender=Status)
+def touch_nesting_services(sender, instance, **kwargs):
+    # Services render their address and status nested, so the version of
+    # every service showing them moves when they change.
+    field = "address" if sender is Address else "status"
+    Service.objects.filter(**{field: instance}).update(updated_at=timezone.now())
+
+
+@receiver(post_delete, sender=Service)
+def remove_service_from_rollup(sender, instance, **kwargs):
+    ServiceMonthlyRollup.objects.apply(
+        ServiceMonthlyRollup.objects.deltas(removed=[instance.rollup_row()])
+    )
+    CustomerActivity.objects.apply(
+        CustomerActivity.objects.deltas(removed=[instance.activity_row()])
+    )
+
+
+@receiver(post_save, sender=Customer)
+def move_customer_cohort(sender, instance, created, **kwargs):
+    if not created:
+        CustomerCohort.objects.move_customer(instance)
+
+
+@receiver(pre_delete, sender=Customer)
+def remove_customer_from_cohorts(sender, instance, **kwargs):
+    CustomerCohort.objects.remove_customer(instance)
+
+
+@receiver(post_save, sender=Service)
+@receiver(post_delete, sender=Service)
+def invalidate_service_analytics(sender, instance, **kwargs):
+    analytics_cache.invalidate(instance.owner_id)
+
+
+@receiver(post_save, sender=Status)
+@receiver(pre_delete, sender=Status)
+def invalidate_status_analytics(sender, instance, **kwargs):
+    # Services by status are labelled with the status name.
+    owners = Service.objects.filter(status=instance).values_list("owner_id", flat=True)
+    for org_id in owners.distinct().order_by():
+        analytics_cache.invalidate(org_id)
+
+
+@receiver(post_save, sender=Historic)
+@receiver(pre_delete, sender=Historic)
+@receiver(post_save, sender=Appliance)
+@receiver(pre_delete, sender=Appliance)
+@receiver(post_save, sender=Category)
+@receiver(pre_delete, sender=Category)
+def invalidate_category_analytics(sender, instance, **kwargs):
+    # Service statistics are grouped by the category name of the historic's
+    # appliance.
+    lookup = {
+        Historic: "historic",
+        Appliance: "historic__appliance",
+        Category: "historic__appliance__category",
+    }[sender]
+    owners = Service.objects.filter(**{lookup: instance}).values_list(
+        "owner_id", flat=True
+    )
+    for org_id in owners.distinct().order_by():
+        analytics_cache.invalidate(org_id)
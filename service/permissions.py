@@ -3,6 +3,6 @@ from rest_framework.permissions import BasePermission
 
 class IsServiceOwner(BasePermission):
     def has_object_permission(self, request, view, obj):
-        if request.user.profile.org == obj.owner:
+        if request.user.profile.org_id == obj.owner_id:
             return True
         return False
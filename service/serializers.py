@@ -0,0 +1,455 @@
+from datetime import date
+
+from django.db import transaction
+from django.db.models import Prefetch
+from rest_framework import serializers
+
+from core.utils.cache import analytics_cache
+from core.utils.dates import DateRangeSerializer
+from appliances.models import Appliance, Historic, Problem, Solution, Symptom
+from profiles.models import Address, Customer, Organization
+from .analytics import STATISTICS_GROUPS
+from .models import CustomerActivity, Service, ServiceMonthlyRollup, Status
+
+
+class ExpandableModelSerializer(serializers.ModelSerializer):
+    """Model serializer with sparse fieldsets and on-demand nesting.
+
+    Meta.expandable maps relation names to the serializer used when the
+    relation is expanded; relations that are not expanded render as primary
+    keys. `fields` trims the top-level fields and `expand` is a tree of
+    relations to nest, e.g. {"historic": {"appliance": {}}}. An expand of
+    None nests every expandable relation, recursively.
+
+    setup_eager_loading() builds the matching queryset: only the selected
+    columns, a join for each expanded foreign key and one prefetch per
+    many-to-many relation.
+    """
+
+    def __init__(self, *args, fields=None, expand=None, **kwargs):
+        super().__init__(*args, **kwargs)
+        if fields is not None:
+            for name in set(self.fields) - set(fields):
+                self.fields.pop(name)
+        for name, nested_class in self.get_expanded(expand):
+            if name in self.fields:
+                self.fields[name] = nested_class(
+                    many=self.is_many(name),
+                    read_only=True,
+                    expand=self.get_subtree(expand, name),
+                )
+
+    @classmethod
+    def get_expandable(cls):
+        return getattr(cls.Meta, "expandable", {})
+
+    @classmethod
+    def get_expanded(cls, expand):
+        return [
+            (name, nested_class)
+            for name, nested_class in cls.get_expandable().items()
+            if expand is None or name in expand
+        ]
+
+    @staticmethod
+    def get_subtree(expand, name):
+        return None if expand is None else expand[name]
+
+    @classmethod
+    def is_many(cls, name):
+        return cls.Meta.model._meta.get_field(name).many_to_many
+
+    @classmethod
+    def parse_fieldset(cls, query_params):
+        """Reads ?fields= and ?expand= into the arguments of __init__."""
+        fields = None
+        if "fields" in query_params:
+            fields = [f for f in query_params["fields"].split(",") if f]
+            unknown = set(fields) - set(cls.Meta.fields)
+            if unknown:
+                raise serializers.ValidationError(
+                    {"fields": "Unknown fields: %s" % ", ".join(sorted(unknown))}
+                )
+
+        expand = None
+        if "expand" in query_params:
+            expand = {}
+            for path in [p for p in query_params["expand"].split(",") if p]:
+                serializer_class, tree = cls, expand
+                for name in path.split("."):
+                    nested_class = serializer_class.get_expandable().get(name)
+                    if nested_class is None:
+                        raise serializers.ValidationError(
+                            {"expand": "Relation %s can not be expanded" % path}
+                        )
+                    tree = tree.setdefault(name, {})
+                    serializer_class = nested_class
+        return fields, expand
+
+    @classmethod
+    def get_loading_plan(cls, fields=None, expand=None, prefix=""):
+        model = cls.Meta.model
+        expanded = dict(cls.get_expanded(expand))
+        only, select_related, prefetch_related = [], [], []
+
+        for name in cls.Meta.fields:
+            if fields is not None and name not in fields:
+                continue
+            field = model._meta.get_field(name)
+            path = prefix + name
+            nested_class = expanded.get(name)
+
+            if field.many_to_many:
+                if nested_class:
+                    queryset = nested_class.setup_eager_loading(
+                        field.related_model.objects.all(),
+                        expand=cls.get_subtree(expand, name),
+                    )
+                else:
+                    queryset = field.related_model.objects.only("pk")
+                prefetch_related.append(Prefetch(path, queryset=queryset))
+            elif field.is_relation and nested_class:
+                select_related.append(path)
+                nested_plan = nested_class.get_loading_plan(
+                    expand=cls.get_subtree(expand, name), prefix=path + "__"
+                )
+                only += nested_plan[0]
+                select_related += nested_plan[1]
+                prefetch_related += nested_plan[2]
+            else:
+                only.append(path)
+        return only, select_related, prefetch_related
+
+    @classmethod
+    def setup_eager_loading(cls, queryset, fields=None, expand=None, required=()):
+        only, select_related, prefetch_related = cls.get_loading_plan(fields, expand)
+        queryset = queryset.only(*only, *required)
+        if select_related:
+            queryset = queryset.select_related(*select_related)
+        if prefetch_related:
+            queryset = queryset.prefetch_related(*prefetch_related)
+        return queryset
+
+
+class OrganizationNestedSerializer(ExpandableModelSerializer):
+    class Meta:
+        model = Organization
+        fields = ["id", "name"]
+
+
+class StatusNestedSerializer(ExpandableModelSerializer):
+    class Meta:
+        model = Status
+        fields = ["id", "name", "description", "is_conclusive", "is_active"]
+
+
+class AddressNestedSerializer(ExpandableModelSerializer):
+    class Meta:
+        model = Address
+        fields = [
+            "id",
+            "number",
+            "street",
+            "neighborhood",
+            "city",
+            "state",
+            "country",
+            "coordinates",
+            "complement",
+            "is_active",
+            "type",
+        ]
+
+
+class CustomerNestedSerializer(ExpandableModelSerializer):
+    class Meta:
+        model = Customer
+        fields = [
+            "id",
+            "name",
+            "email",
+            "nickname",
+            "profession",
+            "phone1",
+            "phone2",
+            "created_at",
+            "owner",
+            "addresses",
+        ]
+        expandable = {
+            "owner": OrganizationNestedSerializer,
+            "addresses": AddressNestedSerializer,
+        }
+
+
+class ApplianceNestedSerializer(ExpandableModelSerializer):
+    class Meta:
+        model = Appliance
+        fields = ["id", "model", "brand", "category"]
+
+
+class SymptomNestedSerializer(ExpandableModelSerializer):
+    class Meta:
+        model = Symptom
+        fields = ["id", "name", "description", "categories", "causes"]
+
+
+class ProblemNestedSerializer(ExpandableModelSerializer):
+    class Meta:
+        model = Problem
+        fields = ["id", "name", "description", "solutions"]
+
+
+class SolutionNestedSerializer(ExpandableModelSerializer):
+    class Meta:
+        model = Solution
+        fields = ["id", "name", "description"]
+
+
+class HistoricNestedSerializer(ExpandableModelSerializer):
+    class Meta:
+        model = Historic
+        fields = [
+            "id",
+            "completed",
+            "appliance",
+            "org",
+            "symptoms",
+            "problems",
+            "solutions",
+        ]
+        expandable = {
+            "appliance": ApplianceNestedSerializer,
+            "org": OrganizationNestedSerializer,
+            "symptoms": SymptomNestedSerializer,
+            "problems": ProblemNestedSerializer,
+            "solutions": SolutionNestedSerializer,
+        }
+
+
+class ServiceReadSerializer(ExpandableModelSerializer):
+    """Read-only representation of a service.
+
+    Every relation is nested unless the client narrows it down with
+    ?fields= and ?expand=. Use setup_eager_loading() with the same
+    arguments on the queryset before serializing it.
+    """
+
+    class Meta:
+        model = Service
+        fields = [
+            "id",
+            "start_date",
+            "end_date",
+            "price",
+            "owner",
+            "historic",
+            "customer",
+            "address",
+            "status",
+        ]
+        read_only_fields = fields
+        expandable = {
+            "owner": OrganizationNestedSerializer,
+            "historic": HistoricNestedSerializer,
+            "customer": CustomerNestedSerializer,
+            "address": AddressNestedSerializer,
+            "status": StatusNestedSerializer,
+        }
+
+
+class ServiceBulkCreateListSerializer(serializers.ListSerializer):
+    """Validates and writes a whole batch of services at once.
+
+    Referenced customers, addresses and statuses are checked with a single
+    query per table, each address against the customer of its item. The
+    historics and services are written with one bulk_create each inside a
+    transaction. Expects the organization in context["org"] and, when
+    creating for a single customer, context["customer"].
+    """
+
+    max_items = 1000
+
+    def to_internal_value(self, data):
+        if isinstance(data, list) and len(data) > self.max_items:
+            raise serializers.ValidationError(
+                {"non_field_errors": ["Send at most %d services." % self.max_items]}
+            )
+        items = super().to_internal_value(data)
+
+        org = self.context["org"]
+        customer = self.context.get("customer")
+        if customer is not None:
+            for item in items:
+                item["customer"] = customer.id
+
+        customers = set(
+            Customer.objects.filter(
+                owner=org, pk__in={i["customer"] for i in items if i.get("customer")}
+            ).values_list("id", flat=True)
+        )
+        # Customers and addresses are many-to-many, so this is the set of
+        # (address, customer) pairs of the org.
+        address_customers = set(
+            Address.objects.filter(
+                customer__owner=org,
+                pk__in={i["address"] for i in items if i.get("address")},
+            ).values_list("id", "customer")
+        )
+        addresses = {address for address, customer in address_customers}
+        self.statuses = Status.objects.in_bulk(
+            {i["status"] for i in items if i.get("status")}
+        )
+
+        errors = []
+        for item in items:
+            item_errors = {}
+            for name, valid_ids in (
+                ("customer", customers),
+                ("address", addresses),
+                ("status", self.statuses),
+            ):
+                if item.get(name) is not None and item[name] not in valid_ids:
+                    item_errors[name] = [
+                        'Invalid pk "%s" - object does not exist.' % item[name]
+                    ]
+            address = item.get("address")
+            if address in addresses and (
+                (address, item.get("customer")) not in address_customers
+            ):
+                item_errors["address"] = ["Address does not belong to the customer."]
+            errors.append(item_errors)
+        if any(errors):
+            raise serializers.ValidationError(errors)
+        return items
+
+    def create(self, validated_data):
+        org = self.context["org"]
+        with transaction.atomic():
+            historics = Historic.objects.bulk_create(
+                [Historic(org=org) for item in validated_data]
+            )
+            services = []
+            for item, historic in zip(validated_data, historics):
+                status = self.statuses.get(item.get("status"))
+                services.append(
+                    Service(
+                        owner=org,
+                        historic=historic,
+                        customer_id=item.get("customer"),
+                        address_id=item.get("address"),
+                        status=status,
+                        start_date=item.get("start_date") or date.today(),
+                        end_date=date.today()
+                        if status and status.is_conclusive
+                        else None,
+                        price=item.get("price", 0),
+                    )
+                )
+            services = Service.objects.bulk_create(services)
+            ServiceMonthlyRollup.objects.apply(
+                ServiceMonthlyRollup.objects.deltas(
+                    added=[service.rollup_row() for service in services]
+                )
+            )
+            CustomerActivity.objects.apply(
+                CustomerActivity.objects.deltas(
+                    added=[service.activity_row() for service in services]
+                )
+            )
+            analytics_cache.invalidate(org.pk)
+            return services
+
+
+class ServiceCreateSerializer(serializers.Serializer):
+    customer = serializers.IntegerField(required=False, allow_null=True)
+    address = serializers.IntegerField(required=False, allow_null=True)
+    status = serializers.IntegerField(required=False, allow_null=True)
+    start_date = serializers.DateField(required=False)
+    price = serializers.DecimalField(max_digits=6, decimal_places=2, required=False)
+
+    class Meta:
+        list_serializer_class = ServiceBulkCreateListSerializer
+
+
+class ServiceBulkStatusSerializer(serializers.Serializer):
+    services = serializers.ListField(
+        child=serializers.IntegerField(), allow_empty=False, max_length=1000
+    )
+    status = serializers.PrimaryKeyRelatedField(queryset=Status.objects.all())
+
+
+class ServiceExportFilterSerializer(serializers.Serializer):
+    start = serializers.DateField(required=False)
+    end = serializers.DateField(required=False)
+    status = serializers.ListField(child=serializers.IntegerField(), required=False)
+
+
+class DashboardQuerySerializer(serializers.Serializer):
+    available_widgets = [
+        "serviceHistory",
+        "servicesByStatus",
+        "topCustomersIncome",
+        "topCustomersServices",
+        "customerHistory",
+    ]
+
+    widgets = serializers.CharField(required=False)
+    days = serializers.IntegerField(required=False, default=30, min_value=0)
+    quantity = serializers.IntegerField(required=False, default=5, min_value=1)
+
+    def validate_widgets(self, value):
+        widgets = [widget for widget in value.split(",") if widget]
+        unknown = set(widgets) - set(self.available_widgets)
+        if unknown:
+            raise serializers.ValidationError(
+                "Unknown widgets: %s" % ", ".join(sorted(unknown))
+            )
+        return widgets
+
+    def validate(self, attrs):
+        attrs.setdefault("widgets", self.available_widgets)
+        return attrs
+
+    def cache_key(self):
+        return "dashboard:%s:%d:%d:%s" % (
+            ",".join(self.validated_data["widgets"]),
+            self.validated_data["days"],
+            self.validated_data["quantity"],
+            date.today(),
+        )
+
+
+class ServiceStatisticsQuerySerializer(DateRangeSerializer):
+    """?metric=&group=&bins= and a from/to range of start_date."""
+
+    bucket = None
+
+    metric = serializers.ChoiceField(choices=["duration", "price"], default="duration")
+    group = serializers.ChoiceField(choices=list(STATISTICS_GROUPS), required=False)
+    bins = serializers.IntegerField(
+        required=False, default=10, min_value=1, max_value=100
+    )
+
+    def cache_key(self):
+        return ":".join(
+            "%s=%s" % (name, value)
+            for name, value in sorted(self.validated_data.items())
+        )
+
+
+class CustomerCohortQuerySerializer(DateRangeSerializer):
+    """?months= and a from/to range of cohort months."""
+
+    bucket = None
+
+    months = serializers.IntegerField(
+        required=False, default=12, min_value=0, max_value=120
+    )
+
+    def cache_key(self):
+        return "%s:%s:%d" % (
+            self.validated_data.get("from"),
+            self.validated_data.get("to"),
+            self.validated_data["months"],
+        )
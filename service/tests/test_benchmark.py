@@ -0,0 +1,91 @@
+from io import StringIO
+
+from django.core.management import call_command
+from django.db import connection
+from django.test import TestCase
+
+from service.benchmark import DashboardBenchmark, QueryBenchmark, ShapingBenchmark
+from service.models import Service
+
+
+class QueryBenchmarkTest(TestCase):
+    def index_names(self):
+        with connection.cursor() as cursor:
+            constraints = connection.introspection.get_constraints(
+                cursor, Service._meta.db_table
+            )
+        return {name for name, info in constraints.items() if info["index"]}
+
+    def test_seed_spreads_services_over_organizations(self):
+        benchmark = QueryBenchmark(200)
+        benchmark.seed()
+
+        self.assertEqual(Service.objects.count(), 200)
+        self.assertEqual(
+            Service.objects.filter(owner=benchmark.user.profile.org).count(), 20
+        )
+
+    def test_run_measures_each_endpoint_without_and_with_indexes(self):
+        benchmark = QueryBenchmark(100)
+        benchmark.seed()
+        results = benchmark.run(repeat=1)
+
+        self.assertEqual(len(results), 2 * len(QueryBenchmark.endpoints))
+        self.assertEqual(
+            {result["phase"] for result in results},
+            {"without indexes", "with indexes"},
+        )
+        for result in results:
+            self.assertEqual(result["status"], 200)
+            self.assertEqual(len(result["plans"]), result["queries"])
+
+    def test_indexes_are_restored_after_run(self):
+        benchmark = QueryBenchmark(100)
+        benchmark.seed()
+        benchmark.run(repeat=1)
+
+        self.assertTrue(
+            {
+                "service_owner_end_date_idx",
+                "service_owner_start_status_idx",
+                "service_owner_updated_idx",
+            }
+            <= self.index_names()
+        )
+
+
+class DashboardBenchmarkTest(TestCase):
+    def test_run_times_every_query_and_mode(self):
+        benchmark = QueryBenchmark(100)
+        benchmark.seed()
+        results = DashboardBenchmark(benchmark).run(repeat=1)
+
+        self.assertEqual(
+            [result["mode"] for result in results],
+            [
+                "query serviceHistory",
+                "query servicesByStatus",
+                "query customerTotals",
+                "query customerHistory",
+                "sequential",
+                "concurrent",
+                "async",
+            ],
+        )
+
+
+class ShapingBenchmarkTest(TestCase):
+    def test_run_compares_every_case(self):
+        results = ShapingBenchmark(50).run(repeat=2)
+
+        self.assertEqual([result["case"] for result in results], ["history", "status"])
+        for result in results:
+            self.assertEqual(result["rows"], 50)
+            self.assertGreater(result["columns_ms"], 0)
+
+    def test_command_reports_each_case(self):
+        out = StringIO()
+        call_command("benchmark_shaping", "--rows", "50", "--repeat", "2", stdout=out)
+
+        self.assertIn("history", out.getvalue())
+        self.assertIn("status", out.getvalue())
@@ -0,0 +1,47 @@
+from datetime import date
+from decimal import Decimal
+from io import StringIO
+
+from django.core.management import CommandError, call_command
+from django.test import TestCase
+
+from service.models import CustomerCohort, Service, ServiceMonthlyRollup
+from service.tests.factories import OrganizationFactory, ServiceFactory
+
+
+class RebuildRollupsCommandTest(TestCase):
+    def setUp(self):
+        self.org = OrganizationFactory()
+        ServiceFactory(owner=self.org, end_date=date(2022, 3, 5), price=Decimal("10"))
+
+    def test_check_passes_when_rollups_match(self):
+        out = StringIO()
+        call_command("rebuild_rollups", "--check", stdout=out)
+
+        self.assertIn("match", out.getvalue())
+
+    def test_check_reports_drift_without_fixing_it(self):
+        Service.objects.update(price=Decimal("40"))
+        out = StringIO()
+        with self.assertRaises(CommandError):
+            call_command("rebuild_rollups", "--check", stdout=out)
+
+        self.assertIn("org %s 2022-03" % self.org.id, out.getvalue())
+        self.assertEqual(ServiceMonthlyRollup.objects.get().revenue, Decimal("10"))
+
+    def test_rebuild_fixes_drift(self):
+        Service.objects.update(price=Decimal("40"))
+        call_command("rebuild_rollups", "--org", str(self.org.id), stdout=StringIO())
+
+        self.assertEqual(ServiceMonthlyRollup.objects.get().revenue, Decimal("40"))
+        self.assertEqual(ServiceMonthlyRollup.objects.drift(), [])
+
+    def test_check_reports_cohort_drift(self):
+        Service.objects.update(start_date=date(2022, 4, 1))
+        out = StringIO()
+        with self.assertRaises(CommandError):
+            call_command("rebuild_rollups", "--check", stdout=out)
+
+        self.assertIn("cohort", out.getvalue())
+        call_command("rebuild_rollups", stdout=StringIO())
+        self.assertEqual(CustomerCohort.objects.drift(), [])
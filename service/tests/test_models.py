@@ -1,6 +1,12 @@
 from datetime import date
 from django.test import TestCase
-from service.models import Service, Status
+from service.models import (
+    CustomerActivity,
+    CustomerCohort,
+    Service,
+    ServiceMonthlyRollup,
+    Status,
+)
 from datetime import date
 
 from service.tests.factories import (
@@ -151,3 +157,195 @@ class StatusModelTest(TestCase):
         )
         newStatusCount = Status.objects.count()
         self.assertEqual(newStatusCount, statusCount + 1)
+
+
+class ServiceMonthlyRollupTest(TestCase):
+    def setUp(self):
+        self.org = OrganizationFactory()
+
+    def rollups(self):
+        return {
+            (rollup.year, rollup.month): (rollup.revenue, rollup.count)
+            for rollup in ServiceMonthlyRollup.objects.filter(org=self.org, count__gt=0)
+        }
+
+    def test_concluded_service_is_added_on_create(self):
+        ServiceFactory(owner=self.org, end_date=date(2022, 3, 5), price=Decimal("10"))
+        ServiceFactory(owner=self.org, end_date=date(2022, 3, 9), price=Decimal("5"))
+        ServiceFactory(owner=self.org, price=Decimal("7"))
+
+        self.assertEqual(self.rollups(), {(2022, 3): (Decimal("15"), 2)})
+
+    def test_price_and_end_date_changes_move_deltas(self):
+        service = ServiceFactory(
+            owner=self.org, end_date=date(2022, 3, 5), price=Decimal("10")
+        )
+        service.price = Decimal("12.50")
+        service.save()
+        self.assertEqual(self.rollups(), {(2022, 3): (Decimal("12.50"), 1)})
+
+        service.end_date = date(2022, 4, 1)
+        service.save()
+        self.assertEqual(self.rollups(), {(2022, 4): (Decimal("12.50"), 1)})
+
+        service.end_date = None
+        service.save()
+        self.assertEqual(self.rollups(), {})
+
+    def test_stale_instance_saves_against_current_row(self):
+        service = ServiceFactory(owner=self.org, price=Decimal("10"))
+        stale = Service.objects.get(pk=service.pk)
+        Service.objects.filter(pk=service.pk).update(end_date=date(2022, 1, 1))
+        ServiceMonthlyRollup.objects.rebuild([self.org])
+        stale.price = Decimal("20")
+        stale.end_date = date(2022, 2, 1)
+        stale.save()
+
+        self.assertEqual(self.rollups(), {(2022, 2): (Decimal("20"), 1)})
+        self.assertEqual(ServiceMonthlyRollup.objects.drift([self.org]), [])
+
+    def test_first_services_of_a_month_add_to_a_concurrent_row(self):
+        # Another transaction created the month's row between our read and
+        # our write: the upsert adds to it instead of failing.
+        ServiceMonthlyRollup.objects.create(
+            org=self.org, year=2022, month=3, revenue=Decimal("4"), count=1
+        )
+        ServiceMonthlyRollup.objects.apply({(self.org.id, 2022, 3): [Decimal("6"), 2]})
+
+        self.assertEqual(self.rollups(), {(2022, 3): (Decimal("10"), 3)})
+
+    def test_delete_removes_service(self):
+        kept = ServiceFactory(owner=self.org, end_date=date(2022, 3, 5), price=10)
+        removed = ServiceFactory(owner=self.org, end_date=date(2022, 3, 5), price=4)
+        removed.delete()
+
+        self.assertEqual(self.rollups(), {(2022, 3): (Decimal("10"), 1)})
+
+    def test_cascading_customer_delete_removes_services(self):
+        service = ServiceFactory(owner=self.org, end_date=date(2022, 3, 5), price=10)
+        service.customer.delete()
+
+        self.assertEqual(self.rollups(), {})
+
+    def test_deleting_organization_removes_its_rollups(self):
+        ServiceFactory(owner=self.org, end_date=date(2022, 3, 5), price=10)
+        self.org.delete()
+
+        self.assertFalse(ServiceMonthlyRollup.objects.exists())
+
+    def test_drift_and_rebuild(self):
+        ServiceFactory(owner=self.org, end_date=date(2022, 3, 5), price=10)
+        Service.objects.filter(owner=self.org).update(price=30)
+
+        drift = ServiceMonthlyRollup.objects.drift([self.org])
+        self.assertEqual(
+            drift,
+            [((self.org.id, 2022, 3), (Decimal("30"), 1), (Decimal("10"), 1))],
+        )
+        ServiceMonthlyRollup.objects.rebuild([self.org])
+        self.assertEqual(ServiceMonthlyRollup.objects.drift([self.org]), [])
+        self.assertEqual(self.rollups(), {(2022, 3): (Decimal("30"), 1)})
+
+
+class CustomerCohortTest(TestCase):
+    def setUp(self):
+        self.org = OrganizationFactory()
+        self.customer = CustomerFactory(owner=self.org, created_at=date(2022, 1, 5))
+
+    def cells(self):
+        return {
+            (cell.cohort, cell.month): cell.customers
+            for cell in CustomerCohort.objects.filter(org=self.org, customers__gt=0)
+        }
+
+    def test_customers_are_counted_once_per_month(self):
+        other = CustomerFactory(owner=self.org, created_at=date(2022, 1, 20))
+        for customer in (self.customer, self.customer, other):
+            ServiceFactory(
+                owner=self.org, customer=customer, start_date=date(2022, 2, 3)
+            )
+
+        self.assertEqual(self.cells(), {(date(2022, 1, 1), date(2022, 2, 1)): 2})
+
+    def test_start_date_and_customer_changes_move_the_customer(self):
+        service = ServiceFactory(
+            owner=self.org, customer=self.customer, start_date=date(2022, 2, 3)
+        )
+        service.start_date = date(2022, 3, 1)
+        service.save()
+        self.assertEqual(self.cells(), {(date(2022, 1, 1), date(2022, 3, 1)): 1})
+
+        service.customer = CustomerFactory(owner=self.org, created_at=date(2022, 2, 1))
+        service.save()
+        self.assertEqual(self.cells(), {(date(2022, 2, 1), date(2022, 3, 1)): 1})
+
+    def test_delete_keeps_customers_with_other_services(self):
+        ServiceFactory(
+            owner=self.org, customer=self.customer, start_date=date(2022, 2, 3)
+        )
+        removed = ServiceFactory(
+            owner=self.org, customer=self.customer, start_date=date(2022, 2, 9)
+        )
+        removed.delete()
+        self.assertEqual(self.cells(), {(date(2022, 1, 1), date(2022, 2, 1)): 1})
+
+        Service.objects.get().delete()
+        self.assertEqual(self.cells(), {})
+
+    def test_first_service_of_a_month_adds_to_a_concurrent_row(self):
+        # Another transaction counted the customer's first service of the
+        # month between our read and our write.
+        month = date(2022, 2, 1)
+        CustomerActivity.objects.create(
+            org=self.org,
+            customer=self.customer,
+            cohort=date(2022, 1, 1),
+            month=month,
+            services=1,
+        )
+        CustomerCohort.objects.create(
+            org=self.org, cohort=date(2022, 1, 1), month=month, customers=1
+        )
+        CustomerActivity.objects.apply({(self.customer.id, month): 1})
+
+        self.assertEqual(CustomerActivity.objects.get().services, 2)
+        self.assertEqual(self.cells(), {(date(2022, 1, 1), month): 1})
+
+        CustomerActivity.objects.apply({(self.customer.id, month): -2})
+        self.assertFalse(CustomerActivity.objects.exists())
+        self.assertEqual(self.cells(), {})
+
+    def test_changing_created_at_moves_the_cohort(self):
+        ServiceFactory(
+            owner=self.org, customer=self.customer, start_date=date(2022, 2, 3)
+        )
+        self.customer.created_at = date(2021, 12, 1)
+        self.customer.save()
+
+        self.assertEqual(self.cells(), {(date(2021, 12, 1), date(2022, 2, 1)): 1})
+
+    def test_deleting_a_customer_removes_it(self):
+        ServiceFactory(
+            owner=self.org, customer=self.customer, start_date=date(2022, 2, 3)
+        )
+        self.customer.delete()
+
+        self.assertEqual(self.cells(), {})
+        self.assertEqual(CustomerCohort.objects.drift([self.org]), [])
+
+    def test_drift_and_rebuild(self):
+        ServiceFactory(
+            owner=self.org, customer=self.customer, start_date=date(2022, 2, 3)
+        )
+        Service.objects.update(start_date=date(2022, 4, 1))
+
+        self.assertEqual(
+            CustomerCohort.objects.drift([self.org]),
+            [
+                ((self.org.id, date(2022, 1, 1), date(2022, 2, 1)), None, 1),
+                ((self.org.id, date(2022, 1, 1), date(2022, 4, 1)), 1, None),
+            ],
+        )
+        CustomerCohort.objects.rebuild([self.org])
+        self.assertEqual(CustomerCohort.objects.drift([self.org]), [])
+        self.assertEqual(self.cells(), {(date(2022, 1, 1), date(2022, 4, 1)): 1})
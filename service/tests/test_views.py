@@ -1,18 +1,37 @@
 from datetime import date, timedelta
 from decimal import Decimal
-from django.test import TestCase
+from django.db import connection
+from django.test import (
+    AsyncClient,
+    Client,
+    TestCase,
+    TransactionTestCase,
+    override_settings,
+)
+from django.test.utils import CaptureQueriesContext
 from django.urls import reverse
-from appliances.tests.factories import ApplianceFactory
+from appliances.models import Historic
+from appliances.tests.factories import (
+    ApplianceFactory,
+    CategoryFactory,
+    ProblemFactory,
+    SolutionFactory,
+    SymptomFactory,
+)
 from profiles.models import Customer
 from profiles.tests.factories import AddressFactory, CustomerFactory, UserFactory
-from service.models import Service, Status
+from service.models import Service, ServiceMonthlyRollup, Status
+from rest_framework.authtoken.models import Token
 from rest_framework.test import APIClient
+import csv
 import io
+import json
 from rest_framework.parsers import JSONParser
 from service.services import InitialSampleDataCreation
 from django.contrib.auth.models import User
 
 from service.tests.factories import ServiceFactory
+from core.utils.cache import analytics_cache
 
 
 class ServiceViewTest(TestCase):
@@ -199,6 +218,11 @@ class ServiceViewTest(TestCase):
         newServiceCount = Service.objects.filter(customer=self.customer1).count()
         self.assertEqual(newServiceCount, serviceCount + 1)
 
+        data = response.json()
+        self.assertEqual(data["customer"]["id"], self.customer1.id)
+        self.assertEqual(data["customer"]["owner"], self.customer1.owner_id)
+        self.assertIsInstance(data["historic"]["org"], int)
+
     def test_create_service_for_customer_with_not_authenticated_user(self):
         serviceCount = Service.objects.filter(customer=self.customer1).count()
 
@@ -310,6 +334,1044 @@ class ServiceViewTest(TestCase):
         self.assertEqual(data["end_date"], date.today().strftime("%Y-%m-%d"))
 
 
+class ServiceListQueryCountTest(TestCase):
+    def setUp(self):
+        self.user1 = UserFactory()
+        org = self.user1.profile.org
+        self.user1Client = APIClient()
+        self.user1Client.force_authenticate(user=User.objects.get(pk=self.user1.pk))
+
+        self.customer = CustomerFactory(
+            owner=org, addresses=(AddressFactory(), AddressFactory())
+        )
+        self.status = Status.objects.create(name="open", description="open")
+        appliance = ApplianceFactory()
+        solution = SolutionFactory()
+        problem = ProblemFactory(solutions=(solution,))
+        symptom = SymptomFactory(causes=(problem,))
+
+        historics = Historic.objects.bulk_create(
+            [Historic(org=org, appliance=appliance) for i in range(1000)]
+        )
+        for through, field, value in (
+            (Historic.symptoms.through, "symptom_id", symptom.id),
+            (Historic.problems.through, "problem_id", problem.id),
+            (Historic.solutions.through, "solution_id", solution.id),
+        ):
+            through.objects.bulk_create(
+                [
+                    through(**{"historic_id": historic.id, field: value})
+                    for historic in historics
+                ]
+            )
+        Service.objects.bulk_create(
+            [
+                Service(
+                    owner=org,
+                    historic=historic,
+                    customer=self.customer,
+                    address=self.customer.addresses.first(),
+                    status=self.status,
+                    price=Decimal("10"),
+                )
+                for historic in historics
+            ]
+        )
+
+    def list_services(self, limit):
+        return self.user1Client.get(
+            "%s?limit=%s&offset=0" % (reverse("service:service_list"), limit),
+            format="json",
+        )
+
+    def test_list_10_services_query_count(self):
+        with self.assertNumQueries(12):
+            response = self.list_services(10)
+        self.assertEqual(len(response.data["results"]), 10)
+
+    def test_list_100_services_query_count(self):
+        with self.assertNumQueries(12):
+            response = self.list_services(100)
+        self.assertEqual(len(response.data["results"]), 100)
+
+    def test_list_1000_services_query_count(self):
+        with self.assertNumQueries(12):
+            response = self.list_services(1000)
+        self.assertEqual(len(response.data["results"]), 1000)
+
+    def test_list_services_keeps_nested_representation(self):
+        response = self.list_services(1)
+
+        service = response.data["results"][0]
+        self.assertEqual(service["customer"]["name"], self.customer.name)
+        self.assertEqual(service["customer"]["owner"]["id"], self.customer.owner.id)
+        self.assertEqual(len(service["customer"]["addresses"]), 2)
+        self.assertEqual(service["status"]["name"], self.status.name)
+        self.assertEqual(len(service["historic"]["symptoms"]), 1)
+        self.assertEqual(
+            len(service["historic"]["symptoms"][0]["causes"]),
+            1,
+        )
+        self.assertEqual(len(service["historic"]["problems"][0]["solutions"]), 1)
+
+    def test_service_detail_query_count(self):
+        service = Service.objects.first()
+        with self.assertNumQueries(10):
+            response = self.user1Client.get(
+                reverse("service:service_detail", kwargs={"service_pk": service.id}),
+                format="json",
+            )
+        self.assertEqual(response.status_code, 200)
+
+    def test_customer_service_list_query_count(self):
+        with self.assertNumQueries(14):
+            response = self.user1Client.get(
+                "%s?limit=1000&offset=0"
+                % reverse(
+                    "service:customer_service_list",
+                    kwargs={"customer_pk": self.customer.id},
+                ),
+                format="json",
+            )
+        self.assertEqual(len(response.data["results"]), 1000)
+
+
+class ServiceFieldsetTest(TestCase):
+    def setUp(self):
+        self.user1 = UserFactory()
+        self.user1Client = APIClient()
+        self.user1Client.force_authenticate(user=self.user1)
+
+        self.status = Status.objects.create(name="open", description="open")
+        self.service = ServiceFactory(owner=self.user1.profile.org, status=self.status)
+        self.service.historic.symptoms.add(SymptomFactory())
+
+    def get_services(self, query):
+        return self.user1Client.get(
+            "%s?limit=10&offset=0&%s" % (reverse("service:service_list"), query),
+            format="json",
+        )
+
+    def test_list_services_with_sparse_fieldset(self):
+        response = self.get_services(
+            "fields=id,status,customer,start_date,price&expand=status,customer"
+        )
+
+        self.assertEqual(response.status_code, 200)
+        service = response.data["results"][0]
+        self.assertEqual(
+            list(service.keys()), ["id", "start_date", "price", "customer", "status"]
+        )
+        self.assertEqual(service["status"]["name"], "open")
+        self.assertEqual(service["customer"]["name"], self.service.customer.name)
+        self.assertEqual(service["customer"]["owner"], self.user1.profile.org.id)
+
+    def test_unexpanded_relations_render_as_primary_keys(self):
+        response = self.get_services("expand=historic.appliance")
+
+        service = response.data["results"][0]
+        self.assertEqual(service["customer"], self.service.customer.id)
+        self.assertEqual(service["status"], self.status.id)
+        self.assertEqual(
+            service["historic"]["appliance"]["model"],
+            self.service.historic.appliance.model,
+        )
+        self.assertEqual(service["historic"]["org"], self.user1.profile.org.id)
+        self.assertEqual(
+            service["historic"]["symptoms"],
+            [self.service.historic.symptoms.first().id],
+        )
+
+    def test_sparse_fieldset_selects_only_requested_columns_without_joins(self):
+        with CaptureQueriesContext(connection) as context:
+            self.get_services("fields=id,price,status&expand=")
+
+        sql = context.captured_queries[-1]["sql"]
+        self.assertIn('"service_service"."price"', sql)
+        self.assertIn('"service_service"."status_id"', sql)
+        self.assertNotIn('"service_service"."end_date"', sql)
+        self.assertNotIn("JOIN", sql)
+
+    def test_expanded_relation_is_joined(self):
+        with CaptureQueriesContext(connection) as context:
+            self.get_services("fields=id,status&expand=status")
+
+        sql = context.captured_queries[-1]["sql"]
+        self.assertIn('JOIN "service_status"', sql)
+        self.assertNotIn('"profiles_customer"', sql)
+
+    def test_service_detail_with_sparse_fieldset(self):
+        response = self.user1Client.get(
+            "%s?fields=id,price"
+            % reverse("service:service_detail", kwargs={"service_pk": self.service.id}),
+            format="json",
+        )
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(list(response.data.keys()), ["id", "price"])
+
+    def test_customer_service_list_with_expand(self):
+        response = self.user1Client.get(
+            "%s?limit=10&offset=0&expand=address"
+            % reverse(
+                "service:customer_service_list",
+                kwargs={"customer_pk": self.service.customer.id},
+            ),
+            format="json",
+        )
+
+        service = response.data["results"][0]
+        self.assertEqual(service["address"]["number"], self.service.address.number)
+        self.assertEqual(service["historic"], self.service.historic.id)
+
+    def test_unknown_field_returns_bad_request(self):
+        response = self.get_services("fields=id,secret")
+        self.assertEqual(response.status_code, 400)
+
+    def test_unknown_expansion_returns_bad_request(self):
+        response = self.get_services("expand=historic.owner")
+        self.assertEqual(response.status_code, 400)
+
+
+class ServiceNormalizedListTest(TestCase):
+    def setUp(self):
+        self.user1 = UserFactory()
+        self.user1Client = APIClient()
+        self.user1Client.force_authenticate(user=self.user1)
+
+        self.status = Status.objects.create(name="open", description="open")
+        self.customer = CustomerFactory(owner=self.user1.profile.org)
+        for i in range(4):
+            ServiceFactory(
+                owner=self.user1.profile.org,
+                customer=self.customer,
+                status=self.status,
+            )
+
+    def get_normalized(self, query=""):
+        response = self.user1Client.get(
+            "%s?limit=10&offset=0&format=normalized%s"
+            % (reverse("service:service_list"), query)
+        )
+        self.assertEqual(response.status_code, 200)
+        return response.json()
+
+    def test_rows_carry_foreign_key_ids(self):
+        data = self.get_normalized()
+
+        self.assertEqual(len(data["results"]), 4)
+        self.assertEqual(data["results"][0]["customer"], self.customer.id)
+        self.assertEqual(data["results"][0]["status"], self.status.id)
+
+    def test_each_referenced_entity_is_included_once(self):
+        data = self.get_normalized()
+
+        included = data["included"]
+        self.assertEqual(list(included["customers"]), [str(self.customer.id)])
+        self.assertEqual(list(included["statuses"]), [str(self.status.id)])
+        self.assertEqual(
+            list(included["organizations"]), [str(self.user1.profile.org.id)]
+        )
+        self.assertEqual(len(included["historics"]), 4)
+        self.assertEqual(len(included["addresses"]), 4)
+        self.assertEqual(
+            included["customers"][str(self.customer.id)]["name"], self.customer.name
+        )
+
+    def test_included_follows_sparse_fieldset(self):
+        data = self.get_normalized("&fields=id,status")
+
+        self.assertEqual(list(data["included"]), ["statuses"])
+
+    def test_normalized_query_count_does_not_grow_with_rows(self):
+        url = "%s?limit=100&offset=0&format=normalized" % reverse(
+            "service:service_list"
+        )
+        self.user1Client.get(url)
+        with self.assertNumQueries(12):
+            self.user1Client.get(url)
+
+        for i in range(10):
+            ServiceFactory(owner=self.user1.profile.org, status=self.status)
+        with self.assertNumQueries(12):
+            self.user1Client.get(url)
+
+
+class ServiceCursorListTest(TestCase):
+    def setUp(self):
+        self.user1 = UserFactory()
+        self.user1Client = APIClient()
+        self.user1Client.force_authenticate(user=self.user1)
+
+        self.services = [
+            ServiceFactory(
+                owner=self.user1.profile.org,
+                start_date=date.today() - timedelta(days=days),
+            )
+            for days in (5, 2, 2, 9, 0, 2)
+        ]
+        self.ordered = sorted(self.services, key=lambda s: (s.start_date, s.id))
+        ServiceFactory()
+
+    def get_page(self, url):
+        response = self.user1Client.get(url, format="json")
+        self.assertEqual(response.status_code, 200)
+        stream = io.BytesIO(response.content)
+        return JSONParser().parse(stream)
+
+    def test_follow_next_cursors_through_every_service(self):
+        url = "%s?pagination=cursor&limit=4" % reverse("service:service_list")
+        ids = []
+        while url:
+            data = self.get_page(url)
+            ids += [s["id"] for s in data["results"]]
+            url = data["next"]
+
+        self.assertEqual(ids, [s.id for s in self.ordered])
+
+    def test_follow_previous_cursors_back_to_first_page(self):
+        url = "%s?pagination=cursor&limit=2" % reverse("service:service_list")
+        pages = [self.get_page(url)]
+        while pages[-1]["next"]:
+            pages.append(self.get_page(pages[-1]["next"]))
+
+        back = self.get_page(pages[-1]["previous"])
+        self.assertEqual(back["results"], pages[-2]["results"])
+        self.assertEqual(len(pages), 3)
+
+    def test_deep_cursor_page_does_not_count_or_offset(self):
+        first = self.get_page(
+            "%s?pagination=cursor&limit=2" % reverse("service:service_list")
+        )
+        second = self.get_page(first["next"])
+
+        self.assertNotIn("offset=", first["next"])
+        self.assertNotIn("count", second)
+
+    def test_cursor_pages_with_sparse_fieldset(self):
+        url = "%s?pagination=cursor&limit=4&fields=id&expand=" % reverse(
+            "service:service_list"
+        )
+        first = self.get_page(url)
+        with self.assertNumQueries(2):
+            second = self.get_page(first["next"])
+
+        self.assertEqual(
+            [s["id"] for s in first["results"] + second["results"]],
+            [s.id for s in self.ordered],
+        )
+
+    def test_limit_offset_remains_the_default(self):
+        data = self.get_page("%s?limit=2&offset=0" % reverse("service:service_list"))
+        self.assertIn("offset=2", data["next"])
+
+
+class ServiceBulkCreateTest(TestCase):
+    def setUp(self):
+        self.user1 = UserFactory()
+        self.user1Client = APIClient()
+        self.user1Client.force_authenticate(user=self.user1)
+        self.org = self.user1.profile.org
+
+        self.address = AddressFactory()
+        self.customer = CustomerFactory(owner=self.org)
+        self.customer.addresses.add(self.address)
+        self.status = Status.objects.create(name="open", description="open")
+        self.conclusive = Status.objects.create(
+            name="done", description="done", is_conclusive=True
+        )
+        self.other_customer = CustomerFactory()
+
+    def payload(self, count, **overrides):
+        item = {
+            "customer": self.customer.id,
+            "address": self.address.id,
+            "status": self.status.id,
+            "start_date": "2022-05-01",
+            "price": "120.50",
+        }
+        item.update(overrides)
+        return [dict(item) for i in range(count)]
+
+    def test_create_many_services_in_one_request(self):
+        url = reverse("service:service_list")
+        response = self.user1Client.post(url, self.payload(3), format="json")
+
+        self.assertEqual(response.status_code, 201)
+        data = response.json()
+        self.assertEqual(len(data), 3)
+        self.assertEqual(Service.objects.filter(owner=self.org).count(), 3)
+        self.assertEqual(Historic.objects.filter(org=self.org).count(), 3)
+        self.assertEqual(len({s["historic"]["id"] for s in data}), 3)
+        self.assertEqual(data[0]["customer"]["id"], self.customer.id)
+        self.assertEqual(data[0]["status"]["id"], self.status.id)
+        self.assertEqual(data[0]["price"], "120.50")
+        self.assertIsNone(data[0]["end_date"])
+
+    def test_conclusive_status_sets_end_date(self):
+        url = reverse("service:service_list")
+        response = self.user1Client.post(
+            url, self.payload(2, status=self.conclusive.id), format="json"
+        )
+
+        self.assertEqual(response.status_code, 201)
+        for service in response.json():
+            self.assertEqual(service["end_date"], str(date.today()))
+        self.assertEqual(ServiceMonthlyRollup.objects.drift(), [])
+        self.assertEqual(ServiceMonthlyRollup.objects.get(org=self.org).count, 2)
+
+    def test_bulk_create_queries_do_not_grow_per_row(self):
+        url = reverse("service:service_list")
+        with CaptureQueriesContext(connection) as small:
+            self.user1Client.post(url, self.payload(10), format="json")
+        with CaptureQueriesContext(connection) as large:
+            response = self.user1Client.post(url, self.payload(1000), format="json")
+
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(Service.objects.filter(owner=self.org).count(), 1010)
+        # SQLite splits large inserts into batches; the count still grows
+        # with the batch count, far below one query per service.
+        self.assertLess(len(large.captured_queries), len(small.captured_queries) + 40)
+
+    def test_rejects_other_org_references_without_writing(self):
+        url = reverse("service:service_list")
+        payload = self.payload(3)
+        payload[1]["customer"] = self.other_customer.id
+        response = self.user1Client.post(url, payload, format="json")
+
+        self.assertEqual(response.status_code, 400)
+        errors = response.json()
+        self.assertEqual(errors[0], {})
+        self.assertIn("customer", errors[1])
+        self.assertFalse(Service.objects.filter(owner=self.org).exists())
+        self.assertFalse(Historic.objects.filter(org=self.org).exists())
+
+    def test_rejects_address_of_another_customer(self):
+        other_address = AddressFactory()
+        CustomerFactory(owner=self.org).addresses.add(other_address)
+        url = reverse("service:service_list")
+        payload = self.payload(2)
+        payload[1]["address"] = other_address.id
+        response = self.user1Client.post(url, payload, format="json")
+
+        self.assertEqual(response.status_code, 400)
+        errors = response.json()
+        self.assertEqual(errors[0], {})
+        self.assertIn("address", errors[1])
+        self.assertFalse(Service.objects.exists())
+
+    def test_rejects_unknown_status_and_invalid_fields(self):
+        url = reverse("service:service_list")
+        payload = self.payload(2)
+        payload[0]["status"] = 9999
+        payload[1]["price"] = "not a price"
+        response = self.user1Client.post(url, payload, format="json")
+
+        self.assertEqual(response.status_code, 400)
+        self.assertFalse(Service.objects.exists())
+
+    def test_rejects_oversized_batch(self):
+        url = reverse("service:service_list")
+        response = self.user1Client.post(url, self.payload(1001), format="json")
+
+        self.assertEqual(response.status_code, 400)
+        self.assertFalse(Service.objects.exists())
+
+    def test_customer_bulk_create_uses_url_customer(self):
+        url = reverse(
+            "service:customer_service_list", kwargs={"customer_pk": self.customer.id}
+        )
+        response = self.user1Client.post(
+            url, self.payload(2, customer=None), format="json"
+        )
+
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(
+            [s["customer"]["id"] for s in response.json()],
+            [self.customer.id, self.customer.id],
+        )
+
+    def test_customer_bulk_create_rejects_other_org_customer(self):
+        url = reverse(
+            "service:customer_service_list",
+            kwargs={"customer_pk": self.other_customer.id},
+        )
+        response = self.user1Client.post(url, self.payload(2), format="json")
+
+        self.assertEqual(response.status_code, 403)
+        self.assertFalse(Service.objects.exists())
+
+    def test_single_object_post_still_supported(self):
+        url = reverse("service:service_list")
+        response = self.user1Client.post(url, {}, format="json")
+
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(Service.objects.filter(owner=self.org).count(), 1)
+
+
+class ServiceBulkStatusTest(TestCase):
+    def setUp(self):
+        self.user1 = UserFactory()
+        self.user1Client = APIClient()
+        self.user1Client.force_authenticate(user=self.user1)
+        self.notAuthenticatedClient = APIClient()
+        self.org = self.user1.profile.org
+
+        self.open = Status.objects.create(name="open", description="open")
+        self.done = Status.objects.create(
+            name="done", description="done", is_conclusive=True
+        )
+        self.services = [
+            ServiceFactory(owner=self.org, status=self.open) for i in range(5)
+        ]
+        self.other = ServiceFactory(status=self.open)
+        self.url = reverse("service:service_bulk_status")
+
+    def post(self, ids, status_id):
+        return self.user1Client.post(
+            self.url, {"services": ids, "status": status_id}, format="json"
+        )
+
+    def test_conclusive_status_sets_end_date(self):
+        ids = [s.id for s in self.services]
+        response = self.post(ids, self.done.id)
+
+        self.assertEqual(response.status_code, 200)
+        for service in Service.objects.filter(pk__in=ids):
+            self.assertEqual(service.status, self.done)
+            self.assertEqual(service.end_date, date.today())
+        self.assertEqual(ServiceMonthlyRollup.objects.drift(), [])
+
+    def test_non_conclusive_status_keeps_end_date(self):
+        service = self.services[0]
+        service.end_date = date(2022, 1, 1)
+        service.save()
+        response = self.post([service.id], self.open.id)
+
+        self.assertEqual(response.status_code, 200)
+        service.refresh_from_db()
+        self.assertEqual(service.status, self.open)
+        self.assertEqual(service.end_date, date(2022, 1, 1))
+
+    def test_reports_result_per_id(self):
+        ids = [self.services[0].id, self.other.id, 9999, self.services[1].id]
+        response = self.post(ids, self.done.id)
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(
+            response.json()["results"],
+            [
+                {"id": ids[0], "result": "updated"},
+                {"id": ids[1], "result": "forbidden"},
+                {"id": ids[2], "result": "not_found"},
+                {"id": ids[3], "result": "updated"},
+            ],
+        )
+        self.other.refresh_from_db()
+        self.assertEqual(self.other.status, self.open)
+        self.assertIsNone(self.other.end_date)
+
+    def test_query_count_does_not_depend_on_batch_size(self):
+        services = [ServiceFactory(owner=self.org) for i in range(20)]
+        self.post([self.services[0].id], self.done.id)
+        with CaptureQueriesContext(connection) as small:
+            self.post([self.services[1].id], self.done.id)
+        with CaptureQueriesContext(connection) as large:
+            self.post([s.id for s in services], self.done.id)
+
+        self.assertEqual(len(large.captured_queries), len(small.captured_queries))
+
+    def test_invalid_status_returns_400(self):
+        response = self.post([self.services[0].id], 9999)
+
+        self.assertEqual(response.status_code, 400)
+        self.assertIn("status", response.json())
+
+    def test_empty_service_list_returns_400(self):
+        response = self.post([], self.done.id)
+
+        self.assertEqual(response.status_code, 400)
+        self.assertIn("services", response.json())
+
+    def test_not_authenticated(self):
+        response = self.notAuthenticatedClient.post(
+            self.url,
+            {"services": [self.services[0].id], "status": self.done.id},
+            format="json",
+        )
+
+        self.assertEqual(response.status_code, 401)
+
+
+class ServiceETagTest(TestCase):
+    def setUp(self):
+        self.user1 = UserFactory()
+        self.user1Client = APIClient()
+        self.user1Client.force_authenticate(user=self.user1)
+        self.org = self.user1.profile.org
+
+        self.service = ServiceFactory(owner=self.org)
+        ServiceFactory(owner=self.org)
+        self.other = ServiceFactory()
+        self.detail_url = reverse(
+            "service:service_detail", kwargs={"service_pk": self.service.id}
+        )
+        self.list_url = "%s?limit=16" % reverse("service:service_list")
+
+    def test_detail_returns_strong_etag(self):
+        response = self.user1Client.get(self.detail_url)
+
+        self.assertEqual(response.status_code, 200)
+        self.assertRegex(response["ETag"], r'^"[0-9a-f]+"$')
+
+    def test_detail_not_modified_skips_the_view(self):
+        etag = self.user1Client.get(self.detail_url)["ETag"]
+        with self.assertNumQueries(1):
+            response = self.user1Client.get(self.detail_url, HTTP_IF_NONE_MATCH=etag)
+
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(response.content, b"")
+        self.assertEqual(response["ETag"], etag)
+
+    def test_detail_etag_changes_with_service_and_relations(self):
+        first = self.user1Client.get(self.detail_url)["ETag"]
+        self.service.customer.name = "renamed"
+        self.service.customer.save()
+        second = self.user1Client.get(self.detail_url)["ETag"]
+        self.service.address.street = "new street"
+        self.service.address.save()
+        third = self.user1Client.get(self.detail_url)["ETag"]
+
+        self.assertEqual(len({first, second, third}), 3)
+        response = self.user1Client.get(self.detail_url, HTTP_IF_NONE_MATCH=first)
+        self.assertEqual(response.status_code, 200)
+
+    def test_detail_etag_changes_with_catalog_and_organization(self):
+        first = self.user1Client.get(self.detail_url)["ETag"]
+        appliance = self.service.historic.appliance
+        appliance.model = "renamed"
+        appliance.save()
+        second = self.user1Client.get(self.detail_url)["ETag"]
+        self.org.name = "renamed"
+        self.org.save()
+        third = self.user1Client.get(self.detail_url)["ETag"]
+
+        self.assertEqual(len({first, second, third}), 3)
+
+    def test_detail_etag_depends_on_fieldset(self):
+        full = self.user1Client.get(self.detail_url)["ETag"]
+        sparse = self.user1Client.get(self.detail_url + "?fields=id")["ETag"]
+
+        self.assertNotEqual(full, sparse)
+
+    def test_other_org_detail_has_no_etag(self):
+        url = reverse("service:service_detail", kwargs={"service_pk": self.other.id})
+        response = self.user1Client.get(url, HTTP_IF_NONE_MATCH="*")
+
+        self.assertEqual(response.status_code, 403)
+        self.assertFalse(response.has_header("ETag"))
+
+    def test_list_returns_weak_etag_and_304(self):
+        etag = self.user1Client.get(self.list_url)["ETag"]
+        response = self.user1Client.get(self.list_url, HTTP_IF_NONE_MATCH=etag)
+
+        self.assertTrue(etag.startswith('W/"'))
+        self.assertEqual(response.status_code, 304)
+
+    def test_list_etag_changes_on_bulk_status_and_creation(self):
+        first = self.user1Client.get(self.list_url)["ETag"]
+        status = Status.objects.create(name="done", description="done")
+        self.user1Client.post(
+            reverse("service:service_bulk_status"),
+            {"services": [self.service.id], "status": status.id},
+            format="json",
+        )
+        second = self.user1Client.get(self.list_url)["ETag"]
+        self.user1Client.post(reverse("service:service_list"), {}, format="json")
+        third = self.user1Client.get(self.list_url)["ETag"]
+
+        self.assertEqual(len({first, second, third}), 3)
+
+    def test_list_etag_ignores_other_orgs(self):
+        first = self.user1Client.get(self.list_url)["ETag"]
+        self.other.price = 1
+        self.other.save()
+
+        self.assertEqual(self.user1Client.get(self.list_url)["ETag"], first)
+
+    def test_customer_service_list_etag(self):
+        url = reverse(
+            "service:customer_service_list",
+            kwargs={"customer_pk": self.service.customer.id},
+        )
+        url += "?limit=16"
+        etag = self.user1Client.get(url)["ETag"]
+        self.assertEqual(
+            self.user1Client.get(url, HTTP_IF_NONE_MATCH=etag).status_code, 304
+        )
+        self.service.price = 10
+        self.service.save()
+
+        self.assertEqual(
+            self.user1Client.get(url, HTTP_IF_NONE_MATCH=etag).status_code, 200
+        )
+
+
+class ServiceExportTest(TestCase):
+    def setUp(self):
+        self.user1 = UserFactory()
+        self.user1Client = APIClient()
+        self.user1Client.force_authenticate(user=self.user1)
+        self.notAuthenticatedClient = APIClient()
+        self.org = self.user1.profile.org
+
+        self.open = Status.objects.create(name="open", description="open")
+        self.done = Status.objects.create(
+            name="done", description="done", is_conclusive=True
+        )
+        self.services = [
+            ServiceFactory(
+                owner=self.org,
+                status=status,
+                start_date=date(2022, month, 10),
+            )
+            for month, status in ((1, self.open), (3, self.done), (6, self.open))
+        ]
+        ServiceFactory(start_date=date(2022, 3, 10))
+        self.url = reverse("service:service_export")
+
+    def export(self, query=""):
+        response = self.user1Client.get(self.url + query)
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response.streaming)
+        return b"".join(response.streaming_content).decode()
+
+    def test_export_csv_with_flattened_relations(self):
+        rows = list(csv.DictReader(io.StringIO(self.export())))
+
+        self.assertEqual(
+            [int(row["id"]) for row in rows], [s.id for s in self.services]
+        )
+        service = self.services[0]
+        appliance = service.historic.appliance
+        self.assertEqual(rows[0]["status"], "open")
+        self.assertEqual(rows[0]["customer_name"], service.customer.name)
+        self.assertEqual(rows[0]["address_street"], service.address.street)
+        self.assertEqual(rows[0]["appliance_model"], appliance.model)
+        self.assertEqual(rows[0]["appliance_brand"], appliance.brand.name)
+        self.assertEqual(rows[0]["start_date"], "2022-01-10")
+
+    def test_export_ndjson(self):
+        response = self.user1Client.get(self.url + "?format=ndjson")
+        lines = b"".join(response.streaming_content).decode().splitlines()
+
+        self.assertEqual(
+            response["Content-Type"], "application/x-ndjson; charset=utf-8"
+        )
+        self.assertIn("services.ndjson", response["Content-Disposition"])
+        self.assertEqual(
+            [json.loads(line)["id"] for line in lines], [s.id for s in self.services]
+        )
+
+    def test_export_negotiated_by_accept_header(self):
+        response = self.user1Client.get(self.url, HTTP_ACCEPT="application/x-ndjson")
+
+        self.assertEqual(
+            response["Content-Type"], "application/x-ndjson; charset=utf-8"
+        )
+
+    def test_filter_by_date_range_and_status(self):
+        query = "?start=2022-02-01&end=2022-12-31&status=%s" % self.open.id
+        rows = list(csv.DictReader(io.StringIO(self.export(query))))
+
+        self.assertEqual([int(row["id"]) for row in rows], [self.services[2].id])
+
+    def test_export_reads_rows_in_a_single_query(self):
+        for i in range(20):
+            ServiceFactory(owner=self.org)
+        response = self.user1Client.get(self.url)
+        with self.assertNumQueries(1):
+            content = b"".join(response.streaming_content)
+
+        self.assertEqual(len(content.decode().splitlines()), 24)
+
+    def test_invalid_filter_returns_400(self):
+        response = self.user1Client.get(self.url + "?start=yesterday")
+
+        self.assertEqual(response.status_code, 400)
+        self.assertIn(b"start", response.content)
+
+    def test_not_authenticated(self):
+        response = self.notAuthenticatedClient.get(self.url)
+
+        self.assertEqual(response.status_code, 401)
+
+
+class DashboardViewTest(TestCase):
+    def setUp(self):
+        self.user1 = UserFactory()
+        self.user1Client = APIClient()
+        self.user1Client.force_authenticate(user=self.user1)
+        self.org = self.user1.profile.org
+
+        self.open = Status.objects.create(name="open", description="open")
+        self.done = Status.objects.create(name="done", description="done")
+        instructions = ((100, 4, self.open), (300, 1, self.done), (40, 5, None))
+        for price, count, status in instructions:
+            customer = CustomerFactory(owner=self.org)
+            for i in range(count):
+                ServiceFactory(
+                    owner=self.org,
+                    customer=customer,
+                    status=status,
+                    price=Decimal(price),
+                    end_date=date(2022, 1 + i % 3, 10),
+                )
+        ServiceFactory()
+        self.url = reverse("service:dashboard")
+
+    def get(self, url):
+        response = self.user1Client.get(url)
+        self.assertEqual(response.status_code, 200)
+        return response.json()
+
+    def test_dashboard_matches_standalone_endpoints(self):
+        data = self.get(self.url + "?days=30&quantity=2")
+
+        self.assertEqual(
+            data["serviceHistory"], self.get(reverse("service:service_history"))
+        )
+        self.assertEqual(
+            data["servicesByStatus"],
+            self.get(reverse("service:services_status_count", kwargs={"days": 30})),
+        )
+        self.assertEqual(
+            data["topCustomersIncome"],
+            self.get(reverse("service:top_customers_income", kwargs={"quantity": 2})),
+        )
+        self.assertEqual(
+            data["topCustomersServices"],
+            self.get(reverse("service:top_customers_services", kwargs={"quantity": 2})),
+        )
+        self.assertEqual(
+            data["customerHistory"], self.get(reverse("profiles:customer_history"))
+        )
+
+    def test_top_customer_widgets_share_one_query(self):
+        with CaptureQueriesContext(connection) as context:
+            self.get(self.url + "?widgets=topCustomersIncome,topCustomersServices")
+
+        grouped = [q for q in context.captured_queries if "GROUP BY" in q["sql"]]
+        self.assertEqual(len(grouped), 1)
+
+    def test_all_widgets_query_count(self):
+        analytics_cache.bump(self.org.id)
+        with self.assertNumQueries(4):
+            self.get(self.url)
+
+    def test_cached_dashboard_runs_no_query(self):
+        data = self.get(self.url)
+        with self.assertNumQueries(0):
+            self.assertEqual(self.get(self.url), data)
+
+    def test_service_change_invalidates_dashboard(self):
+        self.get(self.url)
+        ServiceFactory(owner=self.org, price=Decimal(1000), end_date=date(2022, 5, 1))
+
+        data = self.get(self.url)
+
+        self.assertEqual(data["serviceHistory"]["incomeHistoryData"][-1], 1000)
+        self.assertEqual(data["topCustomersIncome"][0]["income"], 1000)
+
+    def test_service_delete_invalidates_dashboard(self):
+        self.get(self.url)
+        Service.objects.filter(owner=self.org, status=self.done).delete()
+
+        data = self.get(self.url)
+
+        self.assertNotIn(300, [c["income"] for c in data["topCustomersIncome"]])
+        self.assertNotIn("done", data["servicesByStatus"]["labels"])
+
+    def test_customer_change_invalidates_dashboard(self):
+        self.get(self.url)
+        Customer.objects.filter(owner=self.org).update(name="renamed")
+        customer = Customer.objects.filter(owner=self.org).first()
+        customer.save()
+
+        data = self.get(self.url)
+
+        self.assertEqual(
+            {c["customer__name"] for c in data["topCustomersIncome"]}, {"renamed"}
+        )
+
+    def test_bulk_status_invalidates_dashboard(self):
+        self.get(self.url)
+        services = Service.objects.filter(owner=self.org, status=self.open)
+        self.user1Client.post(
+            reverse("service:service_bulk_status"),
+            {
+                "services": list(services.values_list("id", flat=True)),
+                "status": self.done.id,
+            },
+            format="json",
+        )
+
+        data = self.get(self.url)
+
+        self.assertEqual(data["servicesByStatus"]["labels"][0], "done")
+        self.assertEqual(data["servicesByStatus"]["data"][0], 5)
+
+    def test_bulk_create_invalidates_dashboard(self):
+        self.get(self.url)
+        self.user1Client.post(
+            reverse("service:service_list"), [{"price": "5"}] * 3, format="json"
+        )
+
+        data = self.get(self.url)
+
+        self.assertEqual(data["servicesByStatus"]["data"][-1], 8)
+
+    def test_status_rename_invalidates_dashboard(self):
+        self.get(self.url)
+        self.open.name = "waiting"
+        self.open.save()
+
+        data = self.get(self.url)
+
+        self.assertEqual(data["servicesByStatus"]["labels"][0], "waiting")
+
+    def test_cache_is_per_organization(self):
+        self.get(self.url)
+        client = APIClient()
+        client.force_authenticate(user=UserFactory())
+
+        data = client.get(self.url).json()
+
+        self.assertEqual(data["topCustomersIncome"], [])
+
+    def test_select_widgets(self):
+        data = self.get(self.url + "?widgets=servicesByStatus,customerHistory")
+
+        self.assertEqual(set(data), {"servicesByStatus", "customerHistory"})
+
+    def test_unknown_widget_returns_400(self):
+        response = self.user1Client.get(self.url + "?widgets=serviceHistory,weather")
+
+        self.assertEqual(response.status_code, 400)
+        self.assertIn("weather", str(response.json()["widgets"]))
+
+    def test_empty_organization(self):
+        client = APIClient()
+        client.force_authenticate(user=UserFactory())
+        response = client.get(self.url)
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()["topCustomersIncome"], [])
+        self.assertEqual(response.json()["serviceHistory"]["incomeHistoryData"], [])
+
+    def test_not_authenticated(self):
+        response = APIClient().get(self.url)
+
+        self.assertEqual(response.status_code, 401)
+
+
+class AsyncDashboardViewTest(TestCase):
+    def setUp(self):
+        self.user1 = UserFactory()
+        self.token = Token.objects.create(user=self.user1)
+        self.user1Client = Client(HTTP_AUTHORIZATION="Token %s" % self.token.key)
+        self.syncClient = APIClient()
+        self.syncClient.force_authenticate(user=self.user1)
+        status = Status.objects.create(name="open", description="open")
+        for price, count in ((100, 3), (300, 1), (40, 2)):
+            customer = CustomerFactory(owner=self.user1.profile.org)
+            for i in range(count):
+                ServiceFactory(
+                    owner=self.user1.profile.org,
+                    customer=customer,
+                    status=status,
+                    price=Decimal(price),
+                    end_date=date(2022, 1 + i, 10),
+                )
+        self.url = reverse("service:dashboard_async")
+
+    def test_matches_sync_dashboard(self):
+        query = "?days=90&quantity=2"
+        response = self.user1Client.get(self.url + query)
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response["Content-Type"], "application/json")
+        sync = self.syncClient.get(reverse("service:dashboard") + query)
+        self.assertEqual(response.json(), sync.json())
+
+    def test_cached_dashboard_only_authenticates(self):
+        self.user1Client.get(self.url)
+        # The token and the profile.
+        with self.assertNumQueries(2):
+            response = self.user1Client.get(self.url)
+
+        self.assertEqual(response.status_code, 200)
+
+    def test_unknown_widget_returns_400(self):
+        response = self.user1Client.get(self.url + "?widgets=weather")
+
+        self.assertEqual(response.status_code, 400)
+        self.assertIn("weather", str(response.json()["widgets"]))
+
+    def test_invalid_token(self):
+        response = Client().get(self.url, HTTP_AUTHORIZATION="Token nope")
+
+        self.assertEqual(response.status_code, 401)
+        self.assertEqual(response["WWW-Authenticate"], "Token")
+
+    def test_not_authenticated(self):
+        response = Client().get(self.url)
+
+        self.assertEqual(response.status_code, 401)
+
+    async def test_served_by_the_asgi_handler(self):
+        response = await AsyncClient().get(
+            self.url, AUTHORIZATION="Token %s" % self.token.key
+        )
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(response.json()["topCustomersIncome"]), 3)
+
+    def test_not_allowed_method(self):
+        response = self.user1Client.post(self.url)
+
+        self.assertEqual(response.status_code, 405)
+        self.assertIn("GET", response["Allow"])
+
+
+class DashboardConcurrencyTest(TransactionTestCase):
+    def setUp(self):
+        self.user1 = UserFactory()
+        self.client = APIClient()
+        self.client.force_authenticate(user=self.user1)
+        status = Status.objects.create(name="open", description="open")
+        for i in range(4):
+            ServiceFactory(
+                owner=self.user1.profile.org,
+                status=status,
+                price=Decimal(10 * i),
+                end_date=date(2022, 1 + i, 1),
+            )
+
+    def dashboard(self):
+        analytics_cache.bump(self.user1.profile.org_id)
+        response = self.client.get(reverse("service:dashboard"))
+        self.assertEqual(response.status_code, 200)
+        return response.json()
+
+    def test_concurrent_queries_match_sequential_ones(self):
+        with override_settings(ANALYTICS_QUERY_WORKERS=1):
+            sequential = self.dashboard()
+
+        self.assertEqual(self.dashboard(), sequential)
+        self.assertEqual(sequential["servicesByStatus"]["data"], [4])
+
+
 class ServiceHistoryTest(TestCase):
     def setUp(self):
         self.user1 = UserFactory()
@@ -387,6 +1449,27 @@ class ServiceHistoryTest(TestCase):
             [2, 1, 5, 4, 3, 2, 1],
         )
 
+    def test_history_reads_rollups_instead_of_services(self):
+        with CaptureQueriesContext(connection) as context:
+            response = self.user1Client.get(reverse("service:service_history"))
+
+        self.assertEqual(response.status_code, 200)
+        sql = " ".join(query["sql"] for query in context.captured_queries)
+        self.assertIn("service_servicemonthlyrollup", sql)
+        self.assertNotIn('"service_service"', sql)
+
+    def test_history_follows_service_changes(self):
+        service = Service.objects.filter(end_date__month=5).get()
+        service.end_date = date(2022, 4, 1)
+        service.price = Decimal("50")
+        service.save()
+
+        response = self.user1Client.get(reverse("service:service_history"))
+
+        data = response.json()
+        self.assertEqual(data["incomeHistoryData"], [200, 100, 500, 400, 300, 250])
+        self.assertEqual(data["serviceCountHistoryData"], [2, 1, 5, 4, 3, 3])
+
     def test_add_services_with_no_end_date(self):
         for i in range(5):
             service = ServiceFactory(owner=self.user1.profile.org, price=50)
@@ -410,6 +1493,67 @@ class ServiceHistoryTest(TestCase):
         )
         self.assertEqual(data["incomeHistoryData"], [200, 100, 500, 400, 300, 200, 100])
 
+    def history(self, query):
+        response = self.user1Client.get(reverse("service:service_history") + query)
+        self.assertEqual(response.status_code, 200)
+        return response.json()
+
+    def test_range_fills_empty_months(self):
+        data = self.history("?from=2021-12-01&to=2022-06-30")
+
+        self.assertEqual(
+            data["incomeHistoryLabels"],
+            ["12-2021", "1-2022", "2-2022", "3-2022", "4-2022", "5-2022", "6-2022"],
+        )
+        self.assertEqual(data["incomeHistoryData"], [0, 500, 400, 300, 200, 100, 0])
+        self.assertEqual(data["serviceCountHistoryData"], [0, 5, 4, 3, 2, 1, 0])
+
+    def test_quarter_buckets(self):
+        data = self.history("?bucket=quarter")
+
+        self.assertEqual(data["incomeHistoryLabels"], ["Q1-2021", "Q1-2022", "Q2-2022"])
+        self.assertEqual(data["serviceCountHistoryData"], [3, 12, 3])
+
+    def test_quarter_buckets_in_range(self):
+        data = self.history("?bucket=quarter&from=2021-02-01&to=2022-04-30")
+
+        self.assertEqual(
+            data["incomeHistoryLabels"],
+            ["Q1-2021", "Q2-2021", "Q3-2021", "Q4-2021", "Q1-2022", "Q2-2022"],
+        )
+        self.assertEqual(data["serviceCountHistoryData"], [1, 0, 0, 0, 12, 2])
+        self.assertEqual(data["incomeHistoryData"], [100, 0, 0, 0, 1200, 200])
+
+    def test_week_buckets(self):
+        data = self.history("?bucket=week&from=2022-01-10&to=2022-01-24")
+
+        self.assertEqual(
+            data["incomeHistoryLabels"], ["2022-01-10", "2022-01-17", "2022-01-24"]
+        )
+        self.assertEqual(data["serviceCountHistoryData"], [5, 0, 0])
+
+    def test_day_buckets_run_one_query(self):
+        analytics_cache.bump(self.user1.profile.org_id)
+        with self.assertNumQueries(1):
+            data = self.history("?bucket=day&from=2022-03-14&to=2022-03-16")
+
+        self.assertEqual(
+            data["incomeHistoryLabels"], ["2022-03-14", "2022-03-15", "2022-03-16"]
+        )
+        self.assertEqual(data["serviceCountHistoryData"], [0, 3, 0])
+
+    def test_invalid_range(self):
+        url = reverse("service:service_history")
+        for query in (
+            "?from=2022-02-01&to=2022-01-01",
+            "?bucket=year",
+            "?from=2000-01-01&to=2022-01-01&bucket=day",
+            "?from=yesterday",
+        ):
+            with self.subTest(query=query):
+                response = self.user1Client.get(url + query)
+                self.assertEqual(response.status_code, 400)
+
 
 class StatusViewTest(TestCase):
     def setUp(self):
@@ -544,6 +1688,29 @@ class StatusViewTest(TestCase):
         )
         self.assertEqual(data["data"], [5, 4, 3, 2, 2, 3, 1])
 
+    def test_service_count_by_status_in_range_with_buckets(self):
+        for start_date, status in (
+            (date(2020, 1, 5), self.status1),
+            (date(2020, 1, 25), self.status1),
+            (date(2020, 3, 10), self.status2),
+            (date(2020, 4, 1), self.status2),
+        ):
+            ServiceFactory(
+                owner=self.user1.profile.org, status=status, start_date=start_date
+            )
+
+        response = self.user1Client.get(
+            reverse("service:services_status_count", kwargs={"days": 30})
+            + "?from=2020-01-01&to=2020-03-31&bucket=month"
+        )
+
+        self.assertEqual(response.status_code, 200)
+        data = response.json()
+        self.assertEqual(data["labels"], [self.status1.name, self.status2.name])
+        self.assertEqual(data["data"], [2, 1])
+        self.assertEqual(data["buckets"], ["1-2020", "2-2020", "3-2020"])
+        self.assertEqual(data["series"], [[2, 0, 0], [0, 0, 1]])
+
 
 class TopCustomerTest(TestCase):
     def setUp(self):
@@ -771,3 +1938,205 @@ class SampleDataCreateViewTest(TestCase):
                 dates.append(customer.created_at)
         self.assertTrue(inDateRange)
         self.assertGreater(len(dates), 5)
+
+
+class ServiceStatisticsTest(TestCase):
+    def setUp(self):
+        self.user1 = UserFactory()
+        self.user1Client = APIClient()
+        self.user1Client.force_authenticate(user=self.user1)
+        self.org = self.user1.profile.org
+        self.open = Status.objects.create(name="open", description="open")
+
+        for days in range(1, 11):
+            ServiceFactory(
+                owner=self.org,
+                status=self.open if days % 2 else None,
+                start_date=date(2022, 1, 1),
+                end_date=date(2022, 1, 1) + timedelta(days=days),
+                price=Decimal(days * 10),
+            )
+        ServiceFactory(
+            owner=self.org, start_date=date(2022, 2, 1), price=Decimal("500")
+        )
+        ServiceFactory(
+            start_date=date(2022, 1, 1), end_date=date(2022, 6, 1), price=Decimal(1)
+        )
+        self.url = reverse("service:service_statistics")
+
+    def get(self, query=""):
+        response = self.user1Client.get(self.url + query)
+        self.assertEqual(response.status_code, 200)
+        return response.json()
+
+    def test_duration(self):
+        data = self.get("?bins=4")
+
+        self.assertEqual(data["metric"], "duration")
+        self.assertEqual(data["edges"], [1, 3.25, 5.5, 7.75, 10])
+        self.assertEqual(
+            data["groups"],
+            [
+                {
+                    "key": "all",
+                    "count": 10,
+                    "mean": 5.5,
+                    "p50": 5,
+                    "p90": 9,
+                    "p99": 10,
+                    "histogram": [3, 2, 2, 3],
+                }
+            ],
+        )
+
+    def test_price_includes_open_services(self):
+        data = self.get("?metric=price")
+
+        group = data["groups"][0]
+        self.assertEqual(group["count"], 11)
+        self.assertEqual(group["p50"], 60)
+        self.assertEqual(group["p99"], 500)
+        self.assertEqual(sum(group["histogram"]), 11)
+        self.assertEqual(data["edges"][-1], 500)
+
+    def test_group_by_status(self):
+        data = self.get("?group=status")
+
+        self.assertEqual([group["key"] for group in data["groups"]], ["open", "null"])
+        self.assertEqual([group["p50"] for group in data["groups"]], [5, 6])
+        self.assertEqual([group["mean"] for group in data["groups"]], [5, 6])
+
+    def test_group_by_month(self):
+        data = self.get("?group=month&metric=price")
+
+        self.assertEqual(
+            [group["key"] for group in data["groups"]], ["1-2022", "2-2022"]
+        )
+        self.assertEqual([group["count"] for group in data["groups"]], [10, 1])
+
+    def test_group_by_category(self):
+        data = self.get("?group=category")
+
+        self.assertEqual(sum(group["count"] for group in data["groups"]), 10)
+
+    def test_group_by_category_follows_catalog_changes(self):
+        service = Service.objects.filter(owner=self.org, end_date__isnull=False)[0]
+        self.get("?group=category")
+        category = service.historic.appliance.category
+        category.name = "renamed"
+        category.save()
+        self.assertIn(
+            "renamed", [group["key"] for group in self.get("?group=category")["groups"]]
+        )
+
+        appliance = service.historic.appliance
+        appliance.category = CategoryFactory(name="moved")
+        appliance.save()
+        self.assertIn(
+            "moved", [group["key"] for group in self.get("?group=category")["groups"]]
+        )
+
+        historic = service.historic
+        historic.appliance = ApplianceFactory(category=CategoryFactory(name="other"))
+        historic.save()
+        self.assertIn(
+            "other", [group["key"] for group in self.get("?group=category")["groups"]]
+        )
+
+    def test_range(self):
+        data = self.get("?metric=price&from=2022-02-01&to=2022-02-28")
+
+        self.assertEqual(data["groups"][0]["count"], 1)
+        self.assertEqual(data["groups"][0]["p50"], 500)
+
+    def test_empty_organization(self):
+        client = APIClient()
+        client.force_authenticate(user=UserFactory())
+        response = client.get(self.url)
+
+        self.assertEqual(response.json()["groups"], [])
+
+    def test_query_count(self):
+        analytics_cache.bump(self.org.id)
+        with self.assertNumQueries(3):
+            self.get("?group=status")
+
+    def test_invalid_query(self):
+        for query in ("?metric=weight", "?group=customer", "?bins=0"):
+            with self.subTest(query=query):
+                response = self.user1Client.get(self.url + query)
+                self.assertEqual(response.status_code, 400)
+
+    def test_not_authenticated(self):
+        response = APIClient().get(self.url)
+
+        self.assertEqual(response.status_code, 401)
+
+
+class CustomerCohortTest(TestCase):
+    def setUp(self):
+        self.user1 = UserFactory()
+        self.user1Client = APIClient()
+        self.user1Client.force_authenticate(user=self.user1)
+        org = self.user1.profile.org
+
+        first = CustomerFactory(owner=org, created_at=date(2022, 1, 5))
+        second = CustomerFactory(owner=org, created_at=date(2022, 1, 20))
+        third = CustomerFactory(owner=org, created_at=date(2022, 3, 1))
+        for customer, start_date in (
+            (first, date(2022, 1, 6)),
+            (first, date(2022, 2, 1)),
+            (first, date(2022, 2, 9)),
+            (second, date(2022, 3, 1)),
+            (third, date(2022, 4, 2)),
+            (third, date(2021, 12, 1)),
+        ):
+            ServiceFactory(owner=org, customer=customer, start_date=start_date)
+        ServiceFactory(start_date=date(2022, 1, 6))
+        self.url = reverse("service:customer_cohorts")
+
+    def get(self, query=""):
+        response = self.user1Client.get(self.url + query)
+        self.assertEqual(response.status_code, 200)
+        return response.json()
+
+    def test_cohort_matrix(self):
+        data = self.get("?months=3")
+
+        self.assertEqual(data["cohorts"], ["1-2022", "3-2022"])
+        self.assertEqual(data["sizes"], [2, 1])
+        self.assertEqual(data["offsets"], [0, 1, 2, 3])
+        self.assertEqual(data["active"], [[1, 1, 1, 0], [0, 1, 0, 0]])
+
+    def test_range_lists_empty_cohorts(self):
+        data = self.get("?from=2021-12-01&to=2022-02-28&months=1")
+
+        self.assertEqual(data["cohorts"], ["12-2021", "1-2022", "2-2022"])
+        self.assertEqual(data["sizes"], [0, 2, 0])
+        self.assertEqual(data["active"], [[0, 0], [1, 1], [0, 0]])
+
+    def test_future_months_are_null(self):
+        CustomerFactory(owner=self.user1.profile.org, created_at=date.today())
+        today = date.today()
+
+        data = self.get("?months=1")
+
+        self.assertEqual(data["cohorts"][-1], "%d-%d" % (today.month, today.year))
+        self.assertEqual(data["active"][-1], [0, None])
+
+    def test_cached_until_a_service_changes(self):
+        self.get("?months=3")
+        with self.assertNumQueries(0):
+            self.get("?months=3")
+
+        ServiceFactory(
+            owner=self.user1.profile.org,
+            customer=Customer.objects.get(created_at=date(2022, 3, 1)),
+            start_date=date(2022, 3, 15),
+        )
+        self.assertEqual(self.get("?months=3")["active"][1], [1, 1, 0, 0])
+
+    def test_invalid_months(self):
+        response = self.user1Client.get(self.url + "?months=-1")
+
+        self.assertEqual(response.status_code, 400)
@@ -8,11 +8,17 @@ urlpatterns = [
     path("", views.ServiceListView.as_view(), name="service_list"),
     path("<int:service_pk>/", views.ServiceDetailView.as_view(), name="service_detail"),
     path("customer/<int:customer_pk>", views.CustomerServiceListView.as_view(), name="customer_service_list"),
+    path("export/", views.ServiceExportView.as_view(), name="service_export"),
+    path("bulk-status/", views.ServiceBulkStatusView.as_view(), name="service_bulk_status"),
     path("service-history/", views.ServiceHistoryView.as_view(), name="service_history"),
     path("status/", views.StatusListView.as_view(), name="status_list"),
     path("services-by-status/<int:days>/", views.ServiceByStatusView.as_view(), name="services_status_count"),
     path("top-customers-income/<int:quantity>/", views.TopCustomersIncomeView.as_view(), name="top_customers_income"),
     path("top-customers-services/<int:quantity>/", views.TopCustomersServicesView.as_view(), name="top_customers_services"),
+    path("dashboard/", views.DashboardView.as_view(), name="dashboard"),
+    path("dashboard/async/", views.AsyncDashboardView.as_view(), name="dashboard_async"),
+    path("customer-cohorts/", views.CustomerCohortView.as_view(), name="customer_cohorts"),
+    path("statistics/", views.ServiceStatisticsView.as_view(), name="service_statistics"),
     path("sample-create/", views.SampleCreationView.as_view(), name="sample_creation"),
 
 ]
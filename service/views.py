@@ -1,56 +1,186 @@
 from datetime import date, timedelta
 from functools import partial
 from random import sample
+from asgiref.sync import sync_to_async
+from django.http import StreamingHttpResponse
 from django.shortcuts import get_object_or_404, render
+from django.utils import timezone
 from rest_framework.views import APIView
 
 from appliances.models import Historic
 from profiles.models import Address, Customer
 from profiles.permissions import IsCustomerOwner
-from profiles.serializers import AddressSerializer, CustomerSerializer
+from appliances.serializers import HistoricSerializer
+from profiles.serializers import (
+    AddressSerializer,
+    CustomerSerializer,
+    OrganizationSerializer,
+)
 from service.permissions import IsServiceOwner
+from service.serializers import (
+    CustomerCohortQuerySerializer,
+    DashboardQuerySerializer,
+    ServiceBulkStatusSerializer,
+    ServiceCreateSerializer,
+    ServiceExportFilterSerializer,
+    ServiceReadSerializer,
+    ServiceStatisticsQuerySerializer,
+    StatusNestedSerializer,
+)
+from service import analytics
 from service.services import SampleDataCreation
-from .models import Service, Status
+from .models import Service, ServiceMonthlyRollup, Status
 from rest_framework import serializers, status
 from rest_framework.response import Response
 from rest_framework.permissions import IsAuthenticated
-from django.db.models import Count, Sum
-from core.utils.utils import concatenateLists, getDisctionaryOfLists, renameListNulls
+from django.db import transaction
+from django.db.models import Count, Max
+from core.utils.async_views import AsyncAPIView
+from core.utils.cache import analytics_cache, catalog_cache
+from core.utils.concurrency import arun_concurrently, run_concurrently
+from core.utils.dates import DateRangeSerializer
+from core.utils.etags import conditional, fingerprint, make_etag
+from core.utils.export import CSVRenderer, NDJSONRenderer
+from core.utils.pagination import KeysetPagination
+from core.utils.sideload import NormalizedJSONRenderer, Sideloader, is_normalized
 from rest_framework.pagination import LimitOffsetPagination
+from rest_framework.settings import api_settings
 
 
 # Create your views here.
 
 
+def get_service_paginator(request):
+    if KeysetPagination.is_requested(request):
+        return KeysetPagination(ordering=("start_date", "id"))
+    return LimitOffsetPagination()
+
+
+def service_list_etag(request, **kwargs):
+    org_id = request.user.profile.org_id
+    services = Service.objects.filter(owner_id=org_id)
+    return make_etag(
+        request,
+        org_id,
+        catalog_cache.version(),
+        analytics_cache.version(org_id),
+        *fingerprint(
+            services, "updated_at", "customer__updated_at", "historic__updated_at"
+        ),
+        weak=True,
+    )
+
+
+def service_detail_etag(request, service_pk, **kwargs):
+    org_id = request.user.profile.org_id
+    versions = (
+        Service.objects.filter(pk=service_pk, owner_id=org_id)
+        .values_list("updated_at", "customer__updated_at", "historic__updated_at")
+        .first()
+    )
+    if versions is None:
+        return None
+    return make_etag(
+        request, catalog_cache.version(), analytics_cache.version(org_id), *versions
+    )
+
+
+def customer_service_list_etag(request, customer_pk, **kwargs):
+    org_id = request.user.profile.org_id
+    versions = (
+        Customer.objects.filter(pk=customer_pk, owner_id=org_id)
+        .annotate(
+            services=Count("service"),
+            services_updated_at=Max("service__updated_at"),
+            historics_updated_at=Max("service__historic__updated_at"),
+        )
+        .values_list(
+            "updated_at", "services", "services_updated_at", "historics_updated_at"
+        )
+        .first()
+    )
+    if versions is None:
+        return None
+    return make_etag(
+        request,
+        catalog_cache.version(),
+        analytics_cache.version(org_id),
+        *versions,
+        weak=True,
+    )
+
+
+def bulk_create_services(request, org, customer=None):
+    serializer = ServiceCreateSerializer(
+        data=request.data, many=True, context={"org": org, "customer": customer}
+    )
+    if not serializer.is_valid():
+        return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+    services = serializer.save()
+    created = ServiceReadSerializer.setup_eager_loading(
+        Service.objects.filter(pk__in=[service.pk for service in services])
+    ).order_by("id")
+    return Response(
+        ServiceReadSerializer(created, many=True).data,
+        status=status.HTTP_201_CREATED,
+    )
+
+
 class ServiceListView(APIView):
 
     permission_classes = [IsAuthenticated]
+    renderer_classes = api_settings.DEFAULT_RENDERER_CLASSES + [NormalizedJSONRenderer]
 
-    class ServiceListSerializer(serializers.ModelSerializer):
-        class Meta:
-            model = Service
-            fields = "__all__"
-            depth = 2
+    sideloads = {
+        "owner": ("organizations", OrganizationSerializer),
+        "historic": ("historics", HistoricSerializer),
+        "customer": ("customers", CustomerSerializer),
+        "address": ("addresses", AddressSerializer),
+        "status": ("statuses", StatusNestedSerializer),
+    }
 
+    @conditional(service_list_etag)
     def get(self, request):
-        services = Service.objects.filter(owner=request.user.profile.org)
-        paginator = LimitOffsetPagination()
+        fields, expand = ServiceReadSerializer.parse_fieldset(request.query_params)
+        normalized = is_normalized(request)
+        if normalized:
+            expand = {}
+        services = ServiceReadSerializer.setup_eager_loading(
+            Service.objects.filter(owner=request.user.profile.org),
+            fields,
+            expand,
+            required=["start_date"],
+        )
+        paginator = get_service_paginator(request)
         result_page = paginator.paginate_queryset(services, request)
-        serializer = self.ServiceListSerializer(result_page, many=True)
-        return Response(
-            {
-                "results": serializer.data,
-                "next": paginator.get_next_link(),
-                "previous": paginator.get_previous_link(),
-            }
+        serializer = ServiceReadSerializer(
+            result_page, many=True, fields=fields, expand=expand
         )
+        data = {
+            "results": serializer.data,
+            "next": paginator.get_next_link(),
+            "previous": paginator.get_previous_link(),
+        }
+        if normalized:
+            sideloader = Sideloader(
+                Service,
+                {
+                    name: sideload
+                    for name, sideload in self.sideloads.items()
+                    if fields is None or name in fields
+                },
+            )
+            data["included"] = sideloader.get_included(result_page or [])
+        return Response(data)
 
     def post(self, request):
         org = request.user.profile.org
+        if isinstance(request.data, list):
+            return bulk_create_services(request, org)
         service = Service.objects.create(
             owner=org, historic=Historic.objects.create(org=org)
         )
-        serializer = self.ServiceListSerializer(service)
+        serializer = ServiceReadSerializer(service)
         return Response(data=serializer.data, status=status.HTTP_201_CREATED)
 
 
@@ -58,12 +188,6 @@ class ServiceDetailView(APIView):
 
     permission_classes = [IsAuthenticated, IsServiceOwner]
 
-    class ServiceDetailSerializer(serializers.ModelSerializer):
-        class Meta:
-            model = Service
-            fields = "__all__"
-            depth = 2
-
     class ServiceDetailEditSerializer(serializers.ModelSerializer):
 
         address = AddressSerializer
@@ -72,10 +196,17 @@ class ServiceDetailView(APIView):
             model = Service
             fields = "__all__"
 
+    @conditional(service_detail_etag)
     def get(self, request, service_pk):
-        service = get_object_or_404(Service, pk=service_pk)
+        fields, expand = ServiceReadSerializer.parse_fieldset(request.query_params)
+        service = get_object_or_404(
+            ServiceReadSerializer.setup_eager_loading(
+                Service.objects.all(), fields, expand, required=["owner"]
+            ),
+            pk=service_pk,
+        )
         self.check_object_permissions(request, service)
-        serializer = self.ServiceDetailSerializer(service)
+        serializer = ServiceReadSerializer(service, fields=fields, expand=expand)
         return Response(data=serializer.data)
 
     def put(self, request, service_pk):
@@ -94,49 +225,193 @@ class ServiceDetailView(APIView):
         return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
 
 
+class ServiceBulkStatusView(APIView):
+    """Moves a list of services to a status in a single request.
+
+    Follows ServiceDetailView.put: a conclusive status also sets end_date to
+    today. Ownership is checked with one query, the change is applied with
+    one UPDATE and the monthly rollups move in the same transaction. Every
+    requested id gets its own result.
+    """
+
+    permission_classes = [IsAuthenticated]
+
+    def post(self, request):
+        serializer = ServiceBulkStatusSerializer(data=request.data)
+        if not serializer.is_valid():
+            return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+        ids = serializer.validated_data["services"]
+        newStatus = serializer.validated_data["status"]
+        org_id = request.user.profile.org_id
+
+        changes = {"status": newStatus, "updated_at": timezone.now()}
+        if newStatus.is_conclusive:
+            changes["end_date"] = date.today()
+
+        with transaction.atomic():
+            rows = list(
+                Service.objects.select_for_update()
+                .filter(pk__in=set(ids))
+                .values_list("id", "owner_id", "end_date", "price")
+            )
+            owned = [row for row in rows if row[1] == org_id]
+            if owned:
+                Service.objects.filter(pk__in=[row[0] for row in owned]).update(
+                    **changes
+                )
+                ServiceMonthlyRollup.objects.apply(
+                    ServiceMonthlyRollup.objects.deltas(
+                        removed=[row[1:] for row in owned],
+                        added=[
+                            (owner_id, changes.get("end_date", end_date), price)
+                            for pk, owner_id, end_date, price in owned
+                        ],
+                    )
+                )
+                analytics_cache.invalidate(org_id)
+        owners = {row[0]: row[1] for row in rows}
+
+        results = []
+        for pk in ids:
+            if pk not in owners:
+                result = "not_found"
+            elif owners[pk] != org_id:
+                result = "forbidden"
+            else:
+                result = "updated"
+            results.append({"id": pk, "result": result})
+        return Response({"status": newStatus.id, "results": results})
+
+
 class CustomerServiceListView(APIView):
 
     permission_classes = [IsAuthenticated, IsCustomerOwner]
 
-    class ServiceListSerializer(serializers.ModelSerializer):
+    # The single-object POST answers with one level of nesting, as it always
+    # has: the customer's owner and addresses and the historic's org are ids.
+    class ServiceCreatedSerializer(serializers.ModelSerializer):
         class Meta:
             model = Service
             fields = "__all__"
             depth = 1
 
+    @conditional(customer_service_list_etag)
+    def get(self, request, customer_pk):
+        customer = get_object_or_404(Customer, pk=customer_pk)
+        self.check_object_permissions(request, customer)
+        fields, expand = ServiceReadSerializer.parse_fieldset(request.query_params)
+        services = ServiceReadSerializer.setup_eager_loading(
+            Service.objects.filter(customer=customer),
+            fields,
+            expand,
+            required=["start_date"],
+        )
+        paginator = get_service_paginator(request)
+        result_page = paginator.paginate_queryset(services, request)
+        serializer = ServiceReadSerializer(
+            result_page, many=True, fields=fields, expand=expand
+        )
+        return Response(
+            {
+                "results": serializer.data,
+                "next": paginator.get_next_link(),
+                "previous": paginator.get_previous_link(),
+            }
+        )
+
     def post(self, request, customer_pk):
         customer = get_object_or_404(Customer, pk=customer_pk)
         self.check_object_permissions(request, customer)
         org = request.user.profile.org
+        if isinstance(request.data, list):
+            return bulk_create_services(request, org, customer)
         service = Service.objects.create(
             owner=org, historic=Historic.objects.create(org=org), customer=customer
         )
-        serializer = self.ServiceListSerializer(service)
+        serializer = self.ServiceCreatedSerializer(service)
         return Response(data=serializer.data, status=status.HTTP_201_CREATED)
 
 
-class ServiceHistoryView(APIView):
+class ServiceExportView(APIView):
+    """Streams every service of the organization as CSV or NDJSON.
+
+    Rows are read with a single joined query through .iterator(), so the
+    memory used does not depend on the number of services. Accepts the
+    start and end dates (inclusive, on start_date) and one or more status
+    ids as filters.
+    """
 
     permission_classes = [IsAuthenticated]
+    renderer_classes = [CSVRenderer, NDJSONRenderer]
+
+    columns = [
+        ("id", "id"),
+        ("start_date", "start_date"),
+        ("end_date", "end_date"),
+        ("price", "price"),
+        ("status", "status__name"),
+        ("customer_id", "customer_id"),
+        ("customer_name", "customer__name"),
+        ("customer_email", "customer__email"),
+        ("customer_phone", "customer__phone1"),
+        ("address_street", "address__street"),
+        ("address_number", "address__number"),
+        ("address_neighborhood", "address__neighborhood"),
+        ("address_city", "address__city"),
+        ("address_state", "address__state"),
+        ("appliance_model", "historic__appliance__model"),
+        ("appliance_brand", "historic__appliance__brand__name"),
+        ("appliance_category", "historic__appliance__category__name"),
+    ]
+    chunk_size = 2000
 
     def get(self, request, format=None):
-
-        serviceHistory = (
-            Service.objects.filter(owner=request.user.profile.org)
-            .filter(end_date__isnull=False)
-            .values("end_date__month", "end_date__year")
-            .annotate(Sum("price"), Count("end_date__month"))
-            .order_by("end_date__year", "end_date__month")
+        filters = ServiceExportFilterSerializer(data=request.query_params)
+        filters.is_valid(raise_exception=True)
+        services = Service.objects.filter(owner=request.user.profile.org)
+        if "start" in filters.validated_data:
+            services = services.filter(start_date__gte=filters.validated_data["start"])
+        if "end" in filters.validated_data:
+            services = services.filter(start_date__lte=filters.validated_data["end"])
+        if filters.validated_data.get("status"):
+            services = services.filter(status__in=filters.validated_data["status"])
+
+        rows = (
+            services.order_by("id")
+            .values_list(*[lookup for name, lookup in self.columns])
+            .iterator(chunk_size=self.chunk_size)
+        )
+        renderer = request.accepted_renderer
+        response = StreamingHttpResponse(
+            renderer.stream([name for name, lookup in self.columns], rows),
+            content_type="%s; charset=%s" % (renderer.media_type, renderer.charset),
+        )
+        response["Content-Disposition"] = 'attachment; filename="services.%s"' % (
+            renderer.format
         )
+        return response
+
+
+class ServiceHistoryView(APIView):
 
-        dict = getDisctionaryOfLists(serviceHistory)
-        labels = concatenateLists(dict["end_date__month"], dict["end_date__year"], "-")
+    permission_classes = [IsAuthenticated]
+
+    def get(self, request, format=None):
+        query = DateRangeSerializer(data=request.query_params)
+        query.is_valid(raise_exception=True)
+        org_id = request.user.profile.org_id
         return Response(
-            {
-                "incomeHistoryData": dict["price__sum"],
-                "incomeHistoryLabels": labels,
-                "serviceCountHistoryData": dict["end_date__month__count"],
-            }
+            analytics_cache.get_or_set(
+                org_id,
+                "serviceHistory:%s" % query.cache_key(),
+                partial(
+                    analytics.service_history,
+                    org_id,
+                    query.validated_data.get("from"),
+                    query.validated_data.get("to"),
+                    query.validated_data.get("bucket", "month"),
+                ),
+            )
         )
 
 
@@ -153,47 +428,166 @@ class StatusListView(APIView):
 
 
 class ServiceByStatusView(APIView):
-    def get(self, request, days, format=None):
-        servicesByStatus = (
-            Service.objects.filter(owner=request.user.profile.org)
-            .filter(start_date__gte=date.today() - timedelta(days=days))
-            .order_by("status__id")
-            .values("status__name")
-            .annotate(status__count=Count("*"))
-        )
-        dict = getDisctionaryOfLists(servicesByStatus)
+    """Services per status started in the last `days` days.
 
+    ?from=&to= replace the trailing window and ?bucket= adds the series of
+    every status over the buckets of the range.
+    """
+
+    def get(self, request, days, format=None):
+        query = DateRangeSerializer(data=request.query_params)
+        query.is_valid(raise_exception=True)
+        org_id = request.user.profile.org_id
         return Response(
-            {
-                "data": dict["status__count"],
-                "labels": renameListNulls(dict["status__name"], "null"),
-            }
+            analytics_cache.get_or_set(
+                org_id,
+                "servicesByStatus:%d:%s:%s" % (days, query.cache_key(), date.today()),
+                partial(
+                    analytics.services_by_status,
+                    org_id,
+                    days,
+                    query.validated_data.get("from"),
+                    query.validated_data.get("to"),
+                    query.validated_data.get("bucket"),
+                ),
+            )
         )
 
 
 class TopCustomersIncomeView(APIView):
     def get(self, request, quantity, format=None):
-
-        topCustomers = (
-            Service.objects.filter(owner=request.user.profile.org)
-            .values("customer__id", "customer__name")
-            .annotate(income=Sum("price"), services=Count("id"))
-        ).order_by("-income")[:quantity]
-
+        org_id = request.user.profile.org_id
+        topCustomers = analytics_cache.get_or_set(
+            org_id,
+            "topCustomersIncome:%d" % quantity,
+            lambda: list(
+                analytics.customer_totals(org_id).order_by("-income")[:quantity]
+            ),
+        )
         return Response(topCustomers)
 
 
 class TopCustomersServicesView(APIView):
     def get(self, request, quantity, format=None):
-        topCustomers = (
-            Service.objects.filter(owner=request.user.profile.org)
-            .values("customer__id", "customer__name")
-            .annotate(income=Sum("price"), services=Count("id"))
-        ).order_by("-services")[:quantity]
-
+        org_id = request.user.profile.org_id
+        topCustomers = analytics_cache.get_or_set(
+            org_id,
+            "topCustomersServices:%d" % quantity,
+            lambda: list(
+                analytics.customer_totals(org_id).order_by("-services")[:quantity]
+            ),
+        )
         return Response(topCustomers)
 
 
+class DashboardView(APIView):
+    """Every dashboard widget in one request.
+
+    The organization is resolved once and both top customer widgets are
+    picked from a single GROUP BY. ?widgets= selects a subset, ?days= and
+    ?quantity= replace the path parameters of the standalone endpoints.
+    The widget queries run concurrently on the analytics pool and the
+    whole response is kept in the organization's analytics cache.
+    """
+
+    permission_classes = [IsAuthenticated]
+
+    def get(self, request, format=None):
+        query = DashboardQuerySerializer(data=request.query_params)
+        query.is_valid(raise_exception=True)
+        org_id = request.user.profile.org_id
+        return Response(
+            analytics_cache.get_or_set(
+                org_id,
+                query.cache_key(),
+                partial(self.build, org_id, **query.validated_data),
+            )
+        )
+
+    def build(self, org_id, widgets, days, quantity):
+        queries = analytics.dashboard_queries(org_id, widgets, days)
+        results = run_concurrently(list(queries.values()))
+        return analytics.dashboard(dict(zip(queries, results)), widgets, quantity)
+
+
+class AsyncDashboardView(AsyncAPIView):
+    """DashboardView for ASGI servers. It only leaves the event loop for
+    the authentication and the widget queries, which are awaited together
+    on the analytics pool."""
+
+    permission_classes = [IsAuthenticated]
+
+    async def get(self, request, format=None):
+        query = DashboardQuerySerializer(data=request.query_params)
+        query.is_valid(raise_exception=True)
+        org_id = await sync_to_async(lambda: request.user.profile.org_id)()
+        widgets = query.validated_data["widgets"]
+        days = query.validated_data["days"]
+        quantity = query.validated_data["quantity"]
+
+        async def build():
+            queries = analytics.dashboard_queries(org_id, widgets, days)
+            results = await arun_concurrently(list(queries.values()))
+            return analytics.dashboard(dict(zip(queries, results)), widgets, quantity)
+
+        return Response(
+            await analytics_cache.aget_or_set(org_id, query.cache_key(), build)
+        )
+
+
+class ServiceStatisticsView(APIView):
+    """Count, mean, p50/p90/p99 and histogram of how long services stay
+    open (metric=duration, services with an end_date) or of their price,
+    per status, appliance category or start month."""
+
+    permission_classes = [IsAuthenticated]
+
+    def get(self, request, format=None):
+        query = ServiceStatisticsQuerySerializer(data=request.query_params)
+        query.is_valid(raise_exception=True)
+        org_id = request.user.profile.org_id
+        return Response(
+            analytics_cache.get_or_set(
+                org_id,
+                "statistics:%s" % query.cache_key(),
+                partial(
+                    analytics.service_statistics,
+                    org_id,
+                    query.validated_data["metric"],
+                    query.validated_data.get("group"),
+                    query.validated_data.get("from"),
+                    query.validated_data.get("to"),
+                    query.validated_data["bins"],
+                ),
+            )
+        )
+
+
+class CustomerCohortView(APIView):
+    """Customers of each creation month who had a service in each of the
+    following months."""
+
+    permission_classes = [IsAuthenticated]
+
+    def get(self, request, format=None):
+        query = CustomerCohortQuerySerializer(data=request.query_params)
+        query.is_valid(raise_exception=True)
+        org_id = request.user.profile.org_id
+        return Response(
+            analytics_cache.get_or_set(
+                org_id,
+                "cohorts:%s:%s" % (query.cache_key(), date.today()),
+                partial(
+                    analytics.customer_cohorts,
+                    org_id,
+                    query.validated_data.get("from"),
+                    query.validated_data.get("to"),
+                    query.validated_data["months"],
+                ),
+            )
+        )
+
+
 class SampleCreationView(APIView):
 
     permission_classes = [IsAuthenticated]